@@ -1,19 +1,55 @@
-import mimetypes
 import os
+from urllib.parse import unquote
 
 from database import Database
 from error import HTTPError
 from floot import Floot
 from floot_comment import FlootComment
-from response import Response
+from response import Response, JSONFragments
+from static import StaticFiles
 
 SERVER_SRC_DIR = os.path.dirname(os.path.realpath(__file__))
 CLIENT_SRC_DIR = os.path.abspath(os.path.join(SERVER_SRC_DIR, "..", "client"))
 
-db = Database()
+# How often (in seconds) the database folds its journal back into data.json.
+DB_COMPACT_INTERVAL = 60
+# Changes are written to disk in batches, at most this many seconds (or this
+# many changes) after they were made.
+DB_FLUSH_INTERVAL = 0.1
+DB_FLUSH_THRESHOLD = 100
+
+# The files in client/, kept in memory (see static.py)
+static_files = StaticFiles(CLIENT_SRC_DIR)
+
+def open_database():
+    """
+    Opens data.json the way the server uses it: journaled, written behind and
+    loaded lazily (see database.py). serve.py calls this when the server
+    starts and puts the result in db, so that just importing this file (e.g.
+    to run the tests) doesn't create data.json.log or start the database's
+    background threads.
+
+    You don't need to understand or modify this function.
+    """
+    return Database(journal=True, compact_interval=DB_COMPACT_INTERVAL,
+                    flush_interval=DB_FLUSH_INTERVAL, flush_threshold=DB_FLUSH_THRESHOLD,
+                    lazy=True, verify_checksum=True)
+
+# The database that the functions below use. It is opened when the server
+# starts (see open_database); the tests put a test database here instead.
+db = None
+
+# The largest number of floots GET /api/floots returns in one page.
+MAX_PAGE_SIZE = 100
+# The largest number of comments GET /api/floots?view=summary includes with
+# each floot.
+MAX_SUMMARY_COMMENTS = 10
+# How many hashtags GET /api/tags/trending returns unless asked for a
+# different number
+DEFAULT_TRENDING_TAGS = 10
 
 # GET /
-def serve_file(path):
+def serve_file(path, request_headers=None):
     """
     Returns a static file from the client/ directory. This is used to send
     files like index.html, flutterer.js, style.css, etc. to the client.
@@ -22,19 +58,28 @@ def serve_file(path):
     """
     if not path or path == "/":
         path = "/index.html"
-    target_file_path = os.path.abspath(os.path.join(CLIENT_SRC_DIR, path[1:]))
-    # Avoid serving files above client source directory for security
-    if not target_file_path.startswith(CLIENT_SRC_DIR + os.sep) \
-            or not os.path.isfile(target_file_path):
-        return HTTPError(404, "File not found")
+    return static_files.serve(path[1:], request_headers or {})
 
-    with open(target_file_path, "rb") as f:
-        # Return the file. Guess the content-type based on the file extension
-        # (e.g. a .html file is probably text/html).
-        return Response(f.read(), content_type=mimetypes.guess_type(target_file_path)[0])
+def floot_dictionaries(floots, viewer=None, liked_by=True):
+    """
+    Returns a list of the dictionaries (see Floot.to_dictionary) of floots.
+    The list also carries each floot's cached JSON, so that serve.py doesn't
+    have to encode the floots again to send them. viewer and liked_by are
+    passed on to Floot.to_feed_entry.
+    """
+    entries = [floot.to_feed_entry(viewer, liked_by) for floot in floots]
+    return JSONFragments([dictionary for dictionary, _ in entries],
+                         [text for _, text in entries])
+
+def summary_dictionaries(summaries):
+    """
+    Same as floot_dictionaries, for floot summaries (see Floot.to_summary).
+    """
+    return JSONFragments(summaries, [summary.to_json() for summary in summaries])
 
 # GET /api/floots
-def get_floots():
+def get_floots(limit=None, before=None, after=None, view=None, comments=None,
+               viewer=None, liked_by=None):
     """
     Returns a list of all floots from the database. Remember that these
     functions are used to send JSON to the client, so you should return a list
@@ -42,12 +87,121 @@ def get_floots():
     easily converted to JSON so that the client can understand them, but it's
     not straightforward to send an arbitrary object, like a Floot object, over
     the internet.) You may find the Floot to_dictionary() method helpful.
+
+    The feed can also be read one page at a time by passing any of the
+    following query parameters, e.g. GET /api/floots?limit=20&before=...
+
+    * limit: the maximum number of floots to return (at most MAX_PAGE_SIZE).
+    * before: only return floots older than this cursor.
+    * after: only return floots newer than this cursor.
+
+    When paging, the response is a dictionary of the following shape instead
+    of a plain list:
+    {
+        "floots": [ ...floot dictionaries, newest first... ],
+        "before": "cursor to pass as `before` to get the next (older) page",
+        "after": "cursor to pass as `after` to get newer floots",
+    }
+    The cursors are null if the page is empty.
+
+    With view=summary, each floot is sent as a summary (see Floot.to_summary)
+    instead: like and comment counts in place of the full liked_by and
+    comments lists, plus the first `comments` comments (0 unless given, at
+    most MAX_SUMMARY_COMMENTS).
+
+    With viewer=<username>, each floot also has a "liked" key saying whether
+    that user likes it, so the client doesn't need the liked_by list to tell;
+    liked_by=false leaves the list out.
     """
+    if view not in (None, "full", "summary"):
+        return HTTPError(400, "Bad request: view must be full or summary")
+    summary = view == "summary"
+    if liked_by not in (None, "true", "false"):
+        return HTTPError(400, "Bad request: liked_by must be true or false")
+    liked_by = liked_by != "false"
+    if comments is None:
+        comments = 0
+    try:
+        comments = min(int(comments), MAX_SUMMARY_COMMENTS)
+    except ValueError:
+        return HTTPError(400, "Bad request: comments must be an integer")
+
+    if limit is None and before is None and after is None:
+        if summary:
+            return summary_dictionaries(db.get_floot_summaries(comments=comments, viewer=viewer))
+        return floot_dictionaries(db.get_floots(), viewer, liked_by)
 
-    floots = []
-    for floot in db.get_floots():
-        floots.append(floot.to_dictionary())
-    return floots
+    if limit is None:
+        limit = MAX_PAGE_SIZE
+    try:
+        limit = min(int(limit), MAX_PAGE_SIZE)
+    except ValueError:
+        return HTTPError(400, "Bad request: limit must be an integer")
+    if limit <= 0:
+        return HTTPError(400, "Bad request: limit must be positive")
+
+    try:
+        if summary:
+            page = db.get_floot_summaries(limit, before, after, comments, viewer)
+        else:
+            page = db.get_floots(limit, before, after)
+    except ValueError:
+        return HTTPError(400, "Bad request: malformed cursor")
+
+    return {
+        "floots": summary_dictionaries(page) if summary
+                  else floot_dictionaries(page, viewer, liked_by),
+        "before": db.get_cursor(page[-1]) if page else None,
+        "after": db.get_cursor(page[0]) if page else None,
+    }
+
+# GET /api/search
+def search_floots(q=None, limit=None):
+    """
+    Returns the floots (as dictionaries) whose message or comments contain
+    every word in the query string q, best match first, e.g.
+    GET /api/search?q=hello+world. A word ending in * matches any word that
+    starts with it (e.g. q=flut*). At most `limit` floots are returned
+    (MAX_PAGE_SIZE unless given, and never more).
+    """
+    if q is None:
+        return HTTPError(400, "Bad request: missing q")
+    if limit is None:
+        limit = MAX_PAGE_SIZE
+    try:
+        limit = min(int(limit), MAX_PAGE_SIZE)
+    except ValueError:
+        return HTTPError(400, "Bad request: limit must be an integer")
+    if limit <= 0:
+        return HTTPError(400, "Bad request: limit must be positive")
+    return floot_dictionaries(db.search(q, limit))
+
+# GET /api/tags/trending
+def get_trending_tags(limit=None):
+    """
+    Returns the hashtags used by the most floots posted in the last hour, most
+    used first, as a list of {"tag": ..., "count": ...} dictionaries (tags are
+    lowercased and don't include the #). At most `limit` tags are returned
+    (DEFAULT_TRENDING_TAGS unless given, and never more than MAX_PAGE_SIZE).
+    """
+    if limit is None:
+        limit = DEFAULT_TRENDING_TAGS
+    try:
+        limit = min(int(limit), MAX_PAGE_SIZE)
+    except ValueError:
+        return HTTPError(400, "Bad request: limit must be an integer")
+    if limit <= 0:
+        return HTTPError(400, "Bad request: limit must be positive")
+    return [{"tag": tag, "count": count} for tag, count in db.get_trending_tags(limit)]
+
+# GET /api/tags/{tag}
+def get_tag_floots(tag):
+    """
+    Returns a list of the floots that use the given hashtag (as dictionaries),
+    newest first. The tag may include the # (URL-encoded as %23), and case
+    doesn't matter.
+    """
+    return floot_dictionaries(db.get_floots_by_tag(unquote(tag)))
 
 # GET /api/floots/{floot_id}
 def get_floot(floot_id):
@@ -160,6 +314,7 @@ def create_comment(floot_id, request_body):
     floot = db.get_floot_by_id(floot_id)
     comment = FlootComment(request_body["message"], request_body["username"])
     floot.create_comment(comment)
+    db.save_floot(floot)
     return comment.to_dictionary()
 
 # POST /api/floots/{floot_id}/comments/{comment_id}/delete
@@ -189,15 +344,15 @@ def delete_comment(floot_id, comment_id, request_body):
         return HTTPError(400, "Bad request")
     
     floot = db.get_floot_by_id(floot_id)
-    for comment in floot.get_comments():
-        if comment_id == comment.get_id():
-            if comment.get_author() != request_body["username"]:
-                return HTTPError(401, "Unauthorize")
-            
-            floot.delete_comment(comment, request_body["username"])
-            return "OK"
+    try:
+        floot.delete_comment_by_id(comment_id, request_body["username"])
+    except KeyError:
+        return HTTPError(404, "Not found")
+    except PermissionError:
+        return HTTPError(401, "Unauthorize")
 
-    return HTTPError(404, "Not found")
+    db.save_floot(floot)
+    return "OK"
 
 # POST /api/floots/{floot_id}/like
 def like_floot(floot_id, request_body):
@@ -224,6 +379,7 @@ def like_floot(floot_id, request_body):
     
     floot = db.get_floot_by_id(floot_id)    
     floot.set_liked(request_body["username"], True)
+    db.save_floot(floot)
     return "OK"
 
 # POST /api/floots/{floot_id}/unlike
@@ -251,15 +407,61 @@ def unlike_floot(floot_id, request_body):
     
     floot = db.get_floot_by_id(floot_id)    
     floot.set_liked(request_body["username"], False)
+    db.save_floot(floot)
     return "OK"
 
+# GET /api/users/{username}/floots
+def get_user_floots(username):
+    """
+    Returns a list of the floots posted by the given user (as dictionaries),
+    newest first. Usernames arrive URL-encoded (e.g. "Jerry%20Cain").
+    """
+    return floot_dictionaries(db.get_floots_by_user(unquote(username)))
+
+# GET /api/users/{username}/comments
+def get_user_comments(username):
+    """
+    Returns a list of the comments written by the given user (as
+    dictionaries). Each comment dictionary also has a "floot_id" key saying
+    which floot the comment is on.
+    """
+    comments = []
+    for floot, comment in db.get_comments_by_user(unquote(username)):
+        comment_dict = comment.to_dictionary()
+        comment_dict["floot_id"] = floot.get_id()
+        comments.append(comment_dict)
+    return comments
+
+# GET /api/users/{username}/likes
+def get_user_likes(username):
+    """
+    Returns a list of the floots the given user likes (as dictionaries),
+    newest first.
+    """
+    return floot_dictionaries(db.get_floots_liked_by(unquote(username)))
+
+# GET /api/users/{username}/mentions
+def get_user_mentions(username):
+    """
+    Returns a list of the floots that mention @username (as dictionaries),
+    newest first.
+    """
+    return floot_dictionaries(db.get_floots_mentioning(unquote(username)))
+
 # This specifies which functions should be called given a particular incoming
 # path. You don't need to understand or change this, unless you're doing an
 # extension that requires adding new API routes.
 GET_ROUTES = [
     ("/api/floots", get_floots),
+    ("/api/search", search_floots),
+    ("/api/tags/trending", get_trending_tags),
+    (("/api/tags/(.*)", "tag"), get_tag_floots),
     (("/api/floots/(.*?)/comments", "floot_id"), get_comments),
     (("/api/floots/(.*)", "floot_id"), get_floot),
+    (("/api/users/(.*?)/floots", "username"), get_user_floots),
+    (("/api/users/(.*?)/comments", "username"), get_user_comments),
+    (("/api/users/(.*?)/likes", "username"), get_user_likes),
+    (("/api/users/(.*?)/mentions", "username"), get_user_mentions),
     (("(/.*)", "path"), serve_file),
 ]
 
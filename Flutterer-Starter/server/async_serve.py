@@ -0,0 +1,273 @@
+#! /usr/bin/env python3
+
+"""
+This contains an asyncio version of the web server in serve.py. It serves the
+same routes (api.GET_ROUTES and api.POST_ROUTES) and answers them the same way
+(see serve.service_request), but instead of giving each request a thread, one
+event loop reads and writes every connection. Connections are kept open
+between requests (HTTP/1.1 keep-alive), and a client may send several
+requests without waiting for the responses (pipelining); they are answered in
+order. Route handlers still run on a small pool of threads, since they may
+take a while to read or write the database, so a slow handler doesn't hold up
+the event loop.
+
+A connection waiting for its next request costs little more than a socket, so
+one process can hold thousands of idle keep-alive connections.
+
+usage: async_serve.py [--port PORT] [--threads N]
+
+STUDENTS: You don't need to read anything in this file. Run serve.py instead.
+"""
+
+import argparse
+import asyncio
+import signal
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+
+import api
+from colorama import init
+from error import HTTPError
+from serve import SERVER_PORT, DEFAULT_WORKERS, LISTEN_BACKLOG, SHUTDOWN_TIMEOUT, \
+        INTERNAL_ERROR_BODY, service_request, check_post_content_type, parse_post_body, \
+        http_error_body, flutterer_print, print_gray, print_green, print_red
+
+# How long (in seconds) a connection may sit idle waiting for its next request
+KEEP_ALIVE_TIMEOUT = 60
+# The most bytes a request line and headers, and a request body, may take up
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+SERVER_NAME = "Flutterer"
+
+def _phrase(status):
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+class _Date:
+    """
+    The Date header for responses, formatted once per second.
+    """
+    def __init__(self):
+        self._second = None
+        self._value = None
+
+    def get(self):
+        second = int(time.time())
+        if second != self._second:
+            self._value = formatdate(second, usegmt=True)
+            self._second = second
+        return self._value
+
+class AsyncFluttererServer:
+    def __init__(self, threads=DEFAULT_WORKERS):
+        """
+        Creates a server whose route handlers run on `threads` threads. Call
+        start to start listening and close to stop.
+        """
+        self._executor = ThreadPoolExecutor(threads)
+        self._server = None
+        self._date = _Date()
+        # Every open connection's task, and the writers of the connections
+        # that are waiting for their next request (which close() closes)
+        self._connections = set()
+        self._idle = {}
+        self._closing = False
+
+    async def start(self, host, port):
+        """
+        Starts accepting connections on host and port (0 to pick any free
+        port). Returns the port.
+        """
+        self._server = await asyncio.start_server(self._handle_connection, host, port,
+                                                  limit=MAX_HEADER_SIZE,
+                                                  backlog=LISTEN_BACKLOG)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Stops accepting connections, closes the ones that are waiting for a
+        request, and waits (up to SHUTDOWN_TIMEOUT seconds) for the others to
+        finish the request they are on.
+        """
+        self._closing = True
+        self._server.close()
+        await self._server.wait_closed()
+        for writer in self._idle.values():
+            writer.close()
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=SHUTDOWN_TIMEOUT)
+        self._executor.shutdown()
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._closing:
+                self._idle[task] = writer
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader, writer),
+                                                     KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as e:
+                    # The request couldn't be read, so there's no telling
+                    # where the next one would start.
+                    print_red(f"  -> {e.status} {_phrase(e.status)}: {e.message}")
+                    self._write_response(writer, e.status, "text/plain", http_error_body(e), False)
+                    await writer.drain()
+                    break
+                finally:
+                    del self._idle[task]
+                if request is None:
+                    break
+
+                method, target, version, headers, body = request
+                connection = headers.get("connection", "").lower()
+                keep_alive = "close" not in connection if version == "HTTP/1.1" \
+                        else "keep-alive" in connection
+                status, content_type, data, extra_headers = await loop.run_in_executor(
+                        self._executor, self._respond, method, target, headers, body)
+                keep_alive = keep_alive and not self._closing
+                self._write_response(writer, status, content_type, data, keep_alive,
+                                     extra_headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader, writer):
+        """
+        Reads one request from a connection and returns (method, target,
+        version, headers, body), with header names lowercased. Returns None
+        if the client closed the connection before starting another request,
+        and raises an HTTPError if the request is malformed.
+        """
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HTTPError(400, "Incomplete request")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "Request headers are too large")
+
+        # Clients may send blank lines between requests.
+        lines = head.lstrip(b"\r\n").decode("latin-1").split("\r\n")
+        request_line = lines[0].split()
+        if len(request_line) != 3:
+            raise HTTPError(400, f"Bad request line {lines[0]!r}")
+        method, target, version = request_line
+        if version not in ("HTTP/1.0", "HTTP/1.1"):
+            raise HTTPError(505, f"Unsupported HTTP version ({version!r})")
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, colon, value = line.partition(":")
+            if not colon:
+                raise HTTPError(400, f"Bad header line {line!r}")
+            headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise HTTPError(501, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Bad Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(413, "Request body is too large")
+        if length and headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        body = await reader.readexactly(length) if length else b""
+        return method, target, version, headers, body
+
+    def _respond(self, method, target, headers, body):
+        """
+        Answers a request, the same way FluttererHandler does. Runs on one of
+        the executor's threads. Returns (status, content type, body, other
+        headers).
+        """
+        print_gray(f"{method} {target}")
+        try:
+            if method == "POST":
+                check_post_content_type(headers.get("content-type"))
+                response = service_request(method, target, {
+                    "request_body": parse_post_body(body),
+                }, headers)
+            else:
+                response = service_request(method, target, headers=headers)
+        except HTTPError as e:
+            print_red(f"  -> {e.status} {_phrase(e.status)}: {e.message}")
+            return e.status, "text/plain", http_error_body(e), None
+        except Exception:
+            print_red("  -> 500 Internal Server Error")
+            traceback.print_exc()
+            return 500, "text/plain", INTERNAL_ERROR_BODY, None
+        status = response.get_status()
+        (print_green if status < 400 else print_red)(f"  -> {status} {_phrase(status)}")
+        return status, response.get_content_type(), response.get_body_bytes(), \
+                response.get_headers()
+
+    def _write_response(self, writer, status, content_type, body, keep_alive, headers=None):
+        head = [f"HTTP/1.1 {status} {_phrase(status)}",
+                f"Server: {SERVER_NAME}",
+                f"Date: {self._date.get()}",
+                "Connection: " + ("keep-alive" if keep_alive else "close")]
+        # (A 304 has no body, and leaves out the length of the one it stands for.)
+        if status != 304:
+            head.append(f"Content-Length: {len(body)}")
+        if content_type is not None:
+            head.append(f"Content-Type: {content_type}")
+        for name, value in (headers or {}).items():
+            head.append(f"{name}: {value}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+async def serve(port, threads):
+    """
+    Runs an AsyncFluttererServer on port until the process is interrupted
+    (Ctrl-C) or terminated, and then shuts it down gracefully.
+    """
+    server = AsyncFluttererServer(threads)
+    await server.start("0.0.0.0", port)
+    flutterer_print(f"Listening for requests at http://localhost:{port}")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    await stop.wait()
+    flutterer_print("Shutting down")
+    await server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the Flutterer server on asyncio.")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--threads", type=int, default=DEFAULT_WORKERS,
+                        help="Threads that run route handlers")
+    args = parser.parse_args()
+
+    init()  # initialize terminal color support
+    api.db = api.open_database()
+    try:
+        asyncio.run(serve(args.port, args.threads))
+    finally:
+        api.db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,720 @@
+"""
+File: benchmark.py
+
+NOTE TO STUDENTS: You don't need to read anything in this file.
+
+Measures how parts of the Flutterer server scale with the size of the data
+set. Each benchmark builds synthetic data in memory (nothing is written to
+data.json; data files are written to a fresh temporary directory, see
+temp_path) and prints a small table.
+
+usage: benchmark.py [-h] [-n SIZE [-n SIZE, ...]] BENCHMARK
+
+Available benchmarks are listed in BENCHMARKS, defined at the bottom of this
+file.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import mimetypes
+import multiprocessing
+import re
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+import os
+from datetime import datetime, timedelta
+
+import bulk
+from database import Database
+from floot import Floot
+from floot_comment import FlootComment
+from http.server import HTTPServer
+from response import JSONFragments, encode_json
+from tags import extract_tags
+import timestamps
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+FEED_COUNT = 10
+COMMENTS_PER_FLOOT = 2
+LIKES_PER_FLOOT = 2
+FEED_PAGE_SIZE = 100
+SUMMARY_COMMENTS = 2
+TAGS = 1_000
+
+# Every file the benchmarks write goes in a new directory under this one (see
+# temp_path), which is removed when Python exits.
+_temp_root = tempfile.TemporaryDirectory(prefix="flutterer-benchmark-")
+
+
+def temp_path(name):
+    """
+    Returns a path for a file called name in a new, empty directory, so that
+    no data file, index or journal left behind by an earlier benchmark (or an
+    earlier run) can be loaded along with it.
+    """
+    return os.path.join(tempfile.mkdtemp(dir=_temp_root.name), name)
+
+
+def make_floots(n):
+    """
+    Returns n synthetic floots, one second apart, oldest first.
+    """
+    start = datetime(2020, 1, 1)
+    floots = []
+    for i in range(n):
+        floot = Floot(f"Synthetic floot number {i}", f"user{i % 1000}",
+                      timestamp=start + timedelta(seconds=i))
+        floots.append(floot)
+    return floots
+
+
+def make_database(floots):
+    """
+    Returns a Database containing the given floots, without touching the disk.
+    """
+    db = Database(temp_path("flutterer-benchmark.json"))
+    for floot in floots:
+        db._put(floot)
+    return db
+
+
+def time_per_call(fn, min_time=0.2):
+    """
+    Calls fn repeatedly for at least min_time seconds and returns the average
+    number of seconds per call.
+    """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / calls
+
+
+def print_row(*columns):
+    print("".join(f"{column:>20}" for column in columns))
+
+
+def bench_feed(sizes):
+    """
+    Latency of fetching the newest FEED_COUNT floots, using the database's
+    time-ordered index versus sorting every floot on each call.
+    """
+    print_row("floots", "indexed (us)", "full sort (us)")
+    for n in sizes:
+        db = make_database(make_floots(n))
+        indexed = time_per_call(lambda: db.get_floots(FEED_COUNT))
+        full_sort = time_per_call(lambda: sorted(db._data.values(),
+                                                 key=lambda f: f.get_timestamp_micros(),
+                                                 reverse=True)[:FEED_COUNT])
+        print_row(n, f"{indexed * 1e6:.1f}", f"{full_sort * 1e6:.1f}")
+
+
+def bench_startup(sizes):
+    """
+    Time to open a data file, eagerly versus lazily, and then serve the first
+    page of the feed.
+    """
+    print_row("floots", "eager (ms)", "lazy (ms)")
+    for n in sizes:
+        db = make_database(make_floots(n))
+        db._db_path = temp_path("flutterer-benchmark-startup.json")
+        db._index_path = db._db_path + ".idx"
+        db._users_path = db._db_path + ".users"
+        db._write_data_to_file()
+        try:
+            timings = []
+            for lazy in [False, True]:
+                start = time.perf_counter()
+                Database(db._db_path, lazy=lazy).get_floots(FEED_COUNT)
+                timings.append(time.perf_counter() - start)
+        finally:
+            os.unlink(db._db_path)
+            os.unlink(db._index_path)
+            os.unlink(db._users_path)
+        print_row(n, *(f"{timing * 1e3:.1f}" for timing in timings))
+
+
+def bench_snapshot(sizes):
+    """
+    Size of the data file and time to load it eagerly, in the JSON and binary
+    formats.
+    """
+    print_row("floots", "json (MB)", "binary (MB)", "json load (ms)", "binary load (ms)")
+    for n in sizes:
+        db = make_database(make_floots(n))
+        sizes_mb = []
+        timings = []
+        for extension in [".json", ".floots"]:
+            db._db_path = temp_path("flutterer-benchmark" + extension)
+            db._index_path = db._db_path + ".idx"
+            db._binary = extension == ".floots"
+            db._write_data_to_file()
+            try:
+                sizes_mb.append(os.path.getsize(db._db_path) / 1e6)
+                start = time.perf_counter()
+                Database(db._db_path)
+                timings.append(time.perf_counter() - start)
+            finally:
+                os.unlink(db._db_path)
+                os.unlink(db._index_path)
+        print_row(n, *(f"{size:.2f}" for size in sizes_mb), *(f"{t * 1e3:.1f}" for t in timings))
+
+
+def make_floots_json(n):
+    """
+    Returns n synthetic floots as JSON text, each with COMMENTS_PER_FLOOT
+    comments and LIKES_PER_FLOOT likes.
+    """
+    return json.dumps([
+            Floot(f"Synthetic floot number {i}", f"user{i % 1000}",
+                  [f"user{(i + j) % 1000}" for j in range(1, LIKES_PER_FLOOT + 1)],
+                  comments=[FlootComment(f"Synthetic comment number {j}", f"user{(i + j) % 1000}")
+                            for j in range(COMMENTS_PER_FLOOT)]).to_dictionary()
+            for i in range(n)])
+
+
+def traced_bytes(build):
+    """
+    Calls build() and returns the number of bytes it allocated that are still
+    in use by its result.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+class OldFloot:
+    """
+    Stands in for Floot as it used to be: attributes in a __dict__, string
+    ids, a datetime timestamp and a list of the users who liked it.
+    """
+    def __init__(self, dictionary):
+        self._message = dictionary[Floot.MESSAGE]
+        self._username = dictionary[Floot.FLOOT_USERNAME]
+        self._liked_by = dictionary[Floot.LIKED_BY]
+        self._timestamp = datetime.strptime(dictionary[Floot.TIMESTAMP], Floot.DATE_FORMAT)
+        self._id = dictionary[Floot.FLOOT_ID]
+        self._comments = [OldFlootComment(comment) for comment in dictionary[Floot.COMMENTS]]
+
+
+class OldFlootComment:
+    """
+    Stands in for FlootComment as it used to be (see OldFloot).
+    """
+    def __init__(self, dictionary):
+        self._message = dictionary[FlootComment.COMMENT_TEXT]
+        self._author = dictionary[FlootComment.COMMENT_AUTHOR]
+        self._id = dictionary[FlootComment.COMMENT_ID]
+
+
+def bench_memory(sizes):
+    """
+    Memory used per floot (each with COMMENTS_PER_FLOOT comments and
+    LIKES_PER_FLOOT likes) once loaded from JSON: by the dictionaries
+    json.loads returns, by objects the way Floot and FlootComment used to
+    store them (see OldFloot), by the Floot objects alone, and by a Database
+    holding them, indexes included.
+    """
+    print_row("floots", "dicts (B/floot)", "old (B/floot)", "floots (B/floot)",
+              "database (B/floot)")
+    for n in sizes:
+        text = make_floots_json(n)
+        dicts = traced_bytes(lambda: json.loads(text))
+        old_objects = traced_bytes(lambda: [OldFloot(d) for d in json.loads(text)])
+        objects = traced_bytes(lambda: [Floot.from_dictionary(d) for d in json.loads(text)])
+        database = traced_bytes(
+                lambda: make_database(Floot.from_dictionary(d) for d in json.loads(text)))
+        print_row(n, *(f"{size / n:.0f}" for size in [dicts, old_objects, objects, database]))
+
+
+def bench_likes(sizes):
+    """
+    Time for one like or unlike on a floot that already has `size` likes, and
+    for checking whether a user likes it, versus doing the same with a plain
+    list of users (the way Floot used to store them).
+    """
+    print_row("likes", "like+unlike (us)", "is_liked_by (us)", "list (us)")
+    for n in sizes:
+        users = [f"user{i}" for i in range(n)]
+        floot = Floot("Popular floot", "user0", users)
+        def toggle():
+            floot.set_liked("new user", True)
+            floot.set_liked("new user", False)
+        toggled = time_per_call(toggle)
+        checked = time_per_call(lambda: floot.is_liked_by("user0"))
+        def toggle_list():
+            if "new user" not in users:
+                users.append("new user")
+            if "new user" in users:
+                users.remove("new user")
+        listed = time_per_call(toggle_list)
+        print_row(n, f"{toggled * 1e6:.2f}", f"{checked * 1e6:.2f}", f"{listed * 1e6:.2f}")
+
+
+def bench_response(sizes):
+    """
+    Time to turn `size` floots into the JSON body of a response, encoding
+    every floot from scratch versus splicing in their cached JSON (after the
+    first request has cached it).
+    """
+    print_row("floots", "encode (ms)", "cached (ms)")
+    for n in sizes:
+        floots = [Floot.from_dictionary(d) for d in json.loads(make_floots_json(n))]
+        encoded = time_per_call(
+                lambda: json.dumps([floot.to_dictionary() for floot in floots], indent=4))
+        # Same as api.floot_dictionaries
+        spliced = lambda: encode_json(JSONFragments([f.to_dictionary(shared=True) for f in floots],
+                                                    [f.to_json() for f in floots]))
+        spliced()
+        cached = time_per_call(spliced)
+        print_row(n, f"{encoded * 1e3:.2f}", f"{cached * 1e3:.2f}")
+
+
+def bench_summary(sizes):
+    """
+    Size and encode time of a FEED_PAGE_SIZE-floot page of the feed where
+    every floot has `size` likes and `size` comments, sent in full (with each
+    floot's JSON already cached) versus as summaries with SUMMARY_COMMENTS
+    comments each.
+    """
+    print_row("likes+comments", "full (KB)", "summary (KB)", "full (ms)", "summary (ms)")
+    for n in sizes:
+        floots = [Floot(f"Synthetic floot number {i}", f"user{i % 1000}",
+                        [f"user{j}" for j in range(n)],
+                        comments=[FlootComment(f"Synthetic comment number {j}", f"user{j}")
+                                  for j in range(n)])
+                  for i in range(FEED_PAGE_SIZE)]
+        # Same as api.floot_dictionaries
+        full = lambda: encode_json(JSONFragments([f.to_dictionary(shared=True) for f in floots],
+                                                 [f.to_json() for f in floots]))
+        # Same as api.summary_dictionaries
+        def summary():
+            summaries = [f.to_summary(SUMMARY_COMMENTS) for f in floots]
+            return encode_json(JSONFragments(summaries, [s.to_json() for s in summaries]))
+        sizes_kb = [len(full()) / 1e3, len(summary()) / 1e3]
+        timings = [time_per_call(full), time_per_call(summary)]
+        print_row(n, *(f"{size:.1f}" for size in sizes_kb), *(f"{t * 1e3:.2f}" for t in timings))
+
+
+def bench_search(sizes):
+    """
+    Time to build the search index over `size` floots, and latency of a
+    search for a rare word, for a prefix of one word that every floot has,
+    and for a prefix of many words (a ninth of the floots' numbers start with
+    "1"), each for the top FEED_COUNT, versus scanning every message.
+    """
+    print_row("floots", "build (ms)", "rare (us)", "prefix (us)", "broad prefix (us)",
+              "scan (us)")
+    for n in sizes:
+        db = make_database(make_floots(n))
+        start = time.perf_counter()
+        with db._lock.reading():
+            db._search_index()
+        build = time.perf_counter() - start
+        rare = time_per_call(lambda: db.search(f"number {n // 2}", FEED_COUNT))
+        prefix = time_per_call(lambda: db.search("synth*", FEED_COUNT))
+        broad = time_per_call(lambda: db.search("1*", FEED_COUNT))
+        scan = time_per_call(lambda: [floot for floot in db._data.values()
+                                      if f"number {n // 2}" in floot.get_message().lower()])
+        print_row(n, f"{build * 1e3:.0f}", f"{rare * 1e6:.1f}", f"{prefix * 1e6:.1f}",
+                  f"{broad * 1e6:.1f}", f"{scan * 1e6:.1f}")
+
+
+def bench_tags(sizes):
+    """
+    Latency of the FEED_COUNT trending hashtags and of the floots with one
+    hashtag (out of TAGS) over `size` floots posted one second apart up to
+    now, versus finding the trending hashtags by rescanning the last hour's
+    messages.
+    """
+    print_row("floots", "trending (us)", "by tag (us)", "rescan (us)")
+    hour = 60 * 60 * timestamps.MICROSECONDS_PER_SECOND
+    for n in sizes:
+        end = timestamps.now()
+        floots = [Floot(f"Synthetic floot #tag{i % TAGS} for @user{i % 1000}", f"user{i % 1000}",
+                        timestamp=end - (n - i) * timestamps.MICROSECONDS_PER_SECOND)
+                  for i in range(n)]
+        db = make_database(floots)
+
+        def rescan():
+            counts = {}
+            since = timestamps.now() - hour
+            for floot in db.get_floots():
+                if floot.get_timestamp_micros() < since:
+                    break
+                for tag in extract_tags(floot.get_message())[0]:
+                    counts[tag] = counts.get(tag, 0) + 1
+            return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:FEED_COUNT]
+
+        trending = time_per_call(lambda: db.get_trending_tags(FEED_COUNT))
+        by_tag = time_per_call(lambda: db.get_floots_by_tag("tag7"))
+        print_row(n, f"{trending * 1e6:.1f}", f"{by_tag * 1e6:.1f}",
+                  f"{time_per_call(rescan) * 1e6:.1f}")
+
+
+# Load test settings: clients sending requests back to back, clients that
+# take SLOW_CLIENT_DELAY seconds to send each request (a header line at a
+# time, SLOW_CLIENT_HEADERS of them), and how long (in seconds) to keep it up
+LOAD_CLIENTS = 16
+SLOW_CLIENTS = 2
+SLOW_CLIENT_DELAY = 0.2
+SLOW_CLIENT_HEADERS = 10
+LOAD_DURATION = 3
+# Connections that are opened and then left idle during bench_idle
+IDLE_CONNECTIONS = 2_000
+# Numbers of clients polling the feed during bench_keepalive
+POLL_CLIENTS = [4, LOAD_CLIENTS]
+
+
+def run_load(port, duration, keep_alive=False, clients=LOAD_CLIENTS, slow_clients=SLOW_CLIENTS):
+    """
+    Sends GET /api/floots?limit=FEED_COUNT requests to the server on port
+    from `clients` threads for duration seconds, while `slow_clients`
+    others trickle in requests. With keep_alive, each client reuses its
+    connection for as long as the server keeps it open. Returns the latencies (in seconds) of the
+    answered requests, the number of 503s, the number of requests that
+    failed (e.g. the connection was reset) and the number of slow requests
+    that were answered.
+    """
+    path = f"/api/floots?limit={FEED_COUNT}"
+    deadline = time.perf_counter() + duration
+    latencies = []
+    busy = []
+    failed = []
+    slow_answered = []
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if not keep_alive:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                failed.append(1)
+                conn.close()
+                continue
+            if response.status == 503:
+                busy.append(1)
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    def slow_client():
+        while time.perf_counter() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=10) as conn:
+                    conn.sendall(f"GET {path} HTTP/1.0\r\n".encode("ascii"))
+                    for i in range(SLOW_CLIENT_HEADERS):
+                        time.sleep(SLOW_CLIENT_DELAY / SLOW_CLIENT_HEADERS)
+                        conn.sendall(f"X-Slow-Header-{i}: yes\r\n".encode("ascii"))
+                    conn.sendall(b"\r\n")
+                    while conn.recv(65536):
+                        pass
+                slow_answered.append(1)
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=client) for _ in range(clients)] \
+            + [threading.Thread(target=slow_client) for _ in range(slow_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(busy), len(failed), len(slow_answered)
+
+
+def serve_floots(kind, n, ports, stop):
+    """
+    Runs a server of the given kind ("single thread", "pool" or "asyncio")
+    over n floots on a free port, which it puts on the ports queue, until the
+    stop event is set. Meant to run in a process of its own (see
+    start_server), so that the server doesn't share the GIL with the clients.
+    """
+    import api
+    import async_serve
+    import serve
+    # Keep the request log out of the results
+    serve.flutterer_print = lambda *args, **kwargs: None
+    api.db = make_database(make_floots(n))
+
+    if kind == "asyncio":
+        async def run():
+            server = async_serve.AsyncFluttererServer()
+            ports.put(await server.start("127.0.0.1", 0))
+            await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+            await server.close()
+        asyncio.run(run())
+        return
+
+    if kind == "pool":
+        server = serve.PooledHTTPServer(("127.0.0.1", 0), serve.FluttererHandler)
+    else:
+        server = HTTPServer(("127.0.0.1", 0), serve.FluttererHandler)
+    ports.put(server.server_address[1])
+    threading.Thread(target=lambda: (stop.wait(), server.shutdown())).start()
+    server.serve_forever()
+    server.server_close()
+
+
+def start_server(kind, n):
+    """
+    Starts serve_floots in another process. Returns the port and a function
+    that stops the server.
+    """
+    ports = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve_floots, args=(kind, n, ports, stop))
+    process.start()
+    port = ports.get()
+
+    def stop_server():
+        stop.set()
+        process.join()
+    return port, stop_server
+
+
+def load_test(n, kinds, keep_alive=False, idle_connections=0):
+    """
+    Runs run_load against each kind of server (see serve_floots) over n
+    floots, with idle_connections other connections left open and idle
+    throughout, and prints a row of results for each.
+    """
+    for kind in kinds:
+        port, stop = start_server(kind, n)
+        idle = [socket.create_connection(("127.0.0.1", port)) for _ in range(idle_connections)]
+        latencies, busy, failed, slow_answered = run_load(port, LOAD_DURATION, keep_alive)
+        for conn in idle:
+            conn.close()
+        stop()
+        print_row(n, kind, *load_summary(latencies), busy, failed, slow_answered)
+
+
+def load_summary(latencies):
+    """
+    Returns requests per second (over LOAD_DURATION) and the median and 99th
+    percentile latency in milliseconds, formatted for print_row.
+    """
+    latencies = sorted(latencies)
+    if latencies:
+        p50 = f"{latencies[len(latencies) // 2] * 1e3:.1f}"
+        p99 = f"{latencies[int(len(latencies) * 0.99)] * 1e3:.1f}"
+    else:
+        p50 = p99 = "-"
+    return f"{len(latencies) / LOAD_DURATION:.0f}", p50, p99
+
+
+LOAD_TEST_COLUMNS = ("floots", "server", "requests/s", "p50 (ms)", "p99 (ms)", "503s", "errors",
+                     "slow answered")
+
+
+def bench_server(sizes):
+    """
+    Load test of the servers over `size` floots: requests per second and
+    median and 99th percentile latency of GET /api/floots with LOAD_CLIENTS
+    clients (plus SLOW_CLIENTS slow ones), each opening a new connection per
+    request, for the single-threaded HTTPServer, PooledHTTPServer and
+    async_serve.py.
+    """
+    print_row(*LOAD_TEST_COLUMNS)
+    for n in sizes:
+        load_test(n, ["single thread", "pool", "asyncio"])
+
+
+def bench_idle(sizes):
+    """
+    Same as bench_server, but the clients keep their connections open
+    between requests, and IDLE_CONNECTIONS more connections are opened and
+    left idle, for PooledHTTPServer versus async_serve.py.
+    """
+    print_row(*LOAD_TEST_COLUMNS)
+    for n in sizes:
+        load_test(n, ["pool", "asyncio"], keep_alive=True, idle_connections=IDLE_CONNECTIONS)
+
+
+def bench_keepalive(sizes):
+    """
+    Feed polling against PooledHTTPServer: requests per second and latency of
+    GET /api/floots from POLL_CLIENTS clients, opening a new connection per
+    request versus keeping it open.
+    """
+    print_row("floots", "clients", "keep-alive", "requests/s", "p50 (ms)", "p99 (ms)", "errors")
+    for n in sizes:
+        port, stop = start_server("pool", n)
+        for clients in POLL_CLIENTS:
+            for keep_alive in (False, True):
+                latencies, _, failed, _ = run_load(port, LOAD_DURATION, keep_alive,
+                                                   clients=clients, slow_clients=0)
+                print_row(n, clients, "yes" if keep_alive else "no", *load_summary(latencies),
+                          failed)
+        stop()
+
+
+# Request paths for bench_routes, one for each kind of route in api.py
+ROUTE_PATHS = {
+    "GET": ["/api/floots", "/api/search", "/api/floots/2cc9d5a8-5e2f-4b5f-8ab4-0c3b0d5f1e7a",
+            "/api/floots/2cc9d5a8-5e2f-4b5f-8ab4-0c3b0d5f1e7a/comments",
+            "/api/users/Jerry%20Cain/likes", "/api/tags/trending", "/api/tags/fun",
+            "/index.html", "/js/flutterer.js"],
+    "POST": ["/api/floots", "/api/floots/2cc9d5a8-5e2f-4b5f-8ab4-0c3b0d5f1e7a/like",
+             "/api/floots/2cc9d5a8-5e2f-4b5f-8ab4-0c3b0d5f1e7a/comments/"
+             "8f14e45f-ceea-467a-9b1e-1c2c3d4e5f60/delete"],
+}
+
+
+def find_route_linear(path, route_list):
+    """
+    How serve.py used to find routes: trying each route in turn, compiling
+    and matching its regular expression twice.
+    """
+    for criteria, handler in route_list:
+        if isinstance(criteria, str):
+            if path == criteria:
+                return (handler, {})
+        elif re.fullmatch("^" + criteria[0] + "$", path):
+            match = re.findall("^" + criteria[0] + "$", path)[0]
+            match_components = match if isinstance(match, tuple) else (match,)
+            return (handler, dict(zip(criteria[1:], match_components)))
+
+
+def bench_routes(sizes):
+    """
+    Time to find the route for each path in ROUTE_PATHS with serve.py's
+    compiled routers (see router.py), versus trying every route in api.py's
+    tables in turn. (sizes are ignored.)
+    """
+    import api
+    import serve
+    tables = {"GET": api.GET_ROUTES, "POST": api.POST_ROUTES}
+    print_row("method", "path", "router (us)", "linear (us)")
+    for method, paths in ROUTE_PATHS.items():
+        router, routes = serve.ROUTERS[method], tables[method]
+        for path in paths:
+            assert router.find(path) == find_route_linear(path, routes), path
+            compiled = time_per_call(lambda: router.find(path))
+            linear = time_per_call(lambda: find_route_linear(path, routes))
+            shown = path if len(path) <= 19 else path[:16] + "..."
+            print_row(method, shown, f"{compiled * 1e6:.2f}", f"{linear * 1e6:.2f}")
+
+
+# Files for bench_static: a small page, a script and a large image
+STATIC_PATHS = ["/index.html", "/js/flutterer.js", "/img/Doris.jpg"]
+
+
+def serve_file_uncached(path):
+    """
+    How api.serve_file used to work: reading the file on every request.
+    Returns the body and content type.
+    """
+    import api
+    target_file_path = os.path.abspath(os.path.join(api.CLIENT_SRC_DIR, path[1:]))
+    if not target_file_path.startswith(api.CLIENT_SRC_DIR + os.sep) \
+            or not os.path.isfile(target_file_path):
+        return None
+    with open(target_file_path, "rb") as f:
+        return f.read(), mimetypes.guess_type(target_file_path)[0]
+
+
+def bench_static(sizes):
+    """
+    Time to answer a request for each file in STATIC_PATHS with
+    api.serve_file (cached in memory, see static.py), when the browser
+    accepts gzip and when it already has the file (304), versus reading the
+    file every time. (sizes are ignored.)
+    """
+    import api
+    print_row("path", "uncached (us)", "cached (us)", "gzip (us)", "304 (us)", "bytes", "gzip bytes")
+    for path in STATIC_PATHS:
+        response = api.serve_file(path)
+        etag = response.get_headers()["ETag"]
+        compressed = api.serve_file(path, {"accept-encoding": "gzip"}).get_body_bytes()
+        assert api.serve_file(path, {"if-none-match": etag}).get_status() == 304
+        print_row(path,
+                  f"{time_per_call(lambda: serve_file_uncached(path)) * 1e6:.1f}",
+                  f"{time_per_call(lambda: api.serve_file(path, {})) * 1e6:.1f}",
+                  f"{time_per_call(lambda: api.serve_file(path, {'accept-encoding': 'gzip'})) * 1e6:.1f}",
+                  f"{time_per_call(lambda: api.serve_file(path, {'if-none-match': etag})) * 1e6:.1f}",
+                  len(response.get_body_bytes()), len(compressed))
+
+
+# Saving floots one at a time rewrites the data file each time, which is only
+# bearable for small sizes.
+SAVE_LOOP_LIMIT = 2_000
+
+
+def bench_import(sizes):
+    """
+    Time to import `size` floots from NDJSON (see bulk.py) into an empty JSON
+    or binary data file, versus calling save_floot once per floot.
+    """
+    print_row("floots", "json (s)", "binary (s)", "save_floot loop (s)")
+    for n in sizes:
+        lines = [json.dumps(floot.to_dictionary()) for floot in make_floots(n)]
+        timings = []
+        for extension in [".json", ".floots"]:
+            path = temp_path("flutterer-benchmark-import" + extension)
+            start = time.perf_counter()
+            bulk.import_floots(Database(path), lines)
+            timings.append(f"{time.perf_counter() - start:.2f}")
+            os.unlink(path)
+            os.unlink(path + ".idx")
+        if n <= SAVE_LOOP_LIMIT:
+            path = temp_path("flutterer-benchmark-import.json")
+            db = Database(path)
+            start = time.perf_counter()
+            for line in lines:
+                db.save_floot(Floot.from_dictionary(json.loads(line)))
+            timings.append(f"{time.perf_counter() - start:.2f}")
+            os.unlink(path)
+            os.unlink(path + ".idx")
+        else:
+            timings.append("-")
+        print_row(n, *timings)
+
+
+BENCHMARKS = {
+    "feed": bench_feed,
+    "startup": bench_startup,
+    "snapshot": bench_snapshot,
+    "memory": bench_memory,
+    "likes": bench_likes,
+    "response": bench_response,
+    "import": bench_import,
+    "summary": bench_summary,
+    "search": bench_search,
+    "tags": bench_tags,
+    "server": bench_server,
+    "idle": bench_idle,
+    "keepalive": bench_keepalive,
+    "routes": bench_routes,
+    "static": bench_static,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the Flutterer server.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), metavar="BENCHMARK",
+                        help="One of: " + ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument("-n", "--size", dest="sizes", type=int, action="append",
+                        help="Data set size(s) to measure (default: "
+                             + ", ".join(str(size) for size in DEFAULT_SIZES) + ")")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args.sizes or DEFAULT_SIZES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+This file implements a compact binary format for the database's data file,
+which Database uses instead of JSON when the data file's name ends in
+BINARY_EXTENSION (or when an existing data file turns out to be binary).
+Compared to data.json, timestamps are stored as 64-bit microseconds since the
+epoch instead of strings that need parsing, usernames are stored once in a
+string table and referred to by number, and UUIDs take 16 raw bytes.
+
+It can also be run as a script to convert a data file between the two formats:
+
+usage: binary_format.py SOURCE DESTINATION
+
+Layout (all integers are little-endian):
+
+    file     := MAGIC string-count:u32 string* floot-count:u32 record*
+    string   := length:u32 utf-8-bytes
+    record   := length:u32 FLOOT_HEADER message liked-by:u32[likes] comment*
+    comment  := COMMENT_HEADER message
+
+FLOOT_HEADER holds the floot's id, timestamp, username (as a string table
+index), message length in bytes, number of likes and number of comments, and
+COMMENT_HEADER holds the comment's id, author and message length. An id is a
+kind byte followed by 16 bytes: either the raw bytes of a UUID (ID_UUID), or,
+for ids that aren't UUIDs, a string table index padded with zeros (ID_TEXT).
+Each record starts with its own length, so a reader can skip over records
+without decoding them.
+
+STUDENTS: You don't need to read anything in this file.
+"""
+
+import os
+import struct
+import sys
+from floot import Floot
+from floot_comment import FlootComment
+
+BINARY_EXTENSION = ".floots"
+MAGIC = b"FLOOTS\x00\x01"
+
+ID_UUID = 0
+ID_TEXT = 1
+
+U32 = struct.Struct("<I")
+FLOOT_HEADER = struct.Struct("<B16sqIIII")
+COMMENT_HEADER = struct.Struct("<B16sII")
+
+def is_binary(data):
+    """
+    Returns True if data (the contents of a data file, as bytes) is in the
+    binary format.
+    """
+    return data.startswith(MAGIC)
+
+class StringTable:
+    """
+    The strings (usernames and non-UUID ids) that records refer to by index.
+    Strings are only ever added, so records encoded against a table stay
+    valid as the table grows.
+    """
+    def __init__(self, strings=()):
+        self.strings = list(strings)
+        self._indexes = {string: index for index, string in enumerate(self.strings)}
+
+    def index(self, string):
+        """
+        Returns the index of string, adding it to the table if needed.
+        """
+        index = self._indexes.get(string)
+        if index is None:
+            index = self._indexes[string] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def __getitem__(self, index):
+        return self.strings[index]
+
+def _encode_id(raw_id, strings):
+    # Takes an id in its in-memory form (see ids.py), where UUIDs are ints.
+    if isinstance(raw_id, int):
+        return ID_UUID, raw_id.to_bytes(16, "big")
+    return ID_TEXT, U32.pack(strings.index(raw_id)).ljust(16, b"\0")
+
+def _decode_id(kind, raw, strings):
+    if kind == ID_UUID:
+        return int.from_bytes(raw, "big")
+    return strings[U32.unpack_from(raw)[0]]
+
+def encode_record(floot, strings):
+    """
+    Returns the record (length prefix included) for a Floot, adding any new
+    strings to the StringTable strings.
+    """
+    message = floot.get_message().encode("utf-8")
+    liked_by = floot.get_liked_by()
+    comments = floot.get_comments()
+    parts = [FLOOT_HEADER.pack(*_encode_id(floot.get_id_raw(), strings),
+                               floot.get_timestamp_micros(),
+                               strings.index(floot.get_username()),
+                               len(message), len(liked_by), len(comments)),
+             message,
+             struct.pack(f"<{len(liked_by)}I", *(strings.index(user) for user in liked_by))]
+    for comment in comments:
+        comment_message = comment.get_message().encode("utf-8")
+        parts.append(COMMENT_HEADER.pack(*_encode_id(comment.get_id_raw(), strings),
+                                         strings.index(comment.get_author()),
+                                         len(comment_message)))
+        parts.append(comment_message)
+    body = b"".join(parts)
+    return U32.pack(len(body)) + body
+
+def decode_record(data, offset, strings):
+    """
+    Returns the Floot whose record starts at data[offset].
+    """
+    offset += U32.size
+    id_kind, raw_id, timestamp, username, message_length, likes, comments = \
+            FLOOT_HEADER.unpack_from(data, offset)
+    offset += FLOOT_HEADER.size
+    message = data[offset:offset + message_length].decode("utf-8")
+    offset += message_length
+    liked_by = [strings[index] for index in struct.unpack_from(f"<{likes}I", data, offset)]
+    offset += 4 * likes
+
+    floot_comments = []
+    for _ in range(comments):
+        comment_kind, raw_comment_id, author, comment_length = \
+                COMMENT_HEADER.unpack_from(data, offset)
+        offset += COMMENT_HEADER.size
+        floot_comments.append(FlootComment(data[offset:offset + comment_length].decode("utf-8"),
+                                           strings[author],
+                                           _decode_id(comment_kind, raw_comment_id, strings)))
+        offset += comment_length
+
+    return Floot(message, strings[username], liked_by, _decode_id(id_kind, raw_id, strings),
+                 timestamp, floot_comments)
+
+def read_header(data):
+    """
+    Returns the StringTable of a binary data file and the offset of its first
+    record.
+    """
+    if not is_binary(data):
+        raise ValueError("Not a binary floot data file")
+    offset = len(MAGIC)
+    (count,) = U32.unpack_from(data, offset)
+    offset += U32.size
+    strings = []
+    for _ in range(count):
+        (length,) = U32.unpack_from(data, offset)
+        offset += U32.size
+        strings.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+    return StringTable(strings), offset + U32.size
+
+def _record_offsets(data, offset):
+    """
+    Yields the (start, end) offsets of every record, starting with the one at
+    data[offset].
+    """
+    while offset < len(data):
+        (length,) = U32.unpack_from(data, offset)
+        end = offset + U32.size + length
+        yield offset, end
+        offset = end
+
+def load(data):
+    """
+    Returns a list of every Floot in a binary data file.
+    """
+    strings, offset = read_header(data)
+    return [decode_record(data, start, strings) for start, _ in _record_offsets(data, offset)]
+
+def scan(data, offset, strings):
+    """
+    Yields (floot id, start, end, timestamp, username, comments, liked by,
+    message) for every record, where comments is a list of (comment id,
+    author) pairs, without decoding any comment messages. Ids are in their
+    in-memory form (see ids.py).
+    """
+    for start, end in _record_offsets(data, offset):
+        id_kind, raw_id, timestamp, username, message_length, likes, comments = \
+                FLOOT_HEADER.unpack_from(data, start + U32.size)
+        position = start + U32.size + FLOOT_HEADER.size
+        message = data[position:position + message_length].decode("utf-8")
+        position += message_length
+        liked_by = [strings[index] for index in struct.unpack_from(f"<{likes}I", data, position)]
+        position += 4 * likes
+        floot_comments = []
+        for _ in range(comments):
+            comment_kind, raw_comment_id, author, comment_length = \
+                    COMMENT_HEADER.unpack_from(data, position)
+            floot_comments.append((_decode_id(comment_kind, raw_comment_id, strings),
+                                   strings[author]))
+            position += COMMENT_HEADER.size + comment_length
+        yield (_decode_id(id_kind, raw_id, strings), start, end, timestamp,
+               strings[username], floot_comments, liked_by, message)
+
+def write(records, strings):
+    """
+    Assembles a binary data file from encoded records (see encode_record) and
+    the StringTable they were encoded against. Returns the file's contents and
+    the offset at which the first record starts.
+    """
+    parts = [MAGIC, U32.pack(len(strings.strings))]
+    for string in strings.strings:
+        encoded = string.encode("utf-8")
+        parts.append(U32.pack(len(encoded)))
+        parts.append(encoded)
+    parts.append(U32.pack(len(records)))
+    header = b"".join(parts)
+    return header + b"".join(records), len(header)
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit("usage: binary_format.py SOURCE DESTINATION")
+    if os.path.exists(sys.argv[2]):
+        sys.exit(f"{sys.argv[2]} already exists")
+    # Database picks the format from each file's name (and contents).
+    from database import Database
+    source = Database(sys.argv[1])
+    destination = Database(sys.argv[2])
+    destination.save_floots(source.get_floots())
+
+if __name__ == "__main__":
+    main()
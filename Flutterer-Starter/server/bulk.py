@@ -0,0 +1,143 @@
+"""
+File: bulk.py
+
+NOTE TO STUDENTS: You don't need to read anything in this file.
+
+Copies floots into and out of a database in bulk, as NDJSON: one floot per
+line, as the JSON object that Floot.to_dictionary returns. This is meant for
+backups, migrations and seeding a test server with lots of data.
+
+usage: bulk.py export [--since TIME] [--until TIME] [--user USERNAME ...] DATABASE [FILE]
+       bulk.py import [--since TIME] [--until TIME] [--user USERNAME ...] DATABASE [FILE]
+
+DATABASE is anything Database() accepts (data.json, data.floots, a SQLite
+URL...), including the changes in its journal (e.g. data.json.log) if the
+server left one behind. FILE defaults to standard output for export and standard input for
+import. Only floots posted at or after --since and before --until (ISO 8601
+times, e.g. 2020-01-31 or 2020-01-31T12:00:00, in local time unless they
+give a time zone) by one of the given users are copied. Floots are exported oldest first.
+
+An import saves every floot in one go (see Database.save_floots), so the data
+file is written once no matter how many floots there are. Floots that are
+already in the database are replaced.
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from database import Database
+from floot import Floot
+import timestamps
+
+
+def floot_filter(since=None, until=None, users=None):
+    """
+    Returns a function that takes a Floot and returns True if it was posted at
+    or after since and before until (timestamps, see timestamps.py) by one of
+    users. Any of them may be None to not filter on it.
+    """
+    users = None if users is None else set(users)
+    def keep(floot):
+        timestamp = floot.get_timestamp_micros()
+        return (since is None or timestamp >= since) \
+                and (until is None or timestamp < until) \
+                and (users is None or floot.get_username() in users)
+    return keep
+
+
+def export_floots(db, out, keep=None):
+    """
+    Writes the floots in db for which keep(floot) is True (all of them if
+    keep is None) to the file out as NDJSON, oldest first. Returns the number
+    of floots written.
+    """
+    if keep is None:
+        keep = floot_filter()
+    count = 0
+    for floot in reversed(db.get_floots()):
+        if keep(floot):
+            out.write(json.dumps(floot.to_dictionary()))
+            out.write("\n")
+            count += 1
+    return count
+
+
+def import_floots(db, lines, keep=None):
+    """
+    Reads floots from lines (an iterable of NDJSON lines, such as an open
+    file) and saves the ones for which keep(floot) is True (all of them if
+    keep is None) into db. Blank lines are skipped. Returns the number of
+    floots saved. Raises a ValueError naming the line if one isn't a floot,
+    in which case nothing is saved.
+    """
+    if keep is None:
+        keep = floot_filter()
+    floots = []
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            floot = Floot.from_dictionary(json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Line {line_number} is not a valid floot: {e!r}") from e
+        if keep(floot):
+            floots.append(floot)
+    db.save_floots(floots)
+    return len(floots)
+
+
+def parse_time(text):
+    """
+    Converts an ISO 8601 time (e.g. 2020-01-31T12:00:00) to a timestamp.
+    Floot timestamps are in local time, so a time with a time zone (e.g.
+    2020-01-31T12:00:00+00:00) is converted to local time first.
+    """
+    try:
+        time = datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO 8601 time: {text!r}")
+    if time.tzinfo is not None:
+        time = time.astimezone().replace(tzinfo=None)
+    return timestamps.from_datetime(time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports or exports floots as NDJSON.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("database", metavar="DATABASE",
+                        help="Data file (or SQLite URL) to read from or write to")
+    parser.add_argument("file", metavar="FILE", nargs="?", default="-",
+                        help="NDJSON file (default: standard output/input)")
+    parser.add_argument("--since", type=parse_time, metavar="TIME",
+                        help="Only floots posted at or after this time")
+    parser.add_argument("--until", type=parse_time, metavar="TIME",
+                        help="Only floots posted before this time")
+    parser.add_argument("--user", dest="users", action="append", metavar="USERNAME",
+                        help="Only floots posted by this user (may be given more than once)")
+    args = parser.parse_args()
+
+    keep = floot_filter(args.since, args.until, args.users)
+    db = Database(args.database)
+    if args.command == "export":
+        if args.file == "-":
+            count = export_floots(db, sys.stdout, keep)
+        else:
+            with open(args.file, "w") as out:
+                count = export_floots(db, out, keep)
+        print(f"Exported {count} floots", file=sys.stderr)
+    else:
+        try:
+            if args.file == "-":
+                count = import_floots(db, sys.stdin, keep)
+            else:
+                with open(args.file) as lines:
+                    count = import_floots(db, lines, keep)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f"Imported {count} floots", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
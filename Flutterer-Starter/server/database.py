@@ -11,17 +11,255 @@ You don't need to understand how the Database class is implemented, but you
 should read through the public method headers (i.e. the ones that don't start
 with an underscore) and read their associated method comments to understand how
 to use the Database class.
+
+By default every change rewrites the whole data file. Passing journal=True
+switches to a journaled mode: each save or delete appends one compact record
+to a log file next to the data file (e.g. data.json.log), and the log is
+replayed on startup. Compaction folds the log back into the data file, either
+periodically in the background (compact_interval, in seconds) or on demand
+via compact(). A Database opened without journal=True still replays a log it
+finds (e.g. one the server left behind), and folds it into the data file the
+next time it writes it, so the log can't later be replayed over newer data.
+
+Either mode can also write behind: with flush_interval (in seconds) and/or
+flush_threshold (a number of changes) set, changes are applied in memory right
+away and written to disk in batches by a background thread, at most
+flush_interval seconds later or as soon as flush_threshold changes are waiting.
+That interval is how much recent data a crash can lose. flush() writes out
+everything that is waiting, and close() (or exiting Python) flushes as well.
+
+With lazy=True, loading the data file only records where each floot is in the
+file and when it was posted. The Floot itself is built the first time it is
+asked for, so startup doesn't pay for floots that are never read. Whenever the
+data file is written, that information is also saved to an index file next to
+it (e.g. data.json.idx), so as long as the index is up to date, a lazy load
+doesn't read the data file at all until the first floot is asked for.
+
+The Database also keeps track of who posted, commented on and liked each
+floot, so that get_floots_by_user, get_comments_by_user and
+get_floots_liked_by don't have to look through every floot. In the same way,
+the hashtags and mentions in each message are picked out once, when the floot
+is saved, for get_floots_by_tag, get_floots_mentioning and get_trending_tags
+(see tags.py). These are saved to a users file (e.g. data.json.users) along
+with the data file, which a lazy load only reads when one of those methods is
+first called.
+
+The data file (and its index) is never modified in place: a new version is
+written to a temporary file, flushed to disk, and renamed over the old one, so
+a crash or a concurrent reader sees either the old or the new file, never a
+partial one. The index also stores a checksum of the data file, and with
+verify_checksum=True loading a data file that doesn't match it raises a
+ValueError instead of silently using corrupted data.
+
+If db_path ends in binary_format.BINARY_EXTENSION (e.g. "data.floots"), the
+data file is written in the compact binary format described in
+binary_format.py instead of JSON. Existing data files are read in whichever
+format they are in.
+
+If db_path is a SQLite URL ("sqlite:///path/to/file.db") or a path ending in
+one of SQLITE_EXTENSIONS, Database() returns a SQLiteDatabase instead (see
+sqlite_database.py), which has the same public methods but keeps the data on
+disk rather than in memory. SQLite always keeps a journal and reads floots on
+demand, so journal and lazy make no difference to it; the other options above
+don't apply to it, and passing any of them with a SQLite path raises a
+TypeError rather than ignoring them.
+
+A Database can be shared between threads. Any number of threads can read from
+it at once; a save or delete has it to itself only while it updates the data
+in memory, and writes to disk afterwards, so reads never wait for the disk.
 """
 
+import atexit
+import bisect
+import inspect
 import json
 import os
+import re
+import sys
+import threading
+import weakref
+import zlib
+from itertools import repeat
+import binary_format
 from floot import Floot
-from datetime import datetime
+from floot_comment import FlootComment
+from ids import pack_id, format_id
+from rwlock import ReadWriteLock
+from search import SearchIndex, document_terms
+from tags import TrendingCounter, extract_tags, normalize_tag
+import timestamps
+from timestamps import MICROSECONDS_PER_SECOND
 
 DATE_FORMAT = "%a %b %d %H:%M:%S %Y"
 
+TMP_SUFFIX = ".tmp"
+
+# Journal record constants
+LOG_SUFFIX = ".log"
+LOG_OP = "op"
+LOG_OP_SAVE = "save"
+LOG_OP_DELETE = "delete"
+LOG_FLOOT = "floot"
+LOG_FLOOT_ID = "id"
+
+# Index file constants
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION_KEY = "version"
+INDEX_VERSION = 5
+INDEX_SIZE = "size"
+INDEX_MTIME = "mtime"
+INDEX_CHECKSUM = "checksum"
+INDEX_FLOOTS = "floots"
+
+# The search index (see search.py) is saved to a file next to the data file,
+# e.g. data.json.search, whenever the data file is written.
+SEARCH_SUFFIX = ".search"
+SEARCH_VERSION = 1
+SEARCH_DOCUMENTS = "documents"
+
+# What the per-user indexes record about each floot (see _user_entries_of) is
+# saved to a file of its own, e.g. data.json.users, in the same way, so that a
+# lazy load can leave it until the first per-user lookup.
+USERS_SUFFIX = ".users"
+USERS_VERSION = 1
+USERS_ENTRIES = "entries"
+
+# Trending hashtags are counted over the last hour, a minute at a time (see
+# TrendingCounter in tags.py).
+TRENDING_BUCKET = 60 * MICROSECONDS_PER_SECOND
+TRENDING_BUCKETS = 60
+
+SQLITE_URL_PREFIX = "sqlite:///"
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+# Database options that a SQLiteDatabase always behaves as if given
+SQLITE_OPTIONS = ("journal", "lazy")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+def _index_json_object(text):
+    """
+    Walks the top-level JSON object in text and yields (key, start, end,
+    value) for each of its members, where text[start:end] is the member's
+    value. Raises a ValueError if text is not a JSON object.
+    """
+    decoder = json.JSONDecoder()
+    idx = _WHITESPACE.match(text).end()
+    if text[idx:idx + 1] != "{":
+        raise ValueError("Expected a JSON object")
+    idx = _WHITESPACE.match(text, idx + 1).end()
+    if text[idx:idx + 1] == "}":
+        return
+
+    while True:
+        key, idx = decoder.raw_decode(text, idx)
+        idx = _WHITESPACE.match(text, idx).end()
+        if text[idx:idx + 1] != ":":
+            raise ValueError(f"Expected ':' at position {idx}")
+        start = _WHITESPACE.match(text, idx + 1).end()
+        value, end = decoder.raw_decode(text, start)
+        yield key, start, end, value
+
+        idx = _WHITESPACE.match(text, end).end()
+        if text[idx:idx + 1] == "}":
+            return
+        if text[idx:idx + 1] != ",":
+            raise ValueError(f"Expected ',' or '}}' at position {idx}")
+        idx = _WHITESPACE.match(text, idx + 1).end()
+
+def _atomic_write(path, data):
+    """
+    Replaces the file at path with data (bytes). The data is written to a
+    temporary file, flushed all the way to disk and then renamed over path,
+    so anyone reading path (including us, after a crash) sees either the old
+    or the new contents in full.
+    """
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Make the rename itself durable. (Directories can't be opened like this
+    # on Windows, where the rename is durable as is.)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def _discard(index, key, value):
+    """
+    Removes value from the bucket index[key], dropping the bucket once it is
+    empty.
+    """
+    bucket = index.get(key)
+    if bucket is not None:
+        bucket.pop(value, None)
+        if not bucket:
+            del index[key]
+
+def is_sqlite_path(db_path):
+    """
+    Returns True if db_path names a SQLite database rather than a JSON file.
+    """
+    return db_path.startswith(SQLITE_URL_PREFIX) or db_path.endswith(SQLITE_EXTENSIONS)
+
+def make_cursor(timestamp, floot_id):
+    """
+    Encodes a position in the feed (see Database.get_cursor).
+    """
+    return f"{timestamp}_{floot_id}"
+
+def parse_cursor(cursor):
+    """
+    Opposite of make_cursor. Returns a (timestamp, floot id) pair, or raises a
+    ValueError if the cursor is malformed.
+    """
+    timestamp, sep, floot_id = cursor.partition("_")
+    if not sep:
+        raise ValueError(f"Malformed cursor {cursor!r}")
+    return (int(timestamp), floot_id)
+
+def _sort_key(timestamp, raw_id):
+    """
+    Returns the key a floot is filed under in Database._order, given its
+    timestamp and its id in the form Floots keep it in (see ids.py). Ints and
+    strings can't be compared, so at the same timestamp, ids that are still
+    strings sort after the ones that are ints. (Ints sort the same way as
+    their string forms.)
+    """
+    return (timestamp, isinstance(raw_id, str), raw_id)
+
+def _cursor_key(cursor):
+    timestamp, floot_id = parse_cursor(cursor)
+    return _sort_key(timestamp, pack_id(floot_id))
+
+# Databases that may be holding unwritten changes, so they can be flushed when
+# Python exits.
+_write_behind_databases = weakref.WeakSet()
+
+@atexit.register
+def _flush_write_behind_databases():
+    for database in list(_write_behind_databases):
+        database.flush()
+
 class Database:
-    def __init__(self, db_path=None):
+    def __new__(cls, db_path=None, *args, **kwargs):
+        if cls is Database and db_path and is_sqlite_path(db_path):
+            options = inspect.signature(Database.__init__).bind(
+                    None, db_path, *args, **kwargs).arguments
+            unsupported = [name for name, value in options.items()
+                           if name not in ("self", "db_path", *SQLITE_OPTIONS) and value]
+            if unsupported:
+                raise TypeError(f"A SQLite database doesn't support {', '.join(unsupported)}")
+            from sqlite_database import SQLiteDatabase
+            return SQLiteDatabase(db_path)
+        return super().__new__(cls)
+
+    def __init__(self, db_path=None, journal=False, compact_interval=None,
+                 flush_interval=None, flush_threshold=None, lazy=False,
+                 verify_checksum=False):
         """
         Constructs a new Database
         """
@@ -29,49 +267,977 @@ class Database:
             db_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                          "data.json")
         self._db_path = db_path
+        self._log_path = self._db_path + LOG_SUFFIX
+        self._index_path = self._db_path + INDEX_SUFFIX
+        self._search_path = self._db_path + SEARCH_SUFFIX
+        self._users_path = self._db_path + USERS_SUFFIX
+        self._verify_checksum = verify_checksum
+        self._binary = db_path.endswith(binary_format.BINARY_EXTENSION)
+        # Floots by id. Here and in all the other bookkeeping below, ids are
+        # in the compact form Floots keep them in (see ids.py).
         self._data = {}
+        # In lazy mode, floots that haven't been built yet: floot id ->
+        # (start, end, timestamp), where self._source[start:end] is the
+        # floot's JSON (or binary record) in the data file as it was loaded.
+        # Binary records refer to the strings in self._strings. When the
+        # index file was up to date, the data file itself isn't read until a
+        # floot is built (see _read_source), and self._source is None until
+        # then; self._source_stat is the data file's (size, modification
+        # time) according to the index.
+        self._lazy = lazy
+        self._unloaded = {}
+        self._source = ""
+        self._source_stat = None
+        self._strings = binary_format.StringTable()
+        # Sort keys (see _sort_key) for every floot, sorted oldest to newest,
+        # so that the newest floots can be read off the end of the list.
+        self._order = []
+        # Per-user indexes. Each maps a username to an insertion-ordered dict
+        # used as a set: floot ids the user posted, (floot id, comment id) for
+        # comments the user wrote (comment ids are only unique within their
+        # floot), and floot ids the user liked.
+        self._floots_by_user = {}
+        self._comments_by_user = {}
+        self._likes_by_user = {}
+        # Same for hashtags (without the #, lowercased) and mentioned
+        # usernames: each maps to the floot ids that use it.
+        self._floots_by_tag = {}
+        self._floots_mentioning = {}
+        # How many floots used each hashtag in the last hour
+        self._trending = TrendingCounter(TRENDING_BUCKET, TRENDING_BUCKETS)
+        # What the per-user indexes currently hold for each floot (see
+        # _user_entries_of), so that they can be updated when the floot changes.
+        # After a lazy load from an up-to-date index, all of the above is only
+        # filled in (from the users file) the first time it is needed; until
+        # then, like for the search index below, the ids of floots that were
+        # saved or deleted are collected instead.
+        self._user_entries = {}
+        self._users_loaded = True
+        self._users_changed = set()
+        # Public methods that only look at the data hold self._lock for
+        # reading; saves and deletes hold it for writing while they change the
+        # data in memory. Building a lazily loaded floot happens while
+        # reading, so it is guarded by self._load_lock instead.
+        self._lock = ReadWriteLock()
+        self._load_lock = threading.Lock()
+        # The full-text search index (see search.py), which is only built (or
+        # read from the search file) the first time someone searches. Until
+        # then, the ids of floots that were saved or deleted are collected, to
+        # bring a saved search index up to date.
+        self._search = None
+        self._search_changed = set()
         if os.path.exists(self._db_path):
             self._load_data_from_file()
 
+        self._journal = journal
+        self._log_file = None
+        self._log_records = 0
+
+        # Changes that have been applied in memory but not written to disk yet
+        # (journal records; without a journal only their number matters).
+        self._write_behind = flush_interval is not None or flush_threshold is not None
+        self._flush_threshold = flush_threshold
+        self._pending = []
+        self._flush_requested = threading.Event()
+        # Held while writing to disk, so that changes land in the order they
+        # were made. Always taken before self._lock, never while holding it.
+        self._io_lock = threading.Lock()
+
+        self._closed = threading.Event()
+        self._workers = []
+        if self._journal:
+            self._replay_log()
+            self._log_file = open(self._log_path, "a")
+            if compact_interval:
+                self._start_worker(self._compact_periodically, compact_interval)
+        else:
+            # Changes in a journal left behind by a journaled Database count
+            # too (see _write_data_to_file).
+            self._replay_log()
+        if self._write_behind:
+            self._start_worker(self._flush_periodically, flush_interval)
+            _write_behind_databases.add(self)
+
+    def _start_worker(self, target, interval):
+        worker = threading.Thread(target=target, args=(interval,), daemon=True)
+        worker.start()
+        self._workers.append(worker)
+
     def _load_data_from_file(self):
         """
         Students: Don't call this method.
         """
-        with open(self._db_path, "r") as f:
-            parsed_file = json.load(f)
+        if self._lazy:
+            self._index_data_file()
+            return
+
+        data = self._read_data_file()
+        self._binary = binary_format.is_binary(data)
+        if self._binary:
+            floots = binary_format.load(data)
+        else:
+            floots = [Floot.from_dictionary(floot_dict) for floot_dict in json.loads(data).values()]
+
+        for floot in floots:
+            self._data[floot.get_id_raw()] = floot
+            self._index_user_entries(floot.get_id_raw(), self._user_entries_of(floot))
+        self._order = sorted(self._order_key(floot) for floot in self._data.values())
+
+    def _index_data_file(self):
+        """
+        Lazy version of _load_data_from_file: notes where each floot is in the
+        file, without building any Floots. With an up-to-date index, that is
+        all that happens; otherwise the file is read and scanned, and its
+        contents kept around.
+        """
+        index = self._read_index()
+        if index is None or self._verify_checksum:
+            data = self._read_data_file()
+            self._binary = binary_format.is_binary(data)
+            if self._binary:
+                self._source = data
+                self._strings, offset = binary_format.read_header(data)
+            else:
+                self._source = data.decode("utf-8")
+        else:
+            with open(self._db_path, "rb") as f:
+                self._binary = binary_format.is_binary(f.read(len(binary_format.MAGIC)))
+            self._source = None
+
+        if index is not None:
+            self._source_stat = (index[INDEX_SIZE], index[INDEX_MTIME])
+            self._users_loaded = False
+            floot_ids, starts, ends, times = index[INDEX_FLOOTS]
+            self._unloaded = dict(zip(floot_ids, zip(starts, ends, times)))
+            # The same keys as _sort_key gives, without a call per floot
+            self._order = sorted(zip(times, map(isinstance, floot_ids, repeat(str)), floot_ids))
+            return
+        if self._binary:
+            for floot_id, start, end, timestamp, username, comments, liked_by, message in \
+                    binary_format.scan(data, offset, self._strings):
+                self._unloaded[floot_id] = (start, end, timestamp)
+                self._index_user_entries(floot_id, (username, comments, liked_by,
+                                                    *extract_tags(message)))
+        else:
+            for floot_id, start, end, floot_dict in _index_json_object(self._source):
+                floot_id = pack_id(floot_id)
+                timestamp = Floot.stored_timestamp(floot_dict)
+                self._unloaded[floot_id] = (start, end, timestamp)
+                self._index_user_entries(floot_id, self._interned_user_entries(
+                        floot_dict[Floot.FLOOT_USERNAME],
+                        [[pack_id(c[FlootComment.COMMENT_ID]), c[FlootComment.COMMENT_AUTHOR]]
+                         for c in floot_dict[Floot.COMMENTS]],
+                        floot_dict[Floot.LIKED_BY], *extract_tags(floot_dict[Floot.MESSAGE])))
+        self._order = sorted(_sort_key(timestamp, floot_id)
+                             for floot_id, (_, _, timestamp) in self._unloaded.items())
+
+    @staticmethod
+    def _interned_user_entries(username, comments, liked_by, hashtags, mentions):
+        """
+        Interns the usernames and tags in user entries read from a file (see
+        _user_entries_of), like a Floot would. The lists are updated in place
+        rather than copied, to keep loading fast.
+        """
+        for comment in comments:
+            comment[1] = sys.intern(comment[1])
+        for strings in (liked_by, hashtags, mentions):
+            strings[:] = map(sys.intern, strings)
+        return (sys.intern(username), comments, liked_by, hashtags, mentions)
+
+    def _get(self, floot_id):
+        """
+        Returns the floot with the given id, building it first if it hasn't
+        been loaded yet. Raises a KeyError if there is no such floot.
+        """
+        floot = self._data.get(floot_id)
+        if floot is None:
+            with self._load_lock:
+                if floot_id in self._unloaded:
+                    floot = self._decode(floot_id)
+                    # Other readers may be looking at the floot at the same
+                    # time, so it goes into self._data before it leaves
+                    # self._unloaded, never appearing to be missing.
+                    self._data[floot_id] = floot
+                    del self._unloaded[floot_id]
+                floot = self._data[floot_id]
+        return floot
+
+    def _decode(self, floot_id):
+        """
+        Builds a new Floot from the source of a floot that hasn't been loaded
+        yet. The caller must hold self._load_lock.
+        """
+        if self._source is None:
+            self._read_source()
+        start, end, _ = self._unloaded[floot_id]
+        if self._binary:
+            return binary_format.decode_record(self._source, start, self._strings)
+        return Floot.from_dictionary(json.loads(self._source[start:end]))
+
+    def _read_source(self):
+        """
+        Reads the data file that a lazy load only read the index of. Raises a
+        ValueError if the file has changed since then, since the positions in
+        the index would no longer be right. The caller must hold
+        self._load_lock.
+        """
+        with open(self._db_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+        if (stat.st_size, stat.st_mtime_ns) != self._source_stat:
+            raise ValueError(f"{self._db_path} was changed by something else "
+                             f"after it was loaded")
+        if self._binary:
+            self._source = data
+            self._strings, _ = binary_format.read_header(data)
+        else:
+            self._source = data.decode("utf-8")
+
+    def _read_data_file(self):
+        """
+        Returns the contents of the data file as bytes, checking them against
+        the checksum in the index first if verify_checksum is on.
+        """
+        with open(self._db_path, "rb") as f:
+            data = f.read()
+        if self._verify_checksum:
+            # The index is used even if it doesn't match the data file's size
+            # or modification time any more, since a data file that changed
+            # after the index was written is exactly what this is checking
+            # for. Only an index without a checksum can't be checked against.
+            index = self._read_index_file()
+            checksum = index.get(INDEX_CHECKSUM) if isinstance(index, dict) else None
+            if checksum is not None and checksum != zlib.crc32(data):
+                raise ValueError(f"{self._db_path} is corrupt: its checksum doesn't match "
+                                 f"the one recorded in {self._index_path}")
+        return data
+
+    def _read_index(self):
+        """
+        Returns the contents of the index file, or None if there is no index
+        file or it doesn't belong to the current data file. Its INDEX_FLOOTS
+        entry holds four lists, of floot ids (in their in-memory form, see
+        ids.py), starts, ends and timestamps, rather than one list per floot,
+        since those load faster.
+        """
+        index = self._read_index_file()
+        if not isinstance(index, dict):
+            return None
+        stat = os.stat(self._db_path)
+        if index.get(INDEX_VERSION_KEY) != INDEX_VERSION:
+            return None
+        if index.get(INDEX_SIZE) != stat.st_size or index.get(INDEX_MTIME) != stat.st_mtime_ns:
+            return None
+        return index
+
+    def _read_index_file(self):
+        """
+        Returns the contents of the index file as they are, or None if it is
+        missing or isn't JSON.
+        """
+        try:
+            with open(self._index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_index(self, index, checksum):
+        """
+        Saves the index for the data file that was just written. The index
+        records the data file's size and modification time, so that a stale
+        index is never used.
+        """
+        stat = os.stat(self._db_path)
+        _atomic_write(self._index_path, json.dumps({
+            INDEX_VERSION_KEY: INDEX_VERSION,
+            INDEX_SIZE: stat.st_size,
+            INDEX_MTIME: stat.st_mtime_ns,
+            INDEX_CHECKSUM: checksum,
+            INDEX_FLOOTS: [list(column) for column in zip(*index)] or [[], [], [], []],
+        }, separators=(",", ":")).encode("utf-8"))
 
-        for floot_id, floot_dict in parsed_file.items():
-            self._data[floot_id] = Floot.from_dictionary(floot_dict)
+    def _read_search_index(self):
+        """
+        Returns the SearchIndex saved in the search file, or None if there is
+        no search file or it doesn't belong to the current data file. Like the
+        index file, the search file records the size and modification time of
+        the data file it was written with, and SEARCH_DOCUMENTS holds the
+        index's contents (see SearchIndex.to_json).
+        """
+        try:
+            with open(self._search_path, "r") as f:
+                saved = json.load(f)
+            stat = os.stat(self._db_path)
+        except (OSError, ValueError):
+            return None
+        if saved.get(INDEX_VERSION_KEY) != SEARCH_VERSION \
+                or saved.get(INDEX_SIZE) != stat.st_size \
+                or saved.get(INDEX_MTIME) != stat.st_mtime_ns:
+            return None
+        return SearchIndex.build(saved[SEARCH_DOCUMENTS])
 
-    def _write_data_to_file(self):
+    def _write_search_index(self, search_documents):
+        stat = os.stat(self._db_path)
+        _atomic_write(self._search_path, json.dumps({
+            INDEX_VERSION_KEY: SEARCH_VERSION,
+            INDEX_SIZE: stat.st_size,
+            INDEX_MTIME: stat.st_mtime_ns,
+            SEARCH_DOCUMENTS: search_documents,
+        }, separators=(",", ":")).encode("utf-8"))
+
+    def _read_users_file(self):
+        """
+        Returns the user entries saved in the users file, as a list of
+        [floot id, username, comments, liked by, hashtags, mentions] entries
+        (see _user_entries_of), or None if there is no users file or it
+        doesn't belong to the data file as it was loaded (see
+        _read_search_index).
+        """
+        try:
+            with open(self._users_path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get(INDEX_VERSION_KEY) != USERS_VERSION \
+                or (saved.get(INDEX_SIZE), saved.get(INDEX_MTIME)) != self._source_stat:
+            return None
+        return saved[USERS_ENTRIES]
+
+    def _write_users_file(self, user_entries):
+        stat = os.stat(self._db_path)
+        _atomic_write(self._users_path, json.dumps({
+            INDEX_VERSION_KEY: USERS_VERSION,
+            INDEX_SIZE: stat.st_size,
+            INDEX_MTIME: stat.st_mtime_ns,
+            USERS_ENTRIES: user_entries,
+        }, separators=(",", ":")).encode("utf-8"))
+
+    def _write_data_to_file(self, snapshot=None):
         """
         Students: don't call this method.
         """
-        with open(self._db_path, "w") as f:
-            json.dump({floot_id: floot.to_dictionary()
-                       for floot_id, floot in self._data.items()}, f, indent=4)
+        contents, index, user_entries, search_documents = snapshot or self._serialize_data()
+        data = contents.encode("utf-8") if isinstance(contents, str) else contents
+        _atomic_write(self._db_path, data)
+        self._write_index(index, zlib.crc32(data))
+        self._write_users_file(user_entries)
+        if search_documents is not None:
+            self._write_search_index(search_documents)
+        if not self._journal and self._log_records:
+            # The journal replayed at startup is in the data file now. Left
+            # in place, it would be replayed over the new data file, undoing
+            # whatever changed since.
+            os.remove(self._log_path)
+            self._log_records = 0
+
+    def _serialize_data(self):
+        """
+        Returns the contents of the data file, formatted the same way as
+        json.dumps(..., indent=4), along with its index (see _read_index), the
+        contents of the users file (see _read_users_file) and the contents of
+        the search index (see _read_search_index; None if it hasn't been
+        built). Floots that were never loaded are copied straight from the
+        text they were read from. (In binary mode, returns the binary contents
+        instead.) The caller must hold self._lock (for reading).
+        """
+        if self._unloaded and self._source is None:
+            with self._load_lock:
+                if self._source is None:
+                    self._read_source()
+        # The users file is rewritten along with the data file, so it needs
+        # everything in it.
+        self._user_indexes()
+        user_entries = [[floot_id, *entries] for floot_id, entries in self._user_entries.items()]
+        if self._search is None and os.path.exists(self._search_path):
+            # Bring the saved search index along, or it would go stale.
+            self._search_index()
+        search_documents = None if self._search is None else self._search.to_json()
+        contents, index = self._serialize_binary() if self._binary else self._serialize_json()
+        return contents, index, user_entries, search_documents
+
+    def _serialize_json(self):
+        members = []
+        index = []
+        position = len("{\n    ")
+        for floot_id in self._all_floot_ids():
+            key = json.dumps(format_id(floot_id)) + ": "
+            value = self._serialize_floot(floot_id)
+            start = position + len(key)
+            index.append(self._index_entry(floot_id, start, start + len(value),
+                                           self._stored_timestamp(floot_id)))
+            members.append(key + value)
+            position = start + len(value) + len(",\n    ")
+        if not members:
+            return "{}", index
+        return "{\n    " + ",\n    ".join(members) + "\n}", index
+
+    def _serialize_binary(self):
+        # Records of floots that were never loaded are copied as they are,
+        # which works because they keep referring to the same (only ever
+        # growing) string table. Without any, start from a fresh table, to
+        # drop strings that are no longer used.
+        strings = self._strings if self._unloaded else binary_format.StringTable()
+        floot_ids = self._all_floot_ids()
+        records = []
+        for floot_id in floot_ids:
+            unloaded = self._unloaded.get(floot_id)
+            if unloaded is not None:
+                start, end, _ = unloaded
+                records.append(self._source[start:end])
+            else:
+                records.append(binary_format.encode_record(self._data[floot_id], strings))
+        data, position = binary_format.write(records, strings)
+
+        index = []
+        for floot_id, record in zip(floot_ids, records):
+            index.append(self._index_entry(floot_id, position, position + len(record),
+                                           self._stored_timestamp(floot_id)))
+            position += len(record)
+        return data, index
+
+    def _index_entry(self, floot_id, start, end, timestamp):
+        """
+        Returns the index file entry for a floot (see _read_index).
+        """
+        return [floot_id, start, end, timestamp]
 
-    def get_floots(self, count=None):
+    def _serialize_floot(self, floot_id):
+        unloaded = self._unloaded.get(floot_id)
+        if unloaded is not None:
+            start, end, _ = unloaded
+            return self._source[start:end]
+        text = self._data[floot_id].to_record_json()
+        # Indent one more level, since this sits inside the top-level object.
+        # (json.dumps escapes newlines inside strings, so this only touches
+        # the line breaks between members.)
+        return text.replace("\n", "\n    ")
+
+    def _all_floot_ids(self):
+        with self._load_lock:
+            return list(self._data) + list(self._unloaded)
+
+    @staticmethod
+    def _order_key(floot):
+        return _sort_key(floot.get_timestamp_micros(), floot.get_id_raw())
+
+    def _stored_timestamp(self, floot_id):
+        """
+        Returns the timestamp under which the floot with the given id is
+        currently filed in self._order (whether or not it has been loaded).
+        """
+        unloaded = self._unloaded.get(floot_id)
+        if unloaded is not None:
+            return unloaded[2]
+        return self._data[floot_id].get_timestamp_micros()
+
+    def _stored_order_key(self, floot_id):
+        return _sort_key(self._stored_timestamp(floot_id), floot_id)
+
+    @staticmethod
+    def _user_entries_of(floot):
+        """
+        Returns what the per-user indexes record about a floot: its author,
+        (comment id, comment author) pairs, the users who liked it, and the
+        hashtags and mentions in its message (see tags.py).
+        """
+        return (floot.get_username(),
+                [(comment.get_id_raw(), comment.get_author()) for comment in floot.get_comments()],
+                floot.get_liked_by(),
+                *extract_tags(floot.get_message()))
+
+    def _index_user_entries(self, floot_id, user_entries):
+        """
+        Adds a floot to the per-user and per-tag indexes, or notes that it
+        changed if they haven't been loaded yet. The floot must already be
+        filed under its timestamp (see _stored_timestamp).
+        """
+        if self._users_loaded:
+            self._add_user_entries(floot_id, user_entries)
+        else:
+            self._users_changed.add(floot_id)
+
+    def _unindex_user_entries(self, floot_id):
+        if self._users_loaded:
+            self._remove_user_entries(floot_id)
+        else:
+            self._users_changed.add(floot_id)
+
+    def _add_user_entries(self, floot_id, user_entries):
+        username, comments, liked_by, hashtags, mentions = user_entries
+        self._user_entries[floot_id] = user_entries
+        self._floots_by_user.setdefault(username, {})[floot_id] = None
+        for comment_id, author in comments:
+            self._comments_by_user.setdefault(author, {})[floot_id, comment_id] = None
+        for user in liked_by:
+            self._likes_by_user.setdefault(user, {})[floot_id] = None
+        if hashtags:
+            timestamp = self._stored_timestamp(floot_id)
+            for tag in hashtags:
+                self._floots_by_tag.setdefault(tag, {})[floot_id] = None
+                self._trending.add(tag, timestamp)
+        for user in mentions:
+            self._floots_mentioning.setdefault(user, {})[floot_id] = None
+
+    def _remove_user_entries(self, floot_id):
+        username, comments, liked_by, hashtags, mentions = self._user_entries.pop(floot_id)
+        _discard(self._floots_by_user, username, floot_id)
+        for comment_id, author in comments:
+            _discard(self._comments_by_user, author, (floot_id, comment_id))
+        for user in liked_by:
+            _discard(self._likes_by_user, user, floot_id)
+        if hashtags:
+            timestamp = self._stored_timestamp(floot_id)
+            for tag in hashtags:
+                _discard(self._floots_by_tag, tag, floot_id)
+                self._trending.add(tag, timestamp, -1)
+        for user in mentions:
+            _discard(self._floots_mentioning, user, floot_id)
+
+    def _user_indexes(self):
+        """
+        Reads or builds the per-user indexes first if they haven't been loaded
+        yet. The caller must hold self._lock (for reading).
+        """
+        if not self._users_loaded:
+            # Like building a floot, this happens while reading.
+            with self._load_lock:
+                if not self._users_loaded:
+                    self._load_user_entries()
+                    self._users_changed = set()
+                    self._users_loaded = True
+
+    def _load_user_entries(self):
+        def floot(floot_id):
+            # Floots that haven't been loaded are only decoded, not kept.
+            loaded = self._data.get(floot_id)
+            return loaded if loaded is not None else self._decode(floot_id)
+
+        saved = self._read_users_file()
+        if saved is None:
+            for floot_id in list(self._data) + list(self._unloaded):
+                self._add_user_entries(floot_id, self._user_entries_of(floot(floot_id)))
+            return
+        # The users file is as of the data file, which may have been loaded
+        # before some floots changed.
+        for floot_id, username, comments, liked_by, hashtags, mentions in saved:
+            if floot_id not in self._users_changed:
+                self._add_user_entries(floot_id, self._interned_user_entries(
+                        username, comments, liked_by, hashtags, mentions))
+        for floot_id in self._users_changed:
+            if self._has(floot_id):
+                self._add_user_entries(floot_id, self._user_entries_of(floot(floot_id)))
+
+    def _put(self, floot):
+        """
+        Adds or replaces a floot in memory, keeping the indexes up to date.
+        """
+        floot_id = floot.get_id_raw()
+        if self._has(floot_id) and self._stored_order_key(floot_id) != self._order_key(floot):
+            self._remove(floot_id)
+        if self._has(floot_id):
+            # The floot object may have been changed in place, so the per-user
+            # indexes are rebuilt from what was recorded last time.
+            self._unindex_user_entries(floot_id)
+            self._unloaded.pop(floot_id, None)
+        else:
+            bisect.insort(self._order, self._order_key(floot))
+        self._data[floot_id] = floot
+        self._index_user_entries(floot_id, self._user_entries_of(floot))
+        self._update_search(floot_id, floot)
+
+    def _put_many(self, floots):
+        """
+        Same as calling _put on each floot, but floots that are new to the
+        database are sorted into self._order all at once instead of one by
+        one. If the same id appears more than once, the last floot wins.
+        """
+        new_keys = []
+        for floot in {floot.get_id_raw(): floot for floot in floots}.values():
+            floot_id = floot.get_id_raw()
+            if self._has(floot_id):
+                self._put(floot)
+            else:
+                self._data[floot_id] = floot
+                self._index_user_entries(floot_id, self._user_entries_of(floot))
+                self._update_search(floot_id, floot)
+                new_keys.append(self._order_key(floot))
+        if new_keys:
+            # Both parts are mostly sorted already, which sorted() is fast at.
+            self._order = sorted(self._order + new_keys)
+
+    def _remove(self, floot_id):
+        """
+        Removes a floot from memory, keeping the indexes up to date. Raises a
+        KeyError if there is no such floot.
+        """
+        key = self._stored_order_key(floot_id)
+        self._unindex_user_entries(floot_id)
+        if floot_id in self._unloaded:
+            del self._unloaded[floot_id]
+        else:
+            del self._data[floot_id]
+        del self._order[bisect.bisect_left(self._order, key)]
+        self._update_search(floot_id, None)
+
+    @staticmethod
+    def _search_terms(floot):
+        return document_terms(floot.get_message(),
+                              [comment.get_message() for comment in floot.get_comments()])
+
+    def _update_search(self, floot_id, floot):
+        """
+        Brings the search index up to date with a floot that was just saved
+        (or removed, if floot is None), or notes that it changed if the index
+        hasn't been built yet.
+        """
+        if self._search is None:
+            self._search_changed.add(floot_id)
+        elif floot is None:
+            self._search.remove(floot_id)
+        else:
+            self._search.add(floot_id, floot.get_timestamp_micros(), self._search_terms(floot))
+
+    def _search_index(self):
+        """
+        Returns the search index, reading or building it first if this is the
+        first search. The caller must hold self._lock (for reading).
+        """
+        if self._search is None:
+            # Like building a floot, this happens while reading.
+            with self._load_lock:
+                if self._search is None:
+                    self._search = self._load_search_index()
+                    self._search_changed = set()
+        return self._search
+
+    def _load_search_index(self):
+        def floot(floot_id):
+            # Floots that haven't been loaded are only decoded, not kept.
+            loaded = self._data.get(floot_id)
+            return loaded if loaded is not None else self._decode(floot_id)
+
+        index = self._read_search_index()
+        if index is None:
+            return SearchIndex.build(
+                    (floot_id, self._stored_timestamp(floot_id), self._search_terms(floot(floot_id)))
+                    for floot_id in list(self._data) + list(self._unloaded))
+        # The saved index is as of the data file, which may have been loaded
+        # before some floots changed.
+        for floot_id in self._search_changed:
+            if self._has(floot_id):
+                changed = floot(floot_id)
+                index.add(floot_id, changed.get_timestamp_micros(), self._search_terms(changed))
+            else:
+                index.remove(floot_id)
+        return index
+
+    def _replay_log(self):
+        """
+        Applies every complete record in the journal on top of the data loaded
+        from the data file. A torn record at the end of the log (left behind by
+        a crash in the middle of an append) is discarded and truncated away, so
+        that later appends start on a clean line.
+        """
+        if not os.path.exists(self._log_path):
+            return
+
+        valid_length = 0
+        with open(self._log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._apply_log_record(record)
+                self._log_records += 1
+                valid_length += len(line)
+
+        if valid_length != os.path.getsize(self._log_path):
+            with open(self._log_path, "r+b") as f:
+                f.truncate(valid_length)
+
+    def _apply_log_record(self, record):
+        if record[LOG_OP] == LOG_OP_SAVE:
+            self._put(Floot.from_dictionary(record[LOG_FLOOT]))
+        elif record[LOG_OP] == LOG_OP_DELETE:
+            # Replaying a log over a snapshot that already contains its effects
+            # is harmless, so the floot may legitimately be gone already.
+            floot_id = pack_id(record[LOG_FLOOT_ID])
+            if self._has(floot_id):
+                self._remove(floot_id)
+        else:
+            raise ValueError(f"Unknown journal record: {record!r}")
+
+    def _append_log_records(self, records):
+        """
+        Appends records to the journal in a single write and makes sure they
+        reached the disk before returning.
+        """
+        self._log_file.write("".join(json.dumps(record, separators=(",", ":")) + "\n"
+                                     for record in records))
+        self._log_file.flush()
+        os.fsync(self._log_file.fileno())
+        self._log_records += len(records)
+
+    def _commit(self, change, make_record):
+        """
+        Calls change() to update the data in memory and gets the journal
+        record describing the change (from make_record()) to disk. Only the
+        change and building its record run under the write lock; the disk is
+        written to afterwards (or later on, when writing behind), while readers
+        carry on.
+
+        The record is built along with the change, rather than before
+        _commit is called, so that records are appended in the same order as
+        the changes were made, each describing the floot as it was left by
+        its change.
+        """
+        if self._write_behind:
+            with self._lock.writing():
+                change()
+                self._pending.append(make_record())
+                if self._flush_threshold and len(self._pending) >= self._flush_threshold:
+                    self._flush_requested.set()
+            return
+
+        with self._io_lock:
+            with self._lock.writing():
+                change()
+                record = make_record() if self._journal else None
+            if self._journal:
+                self._append_log_records([record])
+            else:
+                with self._lock.reading():
+                    snapshot = self._serialize_data()
+                self._write_data_to_file(snapshot)
+
+    def flush(self):
+        """
+        Writes every change that is still waiting in memory to disk, and
+        returns once it is there. Only needed when the Database was created
+        with flush_interval or flush_threshold.
+        """
+        with self._io_lock:
+            # Changes are only added to self._pending under the write lock, so
+            # the read lock is enough to take them.
+            with self._lock.reading():
+                records, self._pending = self._pending, []
+                if not records:
+                    return
+                if not self._journal:
+                    snapshot = self._serialize_data()
+            # Readers and writers can carry on while the batch hits the disk.
+            if self._journal:
+                self._append_log_records(records)
+            else:
+                self._write_data_to_file(snapshot)
+
+    def _flush_periodically(self, interval):
+        while not self._closed.is_set():
+            self._flush_requested.wait(interval)
+            self._flush_requested.clear()
+            self.flush()
+
+    def compact(self):
+        """
+        Folds the journal into the data file and empties the journal. The
+        journal is only cleared once the new data file is in place, so a crash
+        at any point loses nothing. (Replaying a journal that has already been
+        folded in is harmless.)
+        """
+        with self._io_lock:
+            with self._lock.reading():
+                if not self._journal or (self._log_records == 0 and not self._pending):
+                    return
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        """
+        Writes everything in memory to the data file and empties the journal
+        (if any). The caller must hold self._io_lock.
+        """
+        with self._lock.reading():
+            snapshot = self._serialize_data()
+            # The new data file will already reflect any changes still
+            # waiting. (See flush for why the read lock is enough here.)
+            self._pending = []
+        self._write_data_to_file(snapshot)
+        if self._journal:
+            self._log_file.close()
+            self._log_file = open(self._log_path, "w")
+            self._log_records = 0
+
+    def _compact_periodically(self, interval):
+        while not self._closed.wait(interval):
+            self.compact()
+
+    def close(self):
+        """
+        Stops background compaction and flushing, and closes the journal. Any
+        changes waiting in memory are written out and any journaled changes
+        are folded into the data file first.
+        """
+        self._closed.set()
+        self._flush_requested.set()
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+        self.flush()
+        _write_behind_databases.discard(self)
+        if self._log_file:
+            self.compact()
+            self._log_file.close()
+            self._log_file = None
+
+    def get_floots(self, count=None, before=None, after=None):
         """
         Returns a list of Floot objects, containing no more than `count`
         Floots. If count is unspecified, returns a list of all the Floots. If
         count is specified, the most recent `count` floots are returned.
         Floots in the returned list are sorted from newest to oldest.
+
+        before and after are optional cursors (see get_cursor) that restrict
+        the result to floots older than `before` and/or newer than `after`.
+        When only `after` is given, the `count` floots right after the cursor
+        are returned (still newest first), so that a client can page forwards
+        through the feed without skipping anything. Raises a ValueError if a
+        cursor is malformed.
+        """
+        after_key = None if after is None else _cursor_key(after)
+        before_key = None if before is None else _cursor_key(before)
+        with self._lock.reading():
+            lo = 0 if after is None else bisect.bisect_right(self._order, after_key)
+            hi = len(self._order) if before is None else bisect.bisect_left(self._order, before_key)
+            if count is None:
+                count = hi - lo
+            if count <= 0 or lo >= hi:
+                return []
+
+            if after is not None and before is None:
+                keys = self._order[lo:min(hi, lo + count)]
+            else:
+                keys = self._order[max(lo, hi - count):hi]
+            return [self._get(floot_id) for _, _, floot_id in reversed(keys)]
+
+    def get_floot_summaries(self, count=None, before=None, after=None, comments=0, viewer=None):
+        """
+        Same as get_floots, but returns a summary of each floot (see
+        Floot.to_summary) that includes its first `comments` comments and,
+        if viewer is given, whether that user likes it.
+        """
+        return [floot.to_summary(comments, viewer)
+                for floot in self.get_floots(count, before, after)]
+
+    def search(self, query, count=None):
+        """
+        Returns a list of the Floots whose message or comments contain every
+        word in query (a string), best match first, and no more than `count`
+        of them if count is given. A word ending in * matches any word that
+        starts with it. (See search.py for how results are ranked.)
+        """
+        with self._lock.reading():
+            return [self._get(floot_id) for floot_id in self._search_index().search(query, count)]
+
+    @staticmethod
+    def get_cursor(floot):
+        """
+        Returns a string identifying the position of the provided floot (or
+        floot summary) in the feed, which can be passed as `before` or `after`
+        to get_floots. Cursors stay valid even if the floot they were made
+        from is deleted.
+        """
+        return make_cursor(floot.get_timestamp_micros(), floot.get_id())
+
+    def _newest_first(self, floot_ids):
+        keys = sorted((self._stored_order_key(floot_id) for floot_id in floot_ids), reverse=True)
+        return [self._get(floot_id) for _, _, floot_id in keys]
+
+    def get_floots_by_user(self, username):
+        """
+        Returns a list of the Floots posted by the given user, sorted from
+        newest to oldest.
+        """
+        with self._lock.reading():
+            self._user_indexes()
+            return self._newest_first(self._floots_by_user.get(username, ()))
+
+    def get_floots_liked_by(self, username):
+        """
+        Returns a list of the Floots the given user likes, sorted from newest
+        to oldest.
+        """
+        with self._lock.reading():
+            self._user_indexes()
+            return self._newest_first(self._likes_by_user.get(username, ()))
+
+    def get_floots_by_tag(self, tag):
+        """
+        Returns a list of the Floots whose message uses the given hashtag
+        (with or without the #, in any case), sorted from newest to oldest.
         """
-        if count is None:
-            count = len(self._data)
+        with self._lock.reading():
+            self._user_indexes()
+            return self._newest_first(self._floots_by_tag.get(normalize_tag(tag), ()))
 
-        floots = list(self._data.values())
-        floots = sorted(floots, key=lambda f: f.get_timestamp_raw(), reverse=True)
+    def get_floots_mentioning(self, username):
+        """
+        Returns a list of the Floots whose message mentions @username, sorted
+        from newest to oldest.
+        """
+        with self._lock.reading():
+            self._user_indexes()
+            return self._newest_first(self._floots_mentioning.get(username, ()))
 
-        return floots[:count]
+    def get_trending_tags(self, count=10):
+        """
+        Returns a list of (hashtag, number of floots) pairs for the `count`
+        hashtags used by the most floots posted in the last hour, most used
+        first. Hashtags are lowercased and don't include the #.
+        """
+        with self._lock.reading():
+            self._user_indexes()
+            # Asking for the counts moves the window forwards, which changes
+            # the counter, so readers take turns like they do to build floots.
+            with self._load_lock:
+                return self._trending.top(count, timestamps.now())
+
+    def get_comments_by_user(self, username):
+        """
+        Returns a list of (Floot, FlootComment) pairs for every comment the
+        given user wrote. The pairs are sorted by floot, newest floot first,
+        and then by comment, oldest comment first.
+        """
+        # A floot's comments are always indexed together, in order, so each
+        # floot's list below is already oldest comment first.
+        comment_ids = {}
+        with self._lock.reading():
+            self._user_indexes()
+            for floot_id, comment_id in self._comments_by_user.get(username, {}):
+                comment_ids.setdefault(floot_id, []).append(comment_id)
+            floots = self._newest_first(comment_ids)
+        pairs = []
+        for floot in floots:
+            for comment_id in comment_ids[floot.get_id_raw()]:
+                try:
+                    pairs.append((floot, floot.get_comment_by_id(comment_id)))
+                except KeyError:
+                    # Deleted from the floot, but the floot hasn't been saved yet
+                    pass
+        return pairs
 
     def has_floot(self, floot_id):
         """
         Takes a floot ID and returns True if that ID exists in the database,
         and False if it does not.
         """
-        return floot_id in self._data
+        with self._lock.reading():
+            return self._has(pack_id(floot_id))
+
+    def _has(self, floot_id):
+        # A floot being loaded is in self._data before it leaves self._unloaded.
+        return floot_id in self._unloaded or floot_id in self._data
 
     def get_floot_by_id(self, floot_id):
         """
@@ -79,7 +1245,8 @@ class Database:
         are unique. Raises a KeyError if no floot has the provided floot_id.
         """
         try:
-            return self._data[floot_id]
+            with self._lock.reading():
+                return self._get(pack_id(floot_id))
         except KeyError:
             raise KeyError(f"No floot with id {floot_id} in database")
 
@@ -92,19 +1259,39 @@ class Database:
         You will also need to call this method to re-save a floot if you add or
         remove comments from that Floot.
         """
-        self._data[floot.get_id()] = floot
-        self._write_data_to_file()
+        self._commit(lambda: self._put(floot),
+                     lambda: {LOG_OP: LOG_OP_SAVE, LOG_FLOOT: floot.to_record()})
+
+    def save_floots(self, floots):
+        """
+        Saves many floots at once, the same as calling save_floot on each of
+        them but much faster: the data file is written once, with all of them
+        in it, and a crash part way through saves none of them.
+
+        STUDENTS: You don't need to use this method.
+        """
+        floots = list(floots)
+        with self._io_lock:
+            # Replaying the journal over a data file that already has these
+            # floots could bring back older versions of them, so fold it in
+            # first; after that nothing is journaled until they are on disk.
+            if self._journal and self._log_records:
+                self._write_snapshot()
+            with self._lock.writing():
+                self._put_many(floots)
+            self._write_snapshot()
 
     def delete_floot_by_id(self, floot_id):
         """
         Attempts to delete the floot with provided id.  Raises a KeyError if
         provided id doesn't exist in the database.
         """
-        try:
-            del self._data[floot_id]
-            self._write_data_to_file()
-        except:
-            raise KeyError(f"No floot with id {floot_id} in database")
+        def remove():
+            try:
+                self._remove(pack_id(floot_id))
+            except KeyError:
+                raise KeyError(f"No floot with id {floot_id} in database")
+        self._commit(remove, lambda: {LOG_OP: LOG_OP_DELETE, LOG_FLOOT_ID: floot_id})
 
     def delete_floot(self, floot):
         """
@@ -5,23 +5,92 @@ read the method headers and their associated method comments to understand how
 to use the Floot class.
 """
 
-import uuid
+import json
+import sys
+import threading
+from itertools import islice
 from datetime import datetime, timezone
+from json.encoder import encode_basestring_ascii
 from floot_comment import FlootComment
+from ids import new_id, pack_id, format_id
+import timestamps
+
+# Guards the comments and likes of every Floot, so that a Floot can be changed
+# by one thread while others read it. One lock shared by all Floots is plenty,
+# since it is only ever held for a moment, and keeps each Floot small.
+_lock = threading.RLock()
+
+def _json_list(items, newline):
+    # Lays out already encoded items the way json.dumps(..., indent=4) does,
+    # where newline is the line break plus the list's own indentation.
+    if not items:
+        return "[]"
+    inner = newline + "    "
+    return "[" + inner + ("," + inner).join(items) + newline + "]"
+
+def _json_comment(comment):
+    # Lays out a comment's dictionary the way json.dumps(..., indent=4) does
+    # inside a list inside a floot's dictionary. Raises a TypeError if any of
+    # its keys or values isn't a string.
+    return "{\n            " + ",\n            ".join(
+            [encode_basestring_ascii(key) + ": " + encode_basestring_ascii(value)
+             for key, value in comment.items()]) + "\n        }"
+
+class FlootSummary(dict):
+    """
+    The dictionary returned by Floot.to_summary. It also remembers the
+    floot's exact timestamp, so that Database.get_cursor works on it just like
+    on a Floot.
+    """
+    __slots__ = ("_timestamp",)
+
+    def get_id(self):
+        return self[Floot.FLOOT_ID]
+
+    def get_timestamp_micros(self):
+        return self._timestamp
+
+    def to_json(self):
+        """
+        Returns json.dumps(self, indent=4), only faster (see Floot._encode).
+        """
+        members = []
+        try:
+            for key, value in self.items():
+                if type(value) is str:
+                    value = encode_basestring_ascii(value)
+                elif type(value) is int:
+                    value = str(value)
+                elif key == Floot.COMMENTS:
+                    value = _json_list([_json_comment(comment) for comment in value], "\n    ")
+                else:
+                    raise TypeError(f"Unexpected {key!r} in summary")
+                members.append(encode_basestring_ascii(key) + ": " + value)
+        except TypeError:
+            return json.dumps(self, indent=4)
+        return "{\n    " + ",\n    ".join(members) + "\n}"
 
 class Floot:
+    # Floots are kept in memory by the hundreds of thousands, so they use
+    # slots instead of a per-object dictionary.
+    __slots__ = ("_message", "_username", "_liked_by", "_id", "_timestamp", "_comments",
+                 "_serialized")
 
-    DATE_FORMAT = "%a %b %d %H:%M:%S %Y"
+    DATE_FORMAT = timestamps.DATE_FORMAT
 
     # Floot Dictionary Constants
     FLOOT_ID = "id"
     MESSAGE = "message"
     TIMESTAMP = "timestamp"
+    # The exact timestamp (see get_timestamp_micros), which the database
+    # stores alongside TIMESTAMP (see to_record)
+    TIMESTAMP_MICROS = "timestamp_micros"
     FLOOT_USERNAME = "username"
     LIKED_BY = "liked_by"
     LIKED = "liked"
     LIKES = "likes"
     COMMENTS = "comments"
+    NUM_COMMENTS = "num_comments"
 
     def __init__(self, message, username, liked_by=None,
                  floot_id=None, timestamp=None, comments=None):
@@ -36,36 +105,55 @@ class Floot:
         code, but won't be useful to you.
         """
         self._message = message
-        self._username = username
-        self._liked_by = [] if liked_by is None else liked_by
+        # Usernames repeat across many floots, comments and likes, so only one
+        # copy of each is kept.
+        self._username = sys.intern(username)
+        # Users who like this Floot, in the order they liked it. The values
+        # are unused: the dict is an ordered set, so liking, unliking and
+        # checking for a like don't depend on how many likes there are.
+        self._liked_by = {} if liked_by is None else dict.fromkeys(map(sys.intern, liked_by))
 
         # Optionally set timestamp, floot_id, and comments if specified.
         # This option would only be used when Floots are being
         # recreated on reload of database. Students should NOT
         # use the constructor to set timestamp, floot_id, or comments.
-        if not timestamp:
-            self._timestamp = datetime.now()
+        # Timestamps are kept as integers (see timestamps.py), and may be
+        # given as one, as a datetime or as a string in DATE_FORMAT.
+        if timestamp is None:
+            self._timestamp = timestamps.now()
+        elif isinstance(timestamp, int):
+            self._timestamp = timestamp
+        elif isinstance(timestamp, datetime):
+            self._timestamp = timestamps.from_datetime(timestamp)
         else:
-            # Provided timestamp param is a string.
-            # Convert it to datetime object.
-            self._timestamp = datetime.strptime(timestamp, self.DATE_FORMAT)
+            self._timestamp = timestamps.parse_timestamp(timestamp)
 
         if not floot_id:
-            self._id = str(uuid.uuid4())
+            self._id = new_id()
         else:
-            self._id = floot_id
+            self._id = pack_id(floot_id)
 
-        if not comments:
-            self._comments = []
-        else:
-            self._comments = comments
+        # Comments by id, oldest first, so that they can be looked up and
+        # deleted by id without searching through all of them.
+        self._comments = {} if not comments else {c.get_id_raw(): c for c in comments}
+
+        # (dictionary, JSON) for this Floot (see to_json), once someone has
+        # asked for it. Every method that changes the Floot clears it.
+        self._serialized = None
 
     def get_timestamp(self):
         """Returns timestamp of when this Floot was created as a string."""
-        return self._timestamp.strftime(self.DATE_FORMAT)
+        return timestamps.format_timestamp(self._timestamp)
 
     def get_timestamp_raw(self):
         """Returns the timestamp of this Floot as a datetime object"""
+        return timestamps.to_datetime(self._timestamp)
+
+    def get_timestamp_micros(self):
+        """
+        Returns the timestamp of this Floot in the form it is kept in, as
+        microseconds since the epoch (see timestamps.py).
+        """
         return self._timestamp
 
     def get_comments(self):
@@ -74,12 +162,40 @@ class Floot:
         the returned list is of type FlootComment. The list is sorted from
         oldest to newest comment.
         """
-        return self._comments[:]
+        with _lock:
+            return list(self._comments.values())
+
+    def has_comment(self, comment_id):
+        """
+        Returns True if this Floot has a comment with the given id.
+        """
+        return pack_id(comment_id) in self._comments
+
+    def get_comment_by_id(self, comment_id):
+        """
+        Returns the comment (of type FlootComment) with the given id. Raises a
+        KeyError if this Floot has no such comment.
+        """
+        try:
+            return self._comments[pack_id(comment_id)]
+        except KeyError:
+            raise KeyError(f"No comment with id {comment_id} found in Floot with id {self.get_id()}")
 
     def get_id(self):
         """Returns this Floot's unique id (string)."""
+        return format_id(self._id)
+
+    def get_id_raw(self):
+        """
+        Returns this Floot's id in the compact form it is kept in (see
+        ids.py). STUDENTS: use get_id instead.
+        """
         return self._id
 
+    def get_message(self):
+        """Returns the text contained in this Floot."""
+        return self._message
+
     def get_username(self):
         """Returns the username of this Floot's creator."""
         return self._username
@@ -92,35 +208,51 @@ class Floot:
         this comment (and therefore isn't allowed to delete it), a
         PermissionError is raised.
         """
-        if comment not in self._comments:
-            raise KeyError(f"No comment with id {comment.get_id()} found in Floot with id {self._id}")
+        self.delete_comment_by_id(comment.get_id(), username)
 
-        if comment.get_author() != username:
-            raise PermissionError(f"Comment with id {comment.get_id()} has username {comment.get_author()} but {username} was provided")
+    def delete_comment_by_id(self, comment_id, username):
+        """
+        Same as delete_comment, but takes the id of the comment to delete.
+        """
+        with _lock:
+            comment = self.get_comment_by_id(comment_id)
+            if comment.get_author() != username:
+                raise PermissionError(f"Comment with id {comment.get_id()} has username {comment.get_author()} but {username} was provided")
 
-        self._comments.remove(comment)
+            del self._comments[comment.get_id_raw()]
+            self._serialized = None
 
     def create_comment(self, comment):
         """
         Adds comment (of type FlootComment) to this Floot.
         """
-        self._comments.append(comment)
+        with _lock:
+            self._comments[comment.get_id_raw()] = comment
+            self._serialized = None
 
     def set_liked(self, user, liked):
         """
         Notes that the given user likes (or doesn't like) this Floot.
         """
-        already_liked = user in self._liked_by
-        if already_liked and not liked:
-            self._liked_by.remove(user)
-        elif not already_liked and liked:
-            self._liked_by.append(user)
+        with _lock:
+            if liked:
+                self._liked_by.setdefault(sys.intern(user))
+            else:
+                self._liked_by.pop(user, None)
+            self._serialized = None
+
+    def is_liked_by(self, user):
+        """
+        Returns True if the given user likes this Floot.
+        """
+        return user in self._liked_by
 
     def get_liked_by(self):
         """
         Returns a list of users who like this Floot.
         """
-        return self._liked_by[:]
+        with _lock:
+            return list(self._liked_by)
 
     def get_num_likes(self):
         """
@@ -128,31 +260,168 @@ class Floot:
         """
         return len(self._liked_by)
 
-    def to_dictionary(self):
+    def to_dictionary(self, shared=False):
         """
         Returns a dictionary where the keys are field names and the values are
         the values of the fields. Use this if you want a dictionary
         representing a Floot.
+
+        (With shared=True, returns the dictionary cached along with to_json
+        instead of a new one. That is faster, but the dictionary must not be
+        modified. STUDENTS: You don't need to use this.)
+        """
+        if shared:
+            return self._serialize()[0]
+        with _lock:
+            return {
+                self.FLOOT_ID:       self.get_id(),
+                self.MESSAGE:        self._message,
+                self.TIMESTAMP:      self.get_timestamp(),
+                self.FLOOT_USERNAME: self._username,
+                self.LIKED_BY:       list(self._liked_by),
+                self.COMMENTS:       [comm.to_dictionary() for comm in self._comments.values()]
+            }
+
+    def to_record(self):
+        """
+        Returns the dictionary the database stores for this Floot: the same as
+        to_dictionary, plus the exact timestamp (TIMESTAMP_MICROS), since the
+        TIMESTAMP string only goes down to the second.
+
+        STUDENTS: You don't need to use this method.
+        """
+        dictionary = self.to_dictionary()
+        record = {}
+        for key, value in dictionary.items():
+            record[key] = value
+            if key == self.TIMESTAMP:
+                record[self.TIMESTAMP_MICROS] = self._timestamp
+        return record
+
+    def to_record_json(self):
+        """
+        Returns to_record() encoded as JSON, formatted like to_json.
+
+        STUDENTS: You don't need to use this method.
+        """
+        return self._encode(self.to_record())
+
+    def to_summary(self, comments=0, viewer=None):
+        """
+        Returns a smaller dictionary than to_dictionary, for showing the Floot
+        in a feed: the Floot's id, message, timestamp and username, how many
+        likes ("likes") and comments ("num_comments") it has, and its first
+        `comments` comments (oldest first, as dictionaries). Its size doesn't
+        depend on how many people liked or commented on the Floot.
+
+        If viewer (a username) is given, the summary also says whether that
+        user likes the Floot ("liked").
+        """
+        with _lock:
+            summary = FlootSummary({
+                self.FLOOT_ID:       self.get_id(),
+                self.MESSAGE:        self._message,
+                self.TIMESTAMP:      self.get_timestamp(),
+                self.FLOOT_USERNAME: self._username,
+                self.LIKES:          len(self._liked_by),
+                self.NUM_COMMENTS:   len(self._comments),
+            })
+            if comments > 0:
+                summary[self.COMMENTS] = [comment.to_dictionary() for comment
+                                          in islice(self._comments.values(), comments)]
+            if viewer is not None:
+                summary[self.LIKED] = viewer in self._liked_by
+        summary._timestamp = self._timestamp
+        return summary
+
+    def to_feed_entry(self, viewer=None, liked_by=True):
+        """
+        Returns this Floot's dictionary and JSON (see to_json) as the feed
+        sends them. If viewer (a username) is given, they also say whether
+        that user likes the Floot ("liked"), and with liked_by=False they
+        leave out the list of users who like it.
+
+        Both are made from the cached ones without encoding the Floot again;
+        the dictionary must not be modified. STUDENTS: You don't need to use
+        this method.
         """
-        return {
-            self.FLOOT_ID:       self._id,
-            self.MESSAGE:        self._message,
-            self.TIMESTAMP:      self.get_timestamp(),
-            self.FLOOT_USERNAME: self._username,
-            self.LIKED_BY:       self._liked_by,
-            self.COMMENTS:       [comm.to_dictionary() for comm in self._comments]
-        }
+        dictionary, text = self._serialize()
+        if viewer is None and liked_by:
+            return dictionary, text
+        # The cached dictionary is shared, so change a copy.
+        dictionary = dict(dictionary)
+        if not liked_by:
+            del dictionary[self.LIKED_BY]
+            # Keys only sit at this indentation at the top level, and JSON
+            # strings can't contain line breaks, so these can't be mistaken.
+            start = text.index('\n    "liked_by": ')
+            text = text[:start] + text[text.index('\n    "comments": ', start):]
+        if viewer is not None:
+            liked = viewer in self._liked_by
+            dictionary[self.LIKED] = liked
+            # Add it as the last member, where json.dumps would put it.
+            text = text[:-len("\n}")] + (',\n    "liked": true\n}' if liked
+                                         else ',\n    "liked": false\n}')
+        return dictionary, text
+
+    def to_json(self, cache=True):
+        """
+        Returns this Floot's dictionary (see to_dictionary) encoded as JSON,
+        formatted like json.dumps(..., indent=4). The text is kept until the
+        Floot changes, so asking again is free; pass cache=False for one-off
+        uses that shouldn't hold on to it.
+
+        STUDENTS: You don't need to use this method.
+        """
+        return self._serialize(cache)[1]
+
+    def _serialize(self, cache=True):
+        with _lock:
+            serialized = self._serialized
+            if serialized is None:
+                dictionary = self.to_dictionary()
+                serialized = (dictionary, self._encode(dictionary))
+                if cache:
+                    self._serialized = serialized
+            return serialized
+
+    @staticmethod
+    def _encode(dictionary):
+        """
+        Returns json.dumps(dictionary, indent=4) for a dictionary from
+        to_dictionary. json.dumps only uses its C speedups when it isn't
+        indenting, and writing out a big data file spends most of its time
+        here, so the layout is done by hand and only the strings are left to
+        the json module.
+        """
+        quote = encode_basestring_ascii
+        try:
+            comments = [_json_comment(comment) for comment in dictionary[Floot.COMMENTS]]
+            micros = dictionary.get(Floot.TIMESTAMP_MICROS)
+            return ("{\n    \"id\": " + quote(dictionary[Floot.FLOOT_ID])
+                    + ",\n    \"message\": " + quote(dictionary[Floot.MESSAGE])
+                    + ",\n    \"timestamp\": " + quote(dictionary[Floot.TIMESTAMP])
+                    + ("" if micros is None
+                       else ",\n    \"timestamp_micros\": " + str(int(micros)))
+                    + ",\n    \"username\": " + quote(dictionary[Floot.FLOOT_USERNAME])
+                    + ",\n    \"liked_by\": "
+                    + _json_list([quote(user) for user in dictionary[Floot.LIKED_BY]], "\n    ")
+                    + ",\n    \"comments\": " + _json_list(comments, "\n    ")
+                    + "\n}")
+        except TypeError:
+            # Something other than a string where one was expected
+            return json.dumps(dictionary, indent=4)
 
     @staticmethod
     def from_dictionary(floot_dict):
         """
-        Opposite of to_dictionary.
+        Opposite of to_dictionary (and to_record).
 
         STUDENTS: You don't need to use this method.
         """
         floot_id = floot_dict[Floot.FLOOT_ID]
         message = floot_dict[Floot.MESSAGE]
-        timestamp = floot_dict[Floot.TIMESTAMP]
+        timestamp = Floot.stored_timestamp(floot_dict)
         username = floot_dict[Floot.FLOOT_USERNAME]
         liked_by = floot_dict[Floot.LIKED_BY]
 
@@ -161,6 +430,20 @@ class Floot:
 
         return Floot(message, username, liked_by, floot_id, timestamp, comments)
 
+    @staticmethod
+    def stored_timestamp(floot_dict):
+        """
+        Returns the timestamp of the floot a dictionary from to_record (or
+        to_dictionary) describes: the exact one if it is there, or else the
+        TIMESTAMP string's.
+
+        STUDENTS: You don't need to use this method.
+        """
+        micros = floot_dict.get(Floot.TIMESTAMP_MICROS)
+        if isinstance(micros, int):
+            return micros
+        return timestamps.parse_timestamp(floot_dict[Floot.TIMESTAMP])
+
     def __str__(self):
         return "<Floot(" + str(self.to_dictionary()) + ")>"
 
@@ -6,9 +6,13 @@ method comments to understand how to use this class.
 """
 
 from datetime import datetime, timezone
-import uuid
+import sys
+from ids import new_id, pack_id, format_id
 
 class FlootComment:
+    # See Floot.
+    __slots__ = ("_message", "_author", "_id")
+
     # Dictionary constants
     COMMENT_ID = "id"
     COMMENT_TEXT = "message"
@@ -24,20 +28,31 @@ class FlootComment:
         Ignore the comment_id parameter; it will be created for you.
         """
         self._message = message
-        self._author = author
+        self._author = sys.intern(author)
 
         # Optionally set comment id if specified.  This option would only be
         # used when FlootComments are being recreated on reload of database.
         # Students should NOT use these options to set comment_id.
         if not comment_id:
-            self._id = str(uuid.uuid4())
+            self._id = new_id()
         else:
-            self._id = comment_id
+            self._id = pack_id(comment_id)
 
     def get_id(self):
         """Returns the id of this comment (string)."""
+        return format_id(self._id)
+
+    def get_id_raw(self):
+        """
+        Returns this comment's id in the compact form it is kept in (see
+        ids.py). STUDENTS: use get_id instead.
+        """
         return self._id
 
+    def get_message(self):
+        """Returns the text of this comment."""
+        return self._message
+
     def get_author(self):
         """
         Returns the author of this comment (i.e. username of the person who
@@ -52,7 +67,7 @@ class FlootComment:
         representing a FlootComment.
         """
         return {
-            self.COMMENT_ID:     self._id,
+            self.COMMENT_ID:     self.get_id(),
             self.COMMENT_TEXT:   self._message,
             self.COMMENT_AUTHOR: self._author
         }
@@ -70,7 +85,7 @@ class FlootComment:
         return FlootComment(message, author, comment_id)
 
     def __str__(self):
-        return f"<FlootComment({self._message}, {self._author}, {self._id})>"
+        return f"<FlootComment({self._message}, {self._author}, {self.get_id()})>"
 
     def __repr__(self):
         return str(self)
@@ -1,3 +1,5 @@
+import json
+
 class Response:
     """
     This class allows you to send a response to the client with a custom
@@ -5,9 +7,18 @@ class Response:
 
     STUDENTS: You almost definitely won't need to use this.
     """
-    def __init__(self, body, content_type="text/html"):
+    def __init__(self, body, content_type="text/html", status=200, headers=None):
         self.body = body
         self.content_type = content_type
+        # The status code, and any other headers (a dict) to send
+        self.status = status
+        self.headers = headers or {}
+
+    def get_status(self):
+        return self.status
+
+    def get_headers(self):
+        return self.headers
 
     def get_body(self):
         return self.body
@@ -20,3 +31,48 @@ class Response:
 
     def get_content_type(self):
         return self.content_type
+
+
+class JSONFragments(list):
+    """
+    A list of dictionaries that were already encoded as JSON (e.g. with
+    Floot.to_json). It can be used like any other list, but encode_json
+    copies the pre-encoded text into its output instead of encoding the
+    dictionaries again, so it must not be changed after it is created.
+
+    STUDENTS: You don't need to use this.
+    """
+    def __init__(self, items, fragments):
+        super().__init__(items)
+        self.fragments = fragments
+
+def encode_json(value):
+    """
+    Same as json.dumps(value, indent=4), except that JSONFragments anywhere in
+    value (inside dicts and lists) are spliced in from their fragments.
+    """
+    return _encode_json(value, "\n")
+
+def _encode_json(value, newline):
+    # newline is the line break plus indentation at the current depth.
+    inner = newline + "    "
+    if isinstance(value, JSONFragments):
+        parts = [fragment.replace("\n", inner) for fragment in value.fragments]
+        brackets = "[]"
+    elif isinstance(value, dict) and _has_fragments(value.values()):
+        parts = [json.dumps(key) + ": " + _encode_json(item, inner) for key, item in value.items()]
+        brackets = "{}"
+    elif isinstance(value, list) and _has_fragments(value):
+        parts = [_encode_json(item, inner) for item in value]
+        brackets = "[]"
+    else:
+        return json.dumps(value, indent=4).replace("\n", newline)
+    if not parts:
+        return brackets
+    return brackets[0] + inner + ("," + inner).join(parts) + newline + brackets[1]
+
+def _has_fragments(items):
+    return any(isinstance(item, JSONFragments)
+               or (isinstance(item, (dict, list)) and _has_fragments(
+                       item.values() if isinstance(item, dict) else item))
+               for item in items)
@@ -0,0 +1,216 @@
+"""
+This file exports a SearchIndex class: an inverted index over the text of
+floots and their comments, which Database uses to answer searches without
+looking at every floot. For every word, the index keeps the floots that
+contain it (the word's postings), so a search only has to look at the
+postings of the words it asks for.
+
+A search matches the floots that contain every word of the query. A word
+ending in * is a prefix, and matches any word that starts with it ("flut*"
+matches "flutter" and "flutterer"). Results are ranked by how often the
+words appear (in the message more than in comments), weighed by how rare each
+word is, and then newest first.
+
+STUDENTS: You don't need to read anything in this file.
+"""
+
+import bisect
+import heapq
+import math
+import re
+
+_WORD = re.compile(r"\w+")
+_QUERY_WORD = re.compile(r"(\w+)(\*?)")
+# Sorts after every character a word can contain, so that the words starting
+# with a prefix are the ones from prefix up to prefix + _LAST_CHARACTER
+_LAST_CHARACTER = "\U0010ffff"
+
+# How much one occurrence of a word counts for, in the floot's message and in
+# one of its comments
+MESSAGE_WEIGHT = 2
+COMMENT_WEIGHT = 1
+
+def tokenize(text):
+    """
+    Returns the words in text, lowercased.
+    """
+    return _WORD.findall(text.casefold())
+
+def parse_query(query):
+    """
+    Returns a list of (word, is_prefix) pairs for the words in a query.
+    """
+    return [(word, star == "*") for word, star in _QUERY_WORD.findall(query.casefold())]
+
+def document_terms(message, comments):
+    """
+    Returns what the index records about a floot with the given message and
+    comments (strings): a dictionary from each word in them to its weight.
+    """
+    terms = {}
+    for word in tokenize(message):
+        terms[word] = terms.get(word, 0) + MESSAGE_WEIGHT
+    for comment in comments:
+        for word in tokenize(comment):
+            terms[word] = terms.get(word, 0) + COMMENT_WEIGHT
+    return terms
+
+class SearchIndex:
+    def __init__(self):
+        """
+        Creates an empty SearchIndex. Documents (floots) are identified by
+        any hashable id.
+        """
+        # Word -> {document id: weight}
+        self._postings = {}
+        # Every word in self._postings, sorted, to find the words that start
+        # with a prefix
+        self._terms = []
+        # Document id -> (timestamp, words and weights), to take a document
+        # back out of the index when it changes
+        self._documents = {}
+
+    @classmethod
+    def build(cls, documents):
+        """
+        Returns a SearchIndex holding documents, an iterable of (id,
+        timestamp, terms) triples where terms is from document_terms. Faster
+        than calling add for each of them.
+        """
+        index = cls()
+        postings = index._postings
+        for doc_id, timestamp, terms in documents:
+            index._documents[doc_id] = (timestamp, terms)
+            for term, weight in terms.items():
+                postings.setdefault(term, {})[doc_id] = weight
+        index._terms = sorted(postings)
+        return index
+
+    def to_json(self):
+        """
+        Returns the contents of the index in a form that json.dumps can save
+        and build (after json.loads) can read back.
+        """
+        return [[doc_id, timestamp, terms]
+                for doc_id, (timestamp, terms) in self._documents.items()]
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add(self, doc_id, timestamp, terms):
+        """
+        Adds a document to the index, replacing any earlier version of it.
+        terms is from document_terms.
+        """
+        old = self._documents.get(doc_id)
+        if old is not None:
+            if old == (timestamp, terms):
+                return
+            self.remove(doc_id)
+        self._documents[doc_id] = (timestamp, terms)
+        for term, weight in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[doc_id] = weight
+
+    def remove(self, doc_id):
+        """
+        Removes a document from the index, if it is there.
+        """
+        _, terms = self._documents.pop(doc_id, (None, ()))
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _expand(self, word, prefix):
+        """
+        Returns the words in the index that a query word matches.
+        """
+        if not prefix:
+            return [word] if word in self._postings else []
+        start = bisect.bisect_left(self._terms, word)
+        end = bisect.bisect_left(self._terms, word + _LAST_CHARACTER, start)
+        return self._terms[start:end]
+
+    def _scores(self, match):
+        """
+        Returns the score of every document in a match (see search).
+        """
+        if len(match) == 1:
+            postings, rarity = match[0]
+            return {doc_id: weight * rarity for doc_id, weight in postings.items()}
+        scores = {}
+        for postings, rarity in match:
+            for doc_id, weight in postings.items():
+                # A document matching a prefix several times over only counts
+                # its best match.
+                score = weight * rarity
+                if score > scores.get(doc_id, 0):
+                    scores[doc_id] = score
+        return scores
+
+    def search(self, query, count=None):
+        """
+        Returns the ids of the documents that match query (see the top of this
+        file), best match first, and at most count of them.
+        """
+        words = parse_query(query)
+        if not words or count is not None and count <= 0:
+            return []
+
+        # For each query word, (postings, rarity) for every word in the index
+        # that it matches
+        matches = []
+        for word, prefix in words:
+            terms = self._expand(word, prefix)
+            if not terms:
+                return []
+            matches.append([(self._postings[term],
+                             math.log(1 + len(self._documents) / len(self._postings[term])))
+                            for term in terms])
+
+        # Start from the query word with the fewest postings, and then only
+        # look up the documents that are still in the running in the
+        # postings of the others.
+        matches.sort(key=lambda match: sum(len(postings) for postings, _ in match))
+        if len(matches) == 1 and len(matches[0]) == 1:
+            # A single word, matching a single word in the index: every score
+            # would be the document's weight times the same rarity, so the
+            # weights rank the documents just as well, without a copy of the
+            # postings.
+            totals = matches[0][0][0]
+        else:
+            totals = self._scores(matches[0])
+        for match in matches[1:]:
+            if len(totals) * len(match) < sum(len(postings) for postings, _ in match):
+                for doc_id in list(totals):
+                    best = max(postings.get(doc_id, 0) * rarity for postings, rarity in match)
+                    if best:
+                        totals[doc_id] += best
+                    else:
+                        del totals[doc_id]
+            else:
+                scores = self._scores(match)
+                totals = {doc_id: total + scores[doc_id]
+                          for doc_id, total in totals.items() if doc_id in scores}
+
+        documents = self._documents
+        if count is None:
+            return sorted(totals, key=lambda doc_id: (totals[doc_id], documents[doc_id][0]),
+                          reverse=True)
+        # A broad query matches most documents, so this is kept to plain
+        # tuples that heapq compares without calling back into Python. Ties
+        # are broken by position rather than by id, since ids may not be
+        # comparable with each other. Documents are looked at in the reverse
+        # of the order they were added, which is usually newest first, so
+        # that the heap seldom needs to change.
+        doc_ids = list(reversed(totals))
+        best = heapq.nlargest(count, zip([totals[doc_id] for doc_id in doc_ids],
+                                         [documents[doc_id][0] for doc_id in doc_ids],
+                                         range(len(doc_ids))))
+        return [doc_ids[position] for _, _, position in best]
@@ -7,18 +7,48 @@ STUDENTS: You're welcome to look around this file if you're interested, but you
 don't need to, and you certainly don't need to modify anything here.
 """
 
+import argparse
+import functools
+import inspect
 import json
-import re
+import queue
+import signal
+import threading
 import time
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
 
 import api
 from colorama import Fore, Style, init
 from error import HTTPError
-from response import Response
+from response import Response, encode_json
+from router import Router
 
 SERVER_PORT = 1066
 
+# How many requests are handled at once, and how many more can wait for a
+# free worker before new ones are turned away with a 503 (see PooledHTTPServer)
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE_SIZE = 64
+# How many connections the operating system holds for the server before it
+# accepts them. Beyond this, new clients have to retry connecting, which takes
+# them a second or more.
+LISTEN_BACKLOG = 128
+# How long (in seconds) clients are asked to wait before retrying after a 503
+RETRY_AFTER = 1
+# How long (in seconds) a connection may sit idle waiting for its next request,
+# and how many requests it may make before the server closes it. An idle
+# connection holds on to a worker, so this is kept short.
+KEEP_ALIVE_TIMEOUT = 5
+MAX_KEEP_ALIVE_REQUESTS = 100
+# The share of PooledHTTPServer's workers that connections may hold on to
+# between requests. The others only ever answer one request per connection,
+# so they stay free for new clients however many connections are kept open.
+KEEP_ALIVE_SHARE = 0.5
+# How long (in seconds) shutting down waits for each worker to finish the
+# requests it already accepted
+SHUTDOWN_TIMEOUT = 10
+
 def flutterer_print(*args, **kwargs):
     timestamp = time.strftime("%I:%M:%S %p").lower()
     print(f"{Fore.LIGHTBLACK_EX}{timestamp}{Style.RESET_ALL} {Fore.LIGHTBLUE_EX}[Flutterer]{Style.RESET_ALL}",
@@ -34,28 +64,139 @@ def print_green(msg):
 def print_red(msg):
     flutterer_print(f"{Fore.RED}{msg}{Style.RESET_ALL}")
 
-def find_route(path, route_list):
-    for route in route_list:
-        criteria = route[0]
-        handler = route[1]
-        if isinstance(criteria, str):
-            if path == criteria:
-                # Route takes no args, so return empty args dict
-                return (handler, {})
-        elif isinstance(criteria, tuple):
-            if re.fullmatch("^" + criteria[0] + "$", path):
-                arg_names = criteria[1:]
-                match = re.findall("^" + criteria[0] + "$", path)[0]
-                match_components = match if isinstance(match, tuple) else (match,)
-                return (handler, dict(zip(arg_names, match_components)))
-        else:
-            raise TypeError(f"route[0] has unknown type: {route}")
+# The routes in api.py, compiled for each HTTP method (see router.py)
+ROUTERS = {
+    "GET": Router(api.GET_ROUTES),
+    "POST": Router(api.POST_ROUTES),
+}
+
+@functools.lru_cache(maxsize=None)
+def _accepted_params(handler):
+    return frozenset(inspect.signature(handler).parameters)
+
+def add_query_params(handler, args, query):
+    """
+    Adds the parameters from a query string (e.g. "limit=20&before=abc") to
+    args, but only those that the handler function accepts as arguments and
+    that aren't already set by the route. If a parameter is repeated, the last
+    value wins.
+    """
+    accepted = _accepted_params(handler)
+    for name, values in parse_qs(query).items():
+        if name in accepted and name not in args:
+            args[name] = values[-1]
+
+def service_request(method, target, extra_params=None, headers=None):
+    """
+    Finds the route for a request's method and target (path and query
+    string), calls its handler and returns what it returned as a Response.
+    Handlers that take a request_headers argument get headers, the request's
+    headers as a dict with lowercase names.
+    Raises an HTTPError for errors to send to the client (including ones the
+    handler returned), and lets any other exception through.
+
+    Both FluttererHandler and async_serve.py use this, so they answer every
+    request the same way.
+    """
+    router = ROUTERS.get(method)
+    if router is None:
+        raise HTTPError(501, f"Unsupported method ({method!r})")
+    path, _, query = target.partition("?")
+    route_match = router.find(path)
+    if not route_match:
+        raise HTTPError(404, "Matching route not found")
+    handler, args = route_match
+    if extra_params:
+        args.update(extra_params)
+    if query:
+        add_query_params(handler, args, query)
+    if headers is not None and "request_headers" in _accepted_params(handler):
+        args["request_headers"] = headers
+    return make_response(handler, handler(**args))
+
+def make_response(handler_function, output):
+    # These are the acceptable output types:
+    #
+    # * string (gets returned as plain text)
+    # * list or dict (gets serialized to JSON)
+    # * Response (gets written out with appropriate content type)
+    # * HTTPError (gets thrown as an exception, which is subsequently
+    #   caught and written as an error with appropriate status code)
+    #
+    # Anything else indicates the student is probably not doing what they
+    # meant to do, so we throw an exception.
+    if isinstance(output, str):
+        return Response(output, content_type="text/plain")
+    elif isinstance(output, list) or isinstance(output, dict):
+        return Response(encode_json(output), content_type="application/json")
+    elif isinstance(output, Response):
+        return output
+    elif isinstance(output, HTTPError):
+        raise output
+    else:
+        raise TypeError(f"Function {handler_function.__name__!r} returned unacceptable "
+                f"output: {output!r}\n"
+                "Your function should return one of these:\n"
+                " * A string (to be sent to the client as plain text)\n"
+                " * A list or dictionary (to be sent to the client as JSON)\n"
+                " * A Response object (if you are trying to send a specific content-type)\n"
+                " * An HTTPError (if you want to report an error to the client)")
+
+def check_post_content_type(ctype):
+    """
+    Raises an HTTPError unless a POST request's Content-Type is JSON.
+    """
+    # refuse to receive non-json content
+    if ctype != "application/json":
+        raise HTTPError(400,
+                "Error in serve.py: Expected the client to specify a content "
+                f"type of 'application/json', but got {ctype!r} instead.")
+
+def parse_post_body(body):
+    """
+    Converts the body of a POST request into a python dictionary, or raises
+    an HTTPError if it isn't JSON.
+    """
+    try:
+        return json.loads(body)
+    except json.JSONDecodeError:
+        raise HTTPError(400,
+                "Error in serve.py: The request body received from the client "
+                "is not valid JSON.")
+
+# The body sent with a 500 error, and the one sent with an HTTPError
+INTERNAL_ERROR_BODY = b"Unexpected server error (see terminal for details)"
+
+def http_error_body(e):
+    return bytes(f"Error: {e.message}", "utf-8")
 
 class FluttererHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests (when the server allows it, see
+    # _keep_alive), closing them after `timeout` seconds without a request
+    protocol_version = "HTTP/1.1"
+    timeout = KEEP_ALIVE_TIMEOUT
+    max_requests = MAX_KEEP_ALIVE_REQUESTS
+    # The headers and body are written separately; without this, the body
+    # waits for the client to acknowledge the headers, which on an open
+    # connection can take 40ms.
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         self._http_error = None
+        self._requests_handled = 0
+        # Whether this connection has one of the server's keep-alive places
+        # (see PooledHTTPServer.reserve_keep_alive)
+        self._kept_alive = False
         BaseHTTPRequestHandler.__init__(self, *args, **kwargs)
 
+    def finish(self):
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        finally:
+            if self._kept_alive:
+                self.server.release_keep_alive()
+                self._kept_alive = False
+
     def _log_request_start(self):
         # Print the first half of the log message, so students can see what the
         # request was if they print some debugging messages
@@ -67,106 +208,242 @@ class FluttererHandler(BaseHTTPRequestHandler):
         if self._http_error:
             msg += f": {self._http_error.message}"
             self._http_error = None
-        (print_green if code == 200 else print_red)(msg)
+        (print_green if code < 400 else print_red)(msg)
 
-    def _service_request(self, routes, extra_params=None):
+    def _service_request(self, extra_params=None):
         try:
-            route_match = find_route(self.path, routes)
-            if not route_match:
-                raise HTTPError(404, "Matching route not found")
-            handler, args = route_match
-            if extra_params:
-                args.update(extra_params)
-            output = handler(**args)
-            self._send_reponse(handler, output)
+            headers = {name.lower(): value for name, value in self.headers.items()}
+            self._send_reponse(service_request(self.command, self.path, extra_params, headers))
         except HTTPError as e:
             self._handle_http_error(e)
         except Exception:
             self._handle_internal_server_error()
             raise
 
-    def _send_reponse(self, handler_function, output):
-        # These are the acceptable output types:
-        #
-        # * string (gets returned as plain text)
-        # * list or dict (gets serialized to JSON)
-        # * Response (gets written out with appropriate content type)
-        # * HTTPError (gets thrown as an exception, which is subsequently
-        #   caught and written as an error with appropriate status code)
-        #
-        # Anything else indicates the student is probably not doing what they
-        # meant to do, so we throw an exception.
-        if isinstance(output, str):
-            output = Response(output, content_type="text/plain")
-        elif isinstance(output, list) or isinstance(output, dict):
-            output = Response(json.dumps(output, indent=4),
-                              content_type="application/json")
-        elif isinstance(output, Response):
-            # nothing to do here
-            pass
-        elif isinstance(output, HTTPError):
-            raise output
-        else:
-            raise TypeError(f"Function {handler_function.__name__!r} returned unacceptable "
-                    f"output: {output!r}\n"
-                    "Your function should return one of these:\n"
-                    " * A string (to be sent to the client as plain text)\n"
-                    " * A list or dictionary (to be sent to the client as JSON)\n"
-                    " * A Response object (if you are trying to send a specific content-type)\n"
-                    " * An HTTPError (if you want to report an error to the client)")
-
-        self.send_response(200)
-        self.send_header("Content-Type", output.get_content_type())
+    def _keep_alive(self):
+        """
+        Counts a request on this connection, and returns whether the
+        connection may stay open for another one.
+
+        Only PooledHTTPServer keeps connections open, since a single thread
+        would be stuck waiting on one client. Even then, a connection only
+        stays open if it gets one of the server's keep-alive places, and
+        while no other connection is waiting for a worker.
+        """
+        self._requests_handled += 1
+        if self._requests_handled >= self.max_requests \
+                or not isinstance(self.server, PooledHTTPServer):
+            return False
+        if not self._kept_alive:
+            self._kept_alive = self.server.reserve_keep_alive()
+        return self._kept_alive and not self.server.has_waiting_connections()
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        # (A 304 has no body, and leaves out the length of the one it stands for.)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection or not self._keep_alive():
+            # (This also sets self.close_connection.)
+            self.send_header("Connection", "close")
         self.end_headers()
-        self.wfile.write(output.get_body_bytes())
+        self.wfile.write(body)
+
+    def _send_reponse(self, output):
+        self._send(output.get_status(), output.get_content_type(), output.get_body_bytes(),
+                   output.get_headers())
 
     def _handle_internal_server_error(self):
-        self.send_response(500)
-        self.send_header("Content-Type", "text/plain")
-        self.end_headers()
-        self.wfile.write(bytes(f"Unexpected server error (see terminal for details)",
-                                "utf-8"))
+        # The exception is raised again after this, which ends the connection.
+        self.close_connection = True
+        self._send(500, "text/plain", INTERNAL_ERROR_BODY)
 
     def _handle_http_error(self, e):
         self._http_error = e
-        self.send_response(e.status)
-        self.send_header("Content-Type", "text/plain")
-        self.end_headers()
-        self.wfile.write(bytes(f"Error: {e.message}", "utf-8"))
+        self._send(e.status, "text/plain", http_error_body(e))
+
+    def _read_body(self):
+        """
+        Reads the body of the request. If its length is unknown, the rest of
+        the connection can't be read either, so it will be closed.
+        """
+        length = self.headers["Content-Length"]
+        if length is None:
+            self.close_connection = True
+            raise HTTPError(411, "Error in serve.py: The request has no Content-Length.")
+        try:
+            length = int(length)
+            if length < 0:
+                raise ValueError
+        except ValueError:
+            self.close_connection = True
+            raise HTTPError(400, f"Error in serve.py: Bad Content-Length {length!r}.")
+        return self.rfile.read(length)
 
     def do_GET(self):
         self._log_request_start()
-        self._service_request(api.GET_ROUTES)
+        self._service_request()
 
     # Handles POST requests
     def do_POST(self):
         self._log_request_start()
-
-        ctype = self.headers["Content-Type"]
-
-        # refuse to receive non-json content
-        if ctype != "application/json":
-            self._handle_http_error(HTTPError(400,
-                    "Error in serve.py: Expected the client to specify a content "
-                    f"type of 'application/json', but got {ctype!r} instead."))
-            return
-
-        # read the message and convert it into a python dictionary
-        length = int(self.headers["Content-Length"])
         try:
-            info = json.loads(self.rfile.read(length))
-        except json.JSONDecodeError:
-            self._handle_http_error(HTTPError(400,
-                    "Error in serve.py: The request body received from the client "
-                    "is not valid JSON."))
+            # Read the body even if it will be refused, so that the next
+            # request on the connection starts in the right place
+            body = self._read_body()
+            check_post_content_type(self.headers["Content-Type"])
+            # convert the message into a python dictionary
+            info = parse_post_body(body)
+        except HTTPError as e:
+            self._handle_http_error(e)
             return
 
-        self._service_request(api.POST_ROUTES, {
+        self._service_request({
             "request_body": info,
         })
 
-if __name__ == "__main__":
+class PooledHTTPServer(HTTPServer):
+    """
+    An HTTPServer that hands each connection to one of a fixed number of
+    worker threads, so that a slow request (or a slow client) only holds up
+    its own worker instead of the whole server. Accepted connections wait in
+    a bounded queue for a free worker; when the queue is full, new
+    connections get an immediate 503 rather than piling up. server_close()
+    stops accepting connections and lets the workers finish every connection
+    that was already accepted.
+
+    A worker stays with a kept-alive connection while it waits for its next
+    request, so only keep_alive connections (KEEP_ALIVE_SHARE of the workers
+    unless given) are kept open at once; the rest are closed after each
+    response, leaving workers free for other clients.
+    """
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, keep_alive=None):
+        super().__init__(server_address, handler_class)
+        self._keep_alive_places = int(workers * KEEP_ALIVE_SHARE) if keep_alive is None \
+                else keep_alive
+        self._kept_alive = 0
+        self._keep_alive_lock = threading.Lock()
+        self._requests = queue.Queue(queue_size)
+        self._workers = [threading.Thread(target=self._work, daemon=True)
+                         for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        # Called by serve_forever for every connection it accepts
+        try:
+            self._requests.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject_request(request, client_address)
+
+    def reserve_keep_alive(self):
+        """
+        Takes one of the places for connections kept open between requests,
+        if there is one free, and returns whether it did. The handler gives
+        it back with release_keep_alive once the connection is closed.
+        """
+        with self._keep_alive_lock:
+            if self._kept_alive >= self._keep_alive_places:
+                return False
+            self._kept_alive += 1
+            return True
+
+    def release_keep_alive(self):
+        with self._keep_alive_lock:
+            self._kept_alive -= 1
+
+    def has_waiting_connections(self):
+        """
+        Returns whether any accepted connections are waiting for a worker.
+        """
+        return not self._requests.empty()
+
+    def _work(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def reject_request(self, request, client_address):
+        """
+        Answers a connection with a 503 without reading the request, because
+        every worker is busy and the queue is full.
+        """
+        print_red(f"  -> 503 Service Unavailable: server busy, turned away {client_address[0]}")
+        body = b"Error: The server is too busy right now. Please try again."
+        try:
+            request.settimeout(RETRY_AFTER)
+            request.sendall(b"HTTP/1.0 503 Service Unavailable\r\n"
+                            b"Content-Type: text/plain\r\n"
+                            + f"Content-Length: {len(body)}\r\n"
+                              f"Retry-After: {RETRY_AFTER}\r\n"
+                              "Connection: close\r\n\r\n".encode("ascii")
+                            + body)
+            # Read whatever part of the request has already arrived, since
+            # closing a socket with unread data makes some clients miss the
+            # response.
+            request.setblocking(False)
+            request.recv(65536)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Workers finish what is queued before getting to these.
+        for _ in self._workers:
+            try:
+                self._requests.put(None, timeout=SHUTDOWN_TIMEOUT)
+            except queue.Full:
+                break
+        for worker in self._workers:
+            worker.join(SHUTDOWN_TIMEOUT)
+
+def _stop_serving(signum, frame):
+    # Lets SIGTERM shut the server down as gracefully as Ctrl-C does
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the Flutterer server.")
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Requests handled at once (0 handles one request at a time "
+                             "on a single thread, without a queue or keep-alive)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Requests that can wait for a worker before the server "
+                             "answers with 503 (0 for no limit)")
+    args = parser.parse_args()
+
     init()  # initialize terminal color support
-    server = HTTPServer(("0.0.0.0", SERVER_PORT), FluttererHandler)
-    flutterer_print(f"Listening for requests at http://localhost:{SERVER_PORT}")
-    server.serve_forever()
+    api.db = api.open_database()
+    if args.workers > 0:
+        server = PooledHTTPServer(("0.0.0.0", args.port), FluttererHandler,
+                                  args.workers, args.queue_size)
+    else:
+        server = HTTPServer(("0.0.0.0", args.port), FluttererHandler)
+    signal.signal(signal.SIGTERM, _stop_serving)
+    flutterer_print(f"Listening for requests at http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        flutterer_print("Shutting down")
+    finally:
+        server.server_close()
+        api.db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+This file exports a SQLiteDatabase class, which stores Floots in a SQLite
+database instead of a JSON file. It has the same public methods as Database,
+and you get one by passing a SQLite path or URL to Database:
+
+database = Database("sqlite:///path/to/flutterer.db")
+
+Unlike Database, nothing is kept in memory: every method reads from or writes
+to the SQLite file, so the data set doesn't need to fit in RAM. Floots,
+comments and likes are stored in separate tables, and searches use SQLite's
+built-in full-text search (FTS5), so the SQLite library Python uses must
+include it (most do; opening the database says so if it doesn't). The hashtags
+and mentions in each message (see tags.py) are picked out when the floot is
+saved and stored in tables of their own.
+
+STUDENTS: You don't need to read anything in this file.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime
+
+from database import SQLITE_URL_PREFIX, TRENDING_BUCKET, TRENDING_BUCKETS, \
+        make_cursor, parse_cursor
+import timestamps
+from timestamps import to_datetime, from_datetime, format_timestamp
+from floot import Floot, FlootSummary
+from floot_comment import FlootComment
+from search import parse_query, MESSAGE_WEIGHT, COMMENT_WEIGHT
+from tags import extract_tags, normalize_tag
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS floots (
+    id TEXT PRIMARY KEY,
+    message TEXT NOT NULL,
+    username TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS floots_by_timestamp ON floots (timestamp, id);
+CREATE INDEX IF NOT EXISTS floots_by_username ON floots (username);
+
+-- A comment's id only needs to be unique within its floot, as in data.json
+CREATE TABLE IF NOT EXISTS comments (
+    floot_id TEXT NOT NULL REFERENCES floots (id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    username TEXT NOT NULL,
+    PRIMARY KEY (floot_id, id)
+);
+CREATE INDEX IF NOT EXISTS comments_by_floot ON comments (floot_id, position);
+CREATE INDEX IF NOT EXISTS comments_by_username ON comments (username);
+
+CREATE TABLE IF NOT EXISTS likes (
+    floot_id TEXT NOT NULL REFERENCES floots (id) ON DELETE CASCADE,
+    username TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (floot_id, username)
+);
+CREATE INDEX IF NOT EXISTS likes_by_username ON likes (username);
+
+-- Full-text search over each floot's message and comments. A floot's row in
+-- search has the rowid given to it in search_rows.
+CREATE TABLE IF NOT EXISTS search_rows (
+    row INTEGER PRIMARY KEY,
+    floot_id TEXT NOT NULL UNIQUE
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (message, comments);
+
+-- Hashtags (lowercased, without the #) and mentioned usernames in each
+-- floot's message
+CREATE TABLE IF NOT EXISTS tags (
+    floot_id TEXT NOT NULL REFERENCES floots (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (floot_id, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_by_tag ON tags (tag);
+
+CREATE TABLE IF NOT EXISTS mentions (
+    floot_id TEXT NOT NULL REFERENCES floots (id) ON DELETE CASCADE,
+    username TEXT NOT NULL,
+    PRIMARY KEY (floot_id, username)
+);
+CREATE INDEX IF NOT EXISTS mentions_by_username ON mentions (username);
+"""
+
+def encode_timestamp(timestamp):
+    """
+    Timestamps (see timestamps.py) are stored as fixed-width ISO 8601
+    strings, so that sorting them as text sorts them chronologically.
+    """
+    return to_datetime(timestamp).isoformat(timespec="microseconds")
+
+class SQLiteDatabase:
+    def __init__(self, db_path):
+        """
+        Opens (or creates) the SQLite database at db_path, which may be a
+        plain path or a "sqlite:///" URL.
+        """
+        if db_path.startswith(SQLITE_URL_PREFIX):
+            db_path = db_path[len(SQLITE_URL_PREFIX):]
+        self._db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        if not self._has_fts5():
+            self._conn.close()
+            raise sqlite3.NotSupportedError(
+                    f"The SQLite library in use ({sqlite3.sqlite_version}) doesn't include "
+                    "full-text search (FTS5), which the SQLite storage backend needs")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def _has_fts5(self):
+        """
+        Returns whether SQLite has the FTS5 full-text search module.
+        """
+        try:
+            self._conn.execute("CREATE VIRTUAL TABLE temp.fts5_check USING fts5 (text)")
+        except sqlite3.OperationalError:
+            return False
+        self._conn.execute("DROP TABLE temp.fts5_check")
+        return True
+
+    def _load_floots(self, rows):
+        """
+        Builds Floot objects from (id, message, username, timestamp) rows,
+        fetching their comments and likes with one query each.
+        """
+        floot_ids = [row[0] for row in rows]
+        placeholders = ",".join("?" * len(floot_ids))
+        comments = {floot_id: [] for floot_id in floot_ids}
+        liked_by = {floot_id: [] for floot_id in floot_ids}
+        if floot_ids:
+            for floot_id, comment_id, message, username in self._conn.execute(
+                    "SELECT floot_id, id, message, username FROM comments "
+                    f"WHERE floot_id IN ({placeholders}) ORDER BY floot_id, position",
+                    floot_ids):
+                comments[floot_id].append(FlootComment(message, username, comment_id))
+            for floot_id, username in self._conn.execute(
+                    "SELECT floot_id, username FROM likes "
+                    f"WHERE floot_id IN ({placeholders}) ORDER BY floot_id, position",
+                    floot_ids):
+                liked_by[floot_id].append(username)
+
+        return [Floot(message, username, liked_by[floot_id], floot_id,
+                      datetime.fromisoformat(timestamp), comments[floot_id])
+                for floot_id, message, username, timestamp in rows]
+
+    @staticmethod
+    def _page_query(count, before, after):
+        """
+        Returns the pieces of a query for a page of the feed (see get_floots):
+        the WHERE conditions, their parameters, the ORDER BY and LIMIT
+        clauses (whose parameter is included), and whether the rows will come
+        out oldest first and need flipping around.
+        """
+        conditions = []
+        params = []
+        if before is not None:
+            timestamp, floot_id = parse_cursor(before)
+            conditions.append("(timestamp, id) < (?, ?)")
+            params += [encode_timestamp(timestamp), floot_id]
+        if after is not None:
+            timestamp, floot_id = parse_cursor(after)
+            conditions.append("(timestamp, id) > (?, ?)")
+            params += [encode_timestamp(timestamp), floot_id]
+
+        # Only after: take the floots right after the cursor, then flip them
+        # around so that the result is newest first like everywhere else.
+        oldest_first = after is not None and before is None
+        order = " ORDER BY timestamp {0}, id {0}".format("ASC" if oldest_first else "DESC")
+        if count is not None:
+            order += " LIMIT ?"
+            params.append(count)
+        return conditions, params, order, oldest_first
+
+    def get_floots(self, count=None, before=None, after=None):
+        """
+        Same as Database.get_floots.
+        """
+        conditions, params, order, oldest_first = self._page_query(count, before, after)
+        if count is not None and count <= 0:
+            return []
+        query = "SELECT id, message, username, timestamp FROM floots"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += order
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            if oldest_first:
+                rows.reverse()
+            return self._load_floots(rows)
+
+    def get_floot_summaries(self, count=None, before=None, after=None, comments=0, viewer=None):
+        """
+        Same as Database.get_floot_summaries. Likes and comments are counted
+        by SQLite, and only the comments that are asked for are read.
+        """
+        conditions, params, order, oldest_first = self._page_query(count, before, after)
+        if count is not None and count <= 0:
+            return []
+        query = ("SELECT id, message, username, timestamp, "
+                 "(SELECT COUNT(*) FROM likes WHERE floot_id = floots.id), "
+                 "(SELECT COUNT(*) FROM comments WHERE floot_id = floots.id), "
+                 "EXISTS (SELECT 1 FROM likes WHERE floot_id = floots.id AND username = ?) "
+                 "FROM floots")
+        params.insert(0, viewer)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += order
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            if oldest_first:
+                rows.reverse()
+            first_comments = {row[0]: [] for row in rows}
+            if comments > 0 and rows:
+                placeholders = ",".join("?" * len(rows))
+                for floot_id, comment_id, message, username in self._conn.execute(
+                        "SELECT floot_id, id, message, username FROM "
+                        "(SELECT floot_id, id, message, username, position, ROW_NUMBER() "
+                        "OVER (PARTITION BY floot_id ORDER BY position) AS number FROM comments "
+                        f"WHERE floot_id IN ({placeholders})) "
+                        "WHERE number <= ? ORDER BY floot_id, position",
+                        [*first_comments, comments]):
+                    first_comments[floot_id].append(
+                            FlootComment(message, username, comment_id).to_dictionary())
+
+        summaries = []
+        for floot_id, message, username, timestamp, likes, num_comments, liked in rows:
+            micros = from_datetime(datetime.fromisoformat(timestamp))
+            summary = FlootSummary({
+                Floot.FLOOT_ID:       floot_id,
+                Floot.MESSAGE:        message,
+                Floot.TIMESTAMP:      format_timestamp(micros),
+                Floot.FLOOT_USERNAME: username,
+                Floot.LIKES:          likes,
+                Floot.NUM_COMMENTS:   num_comments,
+            })
+            if comments > 0:
+                summary[Floot.COMMENTS] = first_comments[floot_id]
+            if viewer is not None:
+                summary[Floot.LIKED] = bool(liked)
+            summary._timestamp = micros
+            summaries.append(summary)
+        return summaries
+
+    def _query_floots(self, condition, params):
+        """
+        Returns the floots matching an SQL condition, newest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                    "SELECT id, message, username, timestamp FROM floots "
+                    f"WHERE {condition} ORDER BY timestamp DESC, id DESC", params).fetchall()
+            return self._load_floots(rows)
+
+    def get_floots_by_user(self, username):
+        """
+        Same as Database.get_floots_by_user.
+        """
+        return self._query_floots("username = ?", (username,))
+
+    def get_floots_liked_by(self, username):
+        """
+        Same as Database.get_floots_liked_by.
+        """
+        return self._query_floots("id IN (SELECT floot_id FROM likes WHERE username = ?)",
+                                  (username,))
+
+    def get_floots_by_tag(self, tag):
+        """
+        Same as Database.get_floots_by_tag.
+        """
+        return self._query_floots("id IN (SELECT floot_id FROM tags WHERE tag = ?)",
+                                  (normalize_tag(tag),))
+
+    def get_floots_mentioning(self, username):
+        """
+        Same as Database.get_floots_mentioning.
+        """
+        return self._query_floots("id IN (SELECT floot_id FROM mentions WHERE username = ?)",
+                                  (username,))
+
+    def get_trending_tags(self, count=10):
+        """
+        Same as Database.get_trending_tags, but over exactly the last hour
+        rather than the last hour's worth of whole minutes.
+        """
+        since = timestamps.now() - TRENDING_BUCKET * TRENDING_BUCKETS
+        with self._lock:
+            return self._conn.execute(
+                    "SELECT tag, COUNT(*) FROM tags JOIN floots ON floots.id = tags.floot_id "
+                    "WHERE floots.timestamp >= ? GROUP BY tag "
+                    "ORDER BY COUNT(*) DESC, tag LIMIT ?",
+                    (encode_timestamp(since), count)).fetchall()
+
+    def get_comments_by_user(self, username):
+        """
+        Same as Database.get_comments_by_user.
+        """
+        floots = self._query_floots("id IN (SELECT floot_id FROM comments WHERE username = ?)",
+                                    (username,))
+        return [(floot, comment) for floot in floots for comment in floot.get_comments()
+                if comment.get_author() == username]
+
+    def search(self, query, count=None):
+        """
+        Same as Database.search, but ranked by SQLite's full-text search
+        (bm25), with matches in the message counting for more, as in
+        search.py.
+        """
+        words = parse_query(query)
+        if not words or count is not None and count <= 0:
+            return []
+        # Quoted, so that no word is taken for FTS5 query syntax
+        match = " ".join(f'"{word}"' + ("*" if prefix else "") for word, prefix in words)
+        query = ("SELECT floots.id, floots.message, floots.username, floots.timestamp "
+                 "FROM search JOIN search_rows ON search_rows.row = search.rowid "
+                 "JOIN floots ON floots.id = search_rows.floot_id WHERE search MATCH ? "
+                 f"ORDER BY bm25(search, {MESSAGE_WEIGHT}, {COMMENT_WEIGHT}), "
+                 "floots.timestamp DESC")
+        params = [match]
+        if count is not None:
+            query += " LIMIT ?"
+            params.append(count)
+        with self._lock:
+            return self._load_floots(self._conn.execute(query, params).fetchall())
+
+    @staticmethod
+    def get_cursor(floot):
+        """
+        Same as Database.get_cursor.
+        """
+        return make_cursor(floot.get_timestamp_micros(), floot.get_id())
+
+    def has_floot(self, floot_id):
+        """
+        Same as Database.has_floot.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM floots WHERE id = ?",
+                                     (floot_id,)).fetchone()
+        return row is not None
+
+    def get_floot_by_id(self, floot_id):
+        """
+        Same as Database.get_floot_by_id. Note that every call returns a new
+        Floot object, so changes to a Floot only take effect once it is passed
+        to save_floot.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                    "SELECT id, message, username, timestamp FROM floots WHERE id = ?",
+                    (floot_id,)).fetchall()
+            if not rows:
+                raise KeyError(f"No floot with id {floot_id} in database")
+            return self._load_floots(rows)[0]
+
+    def save_floot(self, floot):
+        """
+        Same as Database.save_floot.
+        """
+        with self._lock, self._conn:
+            self._write_floot(floot)
+
+    def save_floots(self, floots):
+        """
+        Same as Database.save_floots: all of the floots are saved in one
+        transaction.
+        """
+        with self._lock, self._conn:
+            for floot in floots:
+                self._write_floot(floot)
+
+    def _index_search(self, floot_id):
+        """
+        Brings a floot's row in the search table up to date with what is
+        stored for it. The caller holds self._lock and an open transaction.
+        """
+        self._conn.execute("INSERT INTO search_rows (floot_id) VALUES (?) "
+                           "ON CONFLICT (floot_id) DO NOTHING", (floot_id,))
+        (row,) = self._conn.execute("SELECT row FROM search_rows WHERE floot_id = ?",
+                                    (floot_id,)).fetchone()
+        self._conn.execute("DELETE FROM search WHERE rowid = ?", (row,))
+        self._conn.execute(
+                "INSERT INTO search (rowid, message, comments) "
+                "SELECT ?, message, (SELECT group_concat(message, ' ') FROM comments "
+                "WHERE floot_id = floots.id) FROM floots WHERE id = ?", (row, floot_id))
+
+    def _unindex_search(self, floot_id):
+        row = self._conn.execute("SELECT row FROM search_rows WHERE floot_id = ?",
+                                 (floot_id,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM search WHERE rowid = ?", row)
+            self._conn.execute("DELETE FROM search_rows WHERE row = ?", row)
+
+    def _index_tags(self, floot_id, message):
+        # The caller holds self._lock and an open transaction.
+        hashtags, mentions = extract_tags(message)
+        self._conn.execute("DELETE FROM tags WHERE floot_id = ?", (floot_id,))
+        self._conn.executemany("INSERT INTO tags (floot_id, tag) VALUES (?, ?)",
+                               [(floot_id, tag) for tag in hashtags])
+        self._conn.execute("DELETE FROM mentions WHERE floot_id = ?", (floot_id,))
+        self._conn.executemany("INSERT INTO mentions (floot_id, username) VALUES (?, ?)",
+                               [(floot_id, username) for username in mentions])
+
+    def _write_floot(self, floot):
+        # The caller holds self._lock and an open transaction.
+        floot_id = floot.get_id()
+        self._conn.execute(
+                "INSERT INTO floots (id, message, username, timestamp) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET message = excluded.message, "
+                "username = excluded.username, timestamp = excluded.timestamp",
+                (floot_id, floot.get_message(), floot.get_username(),
+                 encode_timestamp(floot.get_timestamp_micros())))
+        self._conn.execute("DELETE FROM comments WHERE floot_id = ?", (floot_id,))
+        self._conn.executemany(
+                "INSERT INTO comments (id, floot_id, position, message, username) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(comment.get_id(), floot_id, position, comment.get_message(), comment.get_author())
+                 for position, comment in enumerate(floot.get_comments())])
+        self._conn.execute("DELETE FROM likes WHERE floot_id = ?", (floot_id,))
+        self._conn.executemany(
+                "INSERT INTO likes (floot_id, username, position) VALUES (?, ?, ?)",
+                [(floot_id, username, position)
+                 for position, username in enumerate(floot.get_liked_by())])
+        self._index_search(floot_id)
+        self._index_tags(floot_id, floot.get_message())
+
+    def delete_floot_by_id(self, floot_id):
+        """
+        Same as Database.delete_floot_by_id.
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM floots WHERE id = ?", (floot_id,))
+            if cursor.rowcount == 0:
+                raise KeyError(f"No floot with id {floot_id} in database")
+            self._unindex_search(floot_id)
+
+    def delete_floot(self, floot):
+        """
+        Same as Database.delete_floot.
+        """
+        self.delete_floot_by_id(floot.get_id())
+
+    def close(self):
+        """
+        Closes the connection to the SQLite file.
+        """
+        with self._lock:
+            self._conn.close()
+
+    def __str__(self):
+        return f"<SQLiteFlootDatabase({self._db_path})>"
+
+    def __repr__(self):
+        return str(self)
@@ -0,0 +1,194 @@
+"""
+This file exports a StaticFiles class, which serves the files in client/
+(index.html, the JavaScript, style.css and the images) from memory.
+
+Each file is read once, the first time it is asked for, along with what the
+response needs: its content type, a gzip-compressed copy (for text files that
+shrink when compressed), and an ETag, a tag derived from the file's contents.
+Afterwards, a request only costs a stat() to check that the file hasn't
+changed on disk; if it has, it is read again.
+
+Browsers keep a copy of the files along with their ETags, and ask again with
+If-None-Match set to the ETag. If the file hasn't changed, the answer is 304
+Not Modified, without the file. Cache-Control tells browsers to check every
+time (rather than using their copy for a while without asking), since the
+files may be edited while the server runs.
+
+STUDENTS: You don't need to read anything in this file.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import stat
+
+from error import HTTPError
+from response import Response
+
+CACHE_CONTROL = "no-cache"
+# Files smaller than this aren't worth compressing
+GZIP_MIN_SIZE = 256
+# Content types (besides text/*) that are compressed
+COMPRESSIBLE_TYPES = {"application/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "text/javascript"}
+
+class _StaticFile:
+    __slots__ = ("path", "version", "content_type", "body", "etag", "gzip_body", "gzip_etag")
+
+    def __init__(self, path, version, content_type, body):
+        self.path = path
+        # (modification time, size) of the file when it was read
+        self.version = version
+        self.content_type = content_type
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.gzip_body = None
+        self.gzip_etag = None
+        if _compressible(content_type) and len(body) >= GZIP_MIN_SIZE:
+            # mtime=0 so that the same file always compresses the same way
+            compressed = gzip.compress(body, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+                # The compressed copy is a different response, so it needs a
+                # different ETag.
+                self.gzip_etag = self.etag[:-1] + '-gzip"'
+
+def _compressible(content_type):
+    return content_type is not None and (content_type.startswith("text/")
+                                         or content_type in COMPRESSIBLE_TYPES)
+
+def _file_version(path):
+    """
+    Returns (modification time, size) of a file, or None if it isn't a file.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(info.st_mode):
+        return None
+    return info.st_mtime_ns, info.st_size
+
+def accepts_gzip(accept_encoding):
+    """
+    Returns whether an Accept-Encoding header (e.g. "gzip, deflate, br")
+    allows a gzip-compressed response.
+    """
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "x-gzip", "*"):
+            continue
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+def etag_matches(if_none_match, etags):
+    """
+    Returns whether an If-None-Match header matches any of etags.
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        # If-None-Match ignores whether a tag is weak (W/"...").
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+class StaticFiles:
+    def __init__(self, root):
+        """
+        Creates a StaticFiles that serves the files under the directory root.
+        """
+        self._root = os.path.abspath(root)
+        # Absolute file path -> _StaticFile. Keyed by the file rather than the
+        # path it was asked for by, so that paths that name the same file
+        # (e.g. "img/./a.jpg" and "img/a.jpg") share one copy, and the cache
+        # can't grow beyond the files under root. Threads may read the same
+        # file at the same time; whichever stores it last wins, which does no
+        # harm.
+        self._files = {}
+
+    def _resolve(self, path):
+        """
+        Returns the absolute path of the file that path (relative to root)
+        names, or None if it is outside root.
+        """
+        full_path = os.path.abspath(os.path.join(self._root, path))
+        # Avoid serving files above the root directory for security
+        if not full_path.startswith(self._root + os.sep):
+            return None
+        return full_path
+
+    def get(self, path):
+        """
+        Returns the _StaticFile for path (relative to root), reading it again
+        if it changed since it was last read, or None if there is no such
+        file.
+        """
+        full_path = self._resolve(path)
+        if full_path is None:
+            return None
+        version = _file_version(full_path)
+        cached = self._files.get(full_path)
+        if cached is not None and version == cached.version:
+            return cached
+        if version is None:
+            self._files.pop(full_path, None)
+            return None
+
+        try:
+            with open(full_path, "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        # If the file changed while it was being read, its version is taken
+        # afterwards, so that the next request reads it again.
+        if len(body) != version[1]:
+            version = _file_version(full_path)
+        # Guess the content-type based on the file extension (e.g. a .html
+        # file is probably text/html).
+        static_file = _StaticFile(full_path, version,
+                                  mimetypes.guess_type(full_path)[0], body)
+        self._files[full_path] = static_file
+        return static_file
+
+    def serve(self, path, request_headers):
+        """
+        Returns the Response for a GET of path (relative to root), given the
+        request's headers (a dict with lowercase names): the file, compressed
+        if the client accepts gzip, or 304 Not Modified if the client already
+        has it. Returns an HTTPError if there is no such file.
+        """
+        static_file = self.get(path)
+        if static_file is None:
+            return HTTPError(404, "File not found")
+
+        headers = {"Cache-Control": CACHE_CONTROL}
+        if static_file.gzip_body is not None:
+            headers["Vary"] = "Accept-Encoding"
+            use_gzip = accepts_gzip(request_headers.get("accept-encoding"))
+        else:
+            use_gzip = False
+        headers["ETag"] = static_file.gzip_etag if use_gzip else static_file.etag
+
+        if etag_matches(request_headers.get("if-none-match"),
+                        (static_file.etag, static_file.gzip_etag)):
+            return Response(b"", content_type=None, status=304, headers=headers)
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            return Response(static_file.gzip_body, content_type=static_file.content_type,
+                            headers=headers)
+        return Response(static_file.body, content_type=static_file.content_type,
+                        headers=headers)
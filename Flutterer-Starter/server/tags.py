@@ -0,0 +1,105 @@
+"""
+Helpers for hashtags ("#flutterer") and mentions ("@jerry") in floot
+messages: extract_tags finds them, and TrendingCounter counts how often each
+hashtag was used recently, so that Database can say which tags are trending
+without looking through old floots.
+
+STUDENTS: You don't need to read anything in this file.
+"""
+
+import heapq
+import sys
+import re
+
+# A # or @ that isn't in the middle of a word (so "a#b" and email addresses
+# don't count), followed by the tag or username
+_HASHTAG = re.compile(r"(?<!\w)#(\w+)")
+_MENTION = re.compile(r"(?<!\w)@(\w+)")
+
+def extract_tags(message):
+    """
+    Returns the hashtags (lowercased, without the #) and mentioned usernames
+    (without the @) in a message, each as a list without repeats, in the order
+    they first appear.
+    """
+    hashtags = list(dict.fromkeys(sys.intern(tag.casefold()) for tag in _HASHTAG.findall(message)))
+    mentions = list(dict.fromkeys(map(sys.intern, _MENTION.findall(message))))
+    return hashtags, mentions
+
+def normalize_tag(tag):
+    """
+    Returns tag (with or without a leading #) the way extract_tags records it.
+    """
+    return tag[1:].casefold() if tag.startswith("#") else tag.casefold()
+
+class TrendingCounter:
+    def __init__(self, bucket_size, buckets):
+        """
+        Creates a counter of how many times each key was added with a
+        timestamp in the last `buckets` * `bucket_size` (both in the same
+        units as the timestamps).
+
+        The counts are kept in a ring of buckets, each covering bucket_size.
+        As time passes, the oldest bucket is emptied and reused for the
+        newest, and a running total per key is kept up to date along the way,
+        so neither adding nor asking for the totals depends on how many
+        timestamps are in the window.
+        """
+        self._bucket_size = bucket_size
+        self._buckets = [{} for _ in range(buckets)]
+        # Number (timestamp // bucket_size) of the newest bucket in the ring
+        self._newest = None
+        # Key -> count, over every bucket in the ring
+        self._totals = {}
+
+    def _advance(self, bucket):
+        """
+        Moves the ring forwards until the given bucket number is the newest,
+        emptying the buckets that fall out of the window.
+        """
+        if self._newest is None:
+            self._newest = bucket
+            return
+        if bucket <= self._newest:
+            return
+        ring = len(self._buckets)
+        for number in range(max(self._newest + 1, bucket - ring + 1), bucket + 1):
+            expired = self._buckets[number % ring]
+            for key, count in expired.items():
+                self._change_total(key, -count)
+            expired.clear()
+        self._newest = bucket
+
+    def _change_total(self, key, amount):
+        total = self._totals.get(key, 0) + amount
+        if total:
+            self._totals[key] = total
+        else:
+            del self._totals[key]
+
+    def add(self, key, timestamp, amount=1):
+        """
+        Counts key once (or `amount` times) at the given timestamp. Timestamps
+        that are already out of the window are ignored. A negative amount
+        takes back earlier adds.
+        """
+        bucket = timestamp // self._bucket_size
+        self._advance(bucket)
+        if bucket <= self._newest - len(self._buckets):
+            return
+        counts = self._buckets[bucket % len(self._buckets)]
+        count = counts.get(key, 0) + amount
+        if count:
+            counts[key] = count
+        else:
+            del counts[key]
+        self._change_total(key, amount)
+
+    def top(self, count, now):
+        """
+        Returns up to `count` (key, count) pairs for the keys counted most in
+        the window that ends at now, most first (and alphabetically among
+        equal counts).
+        """
+        self._advance(now // self._bucket_size)
+        return heapq.nsmallest(count, self._totals.items(), key=lambda item: (-item[1], item[0]))
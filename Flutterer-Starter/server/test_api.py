@@ -3,20 +3,26 @@ This file contains a series of test cases you can use to ensure your api.py
 implementations are correct. You don't need to understand or change any of the
 code here. To run these tests, go to Run > Run 'Unittests in test_api.py'.
 """
+import json
 import os
 import unittest
-from datetime import timedelta
 
 import api
 from database import Database
 from floot import Floot
 from floot_comment import FlootComment
 from error import HTTPError
+from response import encode_json
 
 TEST_DB_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                             "test_database.json")
+TEST_SQLITE_DB_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                   "test_database.db")
 
 class TestApi(unittest.TestCase):
+    # Which database file to run the tests against
+    db_path = TEST_DB_PATH
+
     def setUp(self):
         """
         This function is called before every test function. Its goal is to set
@@ -24,16 +30,16 @@ class TestApi(unittest.TestCase):
         """
         # First, let's create an empty test database. Delete any existing test
         # database:
-        if os.path.exists(TEST_DB_PATH):
-            os.unlink(TEST_DB_PATH)
-        self.test_db = Database(TEST_DB_PATH)
+        self.delete_test_db()
+        self.test_db = Database(self.db_path)
 
         # Add some fake floots to this database
         self.floots = [ Floot("Hello world!", "Test User 1"),
                         Floot("Hello world again!", "Test User 2") ]
 
         # ensures consistent ordering between floots created in the same second.
-        self.floots[0]._timestamp -= timedelta(minutes=5)
+        # (Timestamps are in microseconds.)
+        self.floots[0]._timestamp -= 5 * 60 * 1_000_000
 
         for floot in self.floots:
             self.test_db.save_floot(floot)
@@ -59,8 +65,13 @@ class TestApi(unittest.TestCase):
         database, so that the next test to be run gets a clean slate.
         """
         # Delete the test database
-        if os.path.exists(TEST_DB_PATH):
-            os.unlink(TEST_DB_PATH)
+        self.test_db.close()
+        self.delete_test_db()
+
+    def delete_test_db(self):
+        for suffix in ["", ".log", ".idx", ".search", ".users", "-wal", "-shm"]:
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
 
     def test_get_floots(self):
         """
@@ -80,6 +91,177 @@ class TestApi(unittest.TestCase):
                 "Floot ID of the first floot does not seem correct! Make sure you "
                 "aren't accidentally reordering the floots.")
 
+    def test_get_floots_paginated(self):
+        """
+        Verify that GET /api/floots?limit=...&before=... pages through the feed
+        """
+        first_page = api.get_floots(limit="1")
+        self.assertIsInstance(first_page, dict)
+        self.assertEqual([f["id"] for f in first_page["floots"]], [self.floots[1].get_id()])
+
+        second_page = api.get_floots(limit="1", before=first_page["before"])
+        self.assertEqual([f["id"] for f in second_page["floots"]], [self.floots[0].get_id()])
+
+        last_page = api.get_floots(limit="1", before=second_page["before"])
+        self.assertEqual(last_page["floots"], [])
+        self.assertIsNone(last_page["before"])
+
+        newer = api.get_floots(after=second_page["after"])
+        self.assertEqual([f["id"] for f in newer["floots"]], [self.floots[1].get_id()])
+
+    def test_get_floots_json_follows_changes(self):
+        """
+        Verify that the JSON sent for GET /api/floots matches the floots as
+        they are now, even though each floot's JSON is cached between requests
+        """
+        def sent(**params):
+            output = api.get_floots(**params)
+            self.assertEqual(encode_json(output), json.dumps(output, indent=4))
+            return json.loads(encode_json(output))
+
+        floot_id = self.floots[0].get_id()
+        self.assertEqual(sent(), [f.to_dictionary() for f in reversed(self.floots)])
+        api.like_floot(floot_id, {"username": "Test User 3"})
+        self.assertEqual(sent()[1]["liked_by"], ["Test User 3"])
+        api.create_comment(floot_id, {"username": "Test User 3", "message": "New comment"})
+        self.assertEqual(sent()[1]["comments"][-1]["message"], "New comment")
+        api.delete_comment(floot_id, self.comments[0].get_id(), {"username": "Test User 1"})
+        self.assertEqual(len(sent()[1]["comments"]), 2)
+        self.assertEqual(sent(limit="1", before=api.get_floots(limit="1")["before"])["floots"],
+                         [sent()[1]])
+
+    def test_get_floots_summary(self):
+        """
+        Verify that GET /api/floots?view=summary sends counts instead of the
+        full likes and comments, in pages too
+        """
+        api.like_floot(self.floots[0].get_id(), {"username": "Test User 3"})
+        output = api.get_floots(view="summary", comments="1")
+        self.assertEqual(json.loads(encode_json(output)), [
+            {"id": floot.get_id(), "message": floot.get_message(),
+             "timestamp": floot.get_timestamp(), "username": floot.get_username(),
+             "likes": likes, "num_comments": len(floot.get_comments()),
+             "comments": [floot.get_comments()[0].to_dictionary()]}
+            for floot, likes in [(self.floots[1], 0), (self.floots[0], 1)]])
+        self.assertNotIn("comments", api.get_floots(view="summary")[0])
+
+        first_page = api.get_floots(limit="1", view="summary", comments="1")
+        self.assertEqual(first_page["floots"], [output[0]])
+        second_page = api.get_floots(limit="1", before=first_page["before"], view="summary")
+        self.assertEqual([f["id"] for f in second_page["floots"]], [self.floots[0].get_id()])
+        self.assertEqual(second_page["floots"][0]["num_comments"], 2)
+        self.assertEqual(api.get_floots(limit="1", before=second_page["before"],
+                                        view="summary")["floots"], [])
+
+    def test_get_floots_liked_by_viewer(self):
+        """
+        Verify that GET /api/floots?viewer=... says which floots the viewer
+        likes, and that liked_by=false leaves out the list of likes
+        """
+        api.like_floot(self.floots[0].get_id(), {"username": "Test User 3"})
+        expected = [f.to_dictionary() for f in self.test_db.get_floots()]
+        for params in [{}, {"limit": "2"}]:
+            output = api.get_floots(viewer="Test User 3", **params)
+            floots = output if isinstance(output, list) else output["floots"]
+            self.assertEqual(json.loads(encode_json(floots)),
+                             [{**expected[0], "liked": False}, {**expected[1], "liked": True}])
+
+            output = api.get_floots(viewer="Test User 3", liked_by="false", **params)
+            floots = output if isinstance(output, list) else output["floots"]
+            self.assertEqual([(f["liked"], "liked_by" in f)
+                              for f in json.loads(encode_json(floots))],
+                             [(False, False), (True, False)])
+
+            output = api.get_floots(viewer="Test User 3", view="summary", **params)
+            floots = output if isinstance(output, list) else output["floots"]
+            self.assertEqual([f["liked"] for f in json.loads(encode_json(floots))],
+                             [False, True])
+
+        # The floots' own dictionaries and JSON are unchanged
+        self.assertNotIn("liked", api.get_floots()[1])
+        self.assertEqual(json.loads(encode_json(api.get_floots())), expected)
+
+    def test_get_floots_with_bad_pagination(self):
+        """
+        Verify that GET /api/floots returns an error 400 when given a bad limit,
+        cursor or view
+        """
+        for params in [{"limit": "ten"}, {"limit": "0"}, {"before": "garbage"},
+                       {"view": "everything"}, {"view": "summary", "comments": "two"},
+                       {"liked_by": "maybe"}]:
+            output = api.get_floots(**params)
+            self.assertIsInstance(output, HTTPError)
+            self.assertEqual(output.status, 400)
+
+    def test_search(self):
+        """
+        Verify that GET /api/search finds floots by the words in their
+        messages and comments
+        """
+        def found(**params):
+            output = api.search_floots(**params)
+            self.assertIsInstance(output, list)
+            return [f["id"] for f in output]
+
+        first, second = [f.get_id() for f in self.floots]
+        self.assertEqual(found(q="again"), [second])
+        self.assertEqual(sorted(found(q="HELLO")), sorted([first, second]))
+        self.assertEqual(sorted(found(q="wor*")), sorted([first, second]))
+        self.assertEqual(found(q="hel* again"), [second])
+        self.assertEqual(found(q="hello missing"), [])
+        self.assertEqual(found(q=""), [])
+        self.assertEqual(len(found(q="hello", limit="1")), 1)
+
+        # A match in the message ranks above a match in a comment
+        api.create_comment(first, {"username": "Test User 3", "message": "Zebras!"})
+        zebra = api.create_floot({"username": "Test User 3", "message": "A zebra"})["id"]
+        self.assertEqual(found(q="zebra*"), [zebra, first])
+
+        api.delete_comment(first, self.comments[0].get_id(), {"username": "Test User 1"})
+        self.assertEqual(sorted(found(q="comment")), sorted([first, second]))
+        self.assertEqual(found(q="1"), [])
+        api.delete_floot(second, {"username": "Test User 2"})
+        self.assertEqual(found(q="again"), [])
+
+        for params in [{}, {"q": "hello", "limit": "none"}, {"q": "hello", "limit": "0"}]:
+            output = api.search_floots(**params)
+            self.assertIsInstance(output, HTTPError)
+            self.assertEqual(output.status, 400)
+
+    def test_tags(self):
+        """
+        Verify that GET /api/tags/trending, GET /api/tags/{tag} and
+        GET /api/users/{username}/mentions keep up with floots being posted,
+        edited and deleted
+        """
+        first = api.create_floot({"username": "Test User 1",
+                                  "message": "#CS106AX is #fun, right @Jerry? #fun"})["id"]
+        second = api.create_floot({"username": "Test User 2",
+                                   "message": "Email me at a#b or x@y. #fun"})["id"]
+        # Hashtags from more than an hour ago don't trend
+        old = Floot("#old news", "Test User 3")
+        old._timestamp -= 2 * 60 * 60 * 1_000_000
+        self.test_db.save_floot(old)
+
+        self.assertEqual(api.get_trending_tags(),
+                         [{"tag": "fun", "count": 2}, {"tag": "cs106ax", "count": 1}])
+        self.assertEqual(api.get_trending_tags(limit="1"), [{"tag": "fun", "count": 2}])
+        self.assertEqual([f["id"] for f in api.get_tag_floots("fun")], [second, first])
+        self.assertEqual([f["id"] for f in api.get_tag_floots("%23cs106AX")], [first])
+        self.assertEqual([f["id"] for f in api.get_tag_floots("old")], [old.get_id()])
+        self.assertEqual(api.get_tag_floots("b"), [])
+        self.assertEqual([f["id"] for f in api.get_user_mentions("Jerry")], [first])
+        self.assertEqual(api.get_user_mentions("y"), [])
+
+        api.delete_floot(second, {"username": "Test User 2"})
+        self.assertEqual(api.get_trending_tags(),
+                         [{"tag": "cs106ax", "count": 1}, {"tag": "fun", "count": 1}])
+        self.assertEqual([f["id"] for f in api.get_tag_floots("fun")], [first])
+
+        for limit in ["none", "0"]:
+            output = api.get_trending_tags(limit=limit)
+            self.assertIsInstance(output, HTTPError)
+            self.assertEqual(output.status, 400)
 
     def test_get_floot_with_valid_id(self):
         """
@@ -419,6 +601,24 @@ class TestApi(unittest.TestCase):
         comments = [ c.get_id() for c in updated_floot.get_comments() ]
         self.assertTrue(self.comments[1].get_id() not in comments)
 
+    def test_delete_comment_keeps_order(self):
+        """
+        Verify that deleting a comment leaves the other comments in the order
+        they were posted, before and after reloading the database
+        """
+        extra = FlootComment("Comment 4", "Test User 2")
+        self.floots[0].create_comment(extra)
+        self.test_db.save_floot(self.floots[0])
+        api.delete_comment(self.floots[0].get_id(), self.comments[1].get_id(), {
+            "username": "Test User 2",
+        })
+        expected = [self.comments[0].get_id(), extra.get_id()]
+        self.assertEqual([c["id"] for c in api.get_comments(self.floots[0].get_id())], expected)
+        floot = Database(self.db_path).get_floot_by_id(self.floots[0].get_id())
+        self.assertEqual([c.get_id() for c in floot.get_comments()], expected)
+        self.assertTrue(floot.has_comment(extra.get_id()))
+        self.assertFalse(floot.has_comment(self.comments[1].get_id()))
+
     def test_delete_comment_with_invalid_floot_id(self):
         """
         Verify that POST /api/floots/{floot_id}/comments/{comment_id}/delete
@@ -509,6 +709,70 @@ class TestApi(unittest.TestCase):
         # Make sure the specific error is error 401
         self.assertEqual(exception.status, 401, expectation)
 
+    def test_get_user_floots(self):
+        """
+        Verify that GET /api/users/{username}/floots works
+        """
+        output = api.get_user_floots("Test%20User%202")
+        self.assertEqual([f["id"] for f in output], [self.floots[1].get_id()])
+        self.assertEqual(api.get_user_floots("Nobody"), [])
+
+    def test_get_user_comments(self):
+        """
+        Verify that GET /api/users/{username}/comments works, and keeps up
+        with comments being deleted
+        """
+        output = api.get_user_comments("Test User 1")
+        self.assertEqual([c["id"] for c in output],
+                         [self.comments[2].get_id(), self.comments[0].get_id()])
+        self.assertEqual(output[0]["floot_id"], self.floots[1].get_id())
+
+        api.delete_comment(self.floots[1].get_id(), self.comments[2].get_id(), {
+            "username": "Test User 1",
+        })
+        output = api.get_user_comments("Test User 1")
+        self.assertEqual([c["id"] for c in output], [self.comments[0].get_id()])
+
+    def test_like_floot(self):
+        """
+        Verify that likes are counted once per user and keep the order they
+        were made in, through unlikes and reloads
+        """
+        floot_id = self.floots[0].get_id()
+        for username in ["Test User 3", "Test User 1", "Test User 3", "Test User 2"]:
+            self.assertEqual(api.like_floot(floot_id, {"username": username}), "OK")
+        api.unlike_floot(floot_id, {"username": "Test User 1"})
+        api.unlike_floot(floot_id, {"username": "Test User 4"})
+        output = api.get_floot(floot_id)
+        self.assertEqual(output["liked_by"], ["Test User 3", "Test User 2"])
+        self.assertEqual(api.like_floot(floot_id, {}).status, 401)
+
+        floot = Database(self.db_path).get_floot_by_id(floot_id)
+        self.assertEqual(floot.get_liked_by(), ["Test User 3", "Test User 2"])
+        self.assertTrue(floot.is_liked_by("Test User 2"))
+        self.assertFalse(floot.is_liked_by("Test User 1"))
+
+    def test_get_user_likes(self):
+        """
+        Verify that GET /api/users/{username}/likes keeps up with likes and
+        unlikes
+        """
+        api.like_floot(self.floots[0].get_id(), {"username": "Test User 3"})
+        api.like_floot(self.floots[1].get_id(), {"username": "Test User 3"})
+        api.unlike_floot(self.floots[1].get_id(), {"username": "Test User 3"})
+        output = api.get_user_likes("Test User 3")
+        self.assertEqual([f["id"] for f in output], [self.floots[0].get_id()])
+
+        api.delete_floot(self.floots[0].get_id(), {"username": "Test User 1"})
+        self.assertEqual(api.get_user_likes("Test User 3"), [])
+
+
+class TestApiSQLite(TestApi):
+    """
+    Runs all of the above tests against the SQLite storage backend.
+    """
+    db_path = TEST_SQLITE_DB_PATH
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,1073 @@
+"""
+This file contains test cases for the storage side of the Database class
+(journaling, compaction, and so on). You don't need to understand or change any
+of the code here.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+import bulk
+from database import Database
+from floot import Floot
+from floot_comment import FlootComment
+from rwlock import ReadWriteLock
+from search import SearchIndex, document_terms
+from tags import TrendingCounter, extract_tags
+import timestamps
+
+TEST_DB_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            "test_storage.json")
+TEST_SQLITE_DB_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                   "test_storage.db")
+TEST_BINARY_DB_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                   "test_storage.floots")
+
+# A minute, in the microseconds that Floot timestamps are kept in
+MINUTE = 60 * 1_000_000
+
+def remove_test_files():
+    for path in [TEST_DB_PATH, TEST_SQLITE_DB_PATH, TEST_BINARY_DB_PATH]:
+        for suffix in ["", ".log", ".tmp", ".idx", ".idx.tmp", ".search", ".search.tmp",
+                       ".users", ".users.tmp", "-wal", "-shm"]:
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        remove_test_files()
+        self.test_db = Database(TEST_DB_PATH, journal=True)
+
+    def tearDown(self):
+        self.test_db.close()
+        remove_test_files()
+
+    def reopen(self):
+        """
+        Simulates a restart without a clean shutdown (i.e. the journal is not
+        compacted first).
+        """
+        self.test_db._log_file.close()
+        self.test_db._log_file = None
+        self.test_db = Database(TEST_DB_PATH, journal=True)
+
+    def test_saves_and_deletes_are_replayed(self):
+        """
+        Verify that journaled changes survive a restart
+        """
+        kept = Floot("Kept", "Test User 1")
+        deleted = Floot("Deleted", "Test User 2")
+        self.test_db.save_floot(kept)
+        self.test_db.save_floot(deleted)
+        kept.create_comment(FlootComment("Comment", "Test User 2"))
+        self.test_db.save_floot(kept)
+        self.test_db.delete_floot(deleted)
+
+        self.assertFalse(os.path.exists(TEST_DB_PATH),
+                "Journaled writes should not rewrite the data file")
+        self.reopen()
+
+        self.assertTrue(self.test_db.has_floot(kept.get_id()))
+        self.assertFalse(self.test_db.has_floot(deleted.get_id()))
+        self.assertEqual(len(self.test_db.get_floot_by_id(kept.get_id()).get_comments()), 1)
+
+    def test_torn_record_is_discarded(self):
+        """
+        Verify that a partially written record at the end of the journal (e.g.
+        from a crash mid-write) does not prevent the database from loading
+        """
+        floot = Floot("Hello world!", "Test User 1")
+        self.test_db.save_floot(floot)
+        with open(TEST_DB_PATH + ".log", "a") as f:
+            f.write('{"op":"save","floot":{"id":')
+
+        self.reopen()
+        self.assertTrue(self.test_db.has_floot(floot.get_id()))
+
+        # New records must still be readable after the torn one was dropped
+        another = Floot("Hello again!", "Test User 1")
+        self.test_db.save_floot(another)
+        self.reopen()
+        self.assertTrue(self.test_db.has_floot(another.get_id()))
+
+    def test_compact(self):
+        """
+        Verify that compaction folds the journal into the data file
+        """
+        floot = Floot("Hello world!", "Test User 1")
+        self.test_db.save_floot(floot)
+        self.test_db.compact()
+
+        self.assertEqual(os.path.getsize(TEST_DB_PATH + ".log"), 0)
+        self.assertTrue(Database(TEST_DB_PATH).has_floot(floot.get_id()))
+
+
+class TestWriteBehind(unittest.TestCase):
+    def tearDown(self):
+        self.test_db.close()
+        remove_test_files()
+
+    def saved_floot_ids(self, journal):
+        """
+        Returns the ids of the floots that made it to disk so far.
+        """
+        reloaded = Database(TEST_DB_PATH, journal=journal)
+        floot_ids = [floot.get_id() for floot in reloaded.get_floots()]
+        reloaded.close()
+        return floot_ids
+
+    def check_write_behind(self, journal):
+        remove_test_files()
+        self.test_db = Database(TEST_DB_PATH, journal=journal, flush_threshold=1000)
+        floot = Floot("Hello world!", "Test User 1")
+        self.test_db.save_floot(floot)
+
+        # The change is visible right away, but hasn't been written yet
+        self.assertTrue(self.test_db.has_floot(floot.get_id()))
+        self.assertEqual(self.saved_floot_ids(journal), [])
+
+        self.test_db.flush()
+        self.assertEqual(self.saved_floot_ids(journal), [floot.get_id()])
+
+    def test_write_behind_with_journal(self):
+        """
+        Verify that journaled changes are held back until flush()
+        """
+        self.check_write_behind(journal=True)
+
+    def test_write_behind_without_journal(self):
+        """
+        Verify that data file rewrites are held back until flush()
+        """
+        self.check_write_behind(journal=False)
+
+    def test_flush_threshold(self):
+        """
+        Verify that reaching flush_threshold flushes in the background
+        """
+        remove_test_files()
+        self.test_db = Database(TEST_DB_PATH, journal=True, flush_threshold=2)
+        for i in range(2):
+            self.test_db.save_floot(Floot(f"Floot {i}", "Test User 1"))
+
+        deadline = time.time() + 5
+        while self.test_db._pending and time.time() < deadline:
+            time.sleep(0.01)
+        # Wait for the background write to finish
+        with self.test_db._io_lock:
+            self.assertEqual(self.test_db._pending, [])
+        self.assertEqual(len(self.saved_floot_ids(journal=True)), 2)
+
+
+class TestLazyLoad(unittest.TestCase):
+    db_path = TEST_DB_PATH
+
+    def setUp(self):
+        remove_test_files()
+        db = Database(self.db_path)
+        self.floots = [Floot(f"Floot {i}", f"Test User {i}") for i in range(4)]
+        for i, floot in enumerate(self.floots):
+            floot._timestamp -= (len(self.floots) - i) * MINUTE
+            floot.create_comment(FlootComment(f"Comment {i}", "Test User 1"))
+            db.save_floot(floot)
+        self.test_db = Database(self.db_path, journal=True, lazy=True)
+
+    def tearDown(self):
+        self.test_db.close()
+        remove_test_files()
+
+    def test_floots_are_loaded_on_demand(self):
+        """
+        Verify that no floots are built at startup, and that reading them
+        builds only the ones asked for
+        """
+        self.assertEqual(len(self.test_db._data), 0)
+        self.assertTrue(self.test_db.has_floot(self.floots[0].get_id()))
+
+        newest = self.test_db.get_floots(1)
+        self.assertEqual([f.get_id() for f in newest], [self.floots[-1].get_id()])
+        self.assertEqual(len(self.test_db._data), 1)
+
+        floot = self.test_db.get_floot_by_id(self.floots[0].get_id())
+        self.assertEqual(floot.get_comments()[0].get_message(), "Comment 0")
+        self.assertEqual(len(self.test_db._data), 2)
+
+    def test_nothing_is_read_at_startup(self):
+        """
+        Verify that with an up-to-date index, startup reads neither the data
+        file nor the per-user indexes, and that changes made before they are
+        first used are still reflected in them
+        """
+        self.assertIsNone(self.test_db._source)
+        self.assertEqual(self.test_db._floots_by_user, {})
+
+        self.test_db.delete_floot_by_id(self.floots[1].get_id())
+        new = Floot("New #Tag", "Test User 1")
+        self.test_db.save_floot(new)
+        replacement = Floot("Replacement", "Test User 9", floot_id=self.floots[2].get_id())
+        self.test_db.save_floot(replacement)
+        self.assertEqual(self.test_db._floots_by_user, {})
+
+        for username, expected in [("Test User 1", [new]), ("Test User 2", []),
+                                   ("Test User 9", [replacement])]:
+            self.assertEqual([f.get_id() for f in self.test_db.get_floots_by_user(username)],
+                             [f.get_id() for f in expected])
+        self.assertEqual([f.get_id() for f in self.test_db.get_floots_by_tag("tag")],
+                         [new.get_id()])
+        self.assertIsNone(self.test_db._source)
+
+        comments = self.test_db.get_comments_by_user("Test User 1")
+        self.assertEqual([c.get_message() for _, c in comments], ["Comment 3", "Comment 0"])
+
+    def test_data_file_changed_before_first_read(self):
+        """
+        Verify that a data file replaced after a lazy load, before any floot
+        was built from it, is refused rather than read at the wrong positions
+        """
+        Database(self.db_path).save_floot(Floot("Elsewhere", "Test User 5"))
+        with self.assertRaises(ValueError):
+            self.test_db.get_floots()
+
+    def test_changes_to_unloaded_floots(self):
+        """
+        Verify that unloaded floots can be deleted and saved over, and are
+        written back out unchanged
+        """
+        self.test_db.delete_floot_by_id(self.floots[1].get_id())
+        replacement = Floot("Replacement", "Test User 2", floot_id=self.floots[2].get_id())
+        self.test_db.save_floot(replacement)
+        self.test_db.compact()
+
+        reloaded = Database(self.db_path)
+        self.assertEqual([f.get_id() for f in reloaded.get_floots()],
+                         [replacement.get_id(), self.floots[3].get_id(), self.floots[0].get_id()])
+        self.assertEqual(reloaded.get_floot_by_id(self.floots[3].get_id()).to_dictionary(),
+                         self.floots[3].to_dictionary())
+
+    def test_user_indexes_without_loading(self):
+        """
+        Verify that per-user queries work straight from the index file, and
+        only load the floots they return
+        """
+        floots = self.test_db.get_floots_by_user("Test User 2")
+        self.assertEqual([f.get_id() for f in floots], [self.floots[2].get_id()])
+        self.assertEqual(len(self.test_db._data), 1)
+
+        comments = self.test_db.get_comments_by_user("Test User 1")
+        self.assertEqual([c.get_message() for _, c in comments],
+                         ["Comment 3", "Comment 2", "Comment 1", "Comment 0"])
+
+    def test_comment_ids_are_per_floot(self):
+        """
+        Verify that comments with the same id on different floots are all
+        found by get_comments_by_user
+        """
+        floots = [Floot(f"Floot {i}", "Test User 2") for i in range(4, 6)]
+        for floot in floots:
+            floot.create_comment(FlootComment(floot.get_message(), "Test User 3",
+                                              comment_id="7"))
+            self.test_db.save_floot(floot)
+        for db in [self.test_db, Database(self.db_path, lazy=True)]:
+            comments = db.get_comments_by_user("Test User 3")
+            self.assertEqual([c.get_message() for _, c in comments], ["Floot 5", "Floot 4"])
+
+    def test_stale_index_is_ignored(self):
+        """
+        Verify that lazy loading still works if the index file is out of date
+        """
+        self.test_db.close()
+        db = Database(self.db_path, lazy=True)
+        self.assertIsNotNone(db._read_index())
+        stat = os.stat(self.db_path)
+        os.utime(self.db_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertIsNone(db._read_index())
+
+        self.test_db = Database(self.db_path, lazy=True)
+        self.assertEqual([f.get_id() for f in self.test_db.get_floots()],
+                         [f.get_id() for f in reversed(self.floots)])
+
+
+class TestLazyLoadBinary(TestLazyLoad):
+    db_path = TEST_BINARY_DB_PATH
+
+
+class TestAtomicWrites(unittest.TestCase):
+    def setUp(self):
+        remove_test_files()
+        self.test_db = Database(TEST_DB_PATH)
+        self.floot = Floot("Hello world!", "Test User 1")
+        self.test_db.save_floot(self.floot)
+
+    def tearDown(self):
+        remove_test_files()
+
+    def test_interrupted_write_keeps_old_file(self):
+        """
+        Verify that a write that dies before the new file is in place leaves
+        the old data file intact
+        """
+        def crash(*args):
+            raise OSError("Simulated crash")
+
+        real_replace = os.replace
+        os.replace = crash
+        try:
+            with self.assertRaises(OSError):
+                self.test_db.save_floot(Floot("Lost", "Test User 2"))
+        finally:
+            os.replace = real_replace
+
+        reloaded = Database(TEST_DB_PATH, verify_checksum=True)
+        self.assertEqual([f.get_id() for f in reloaded.get_floots()], [self.floot.get_id()])
+
+    def test_checksum_mismatch(self):
+        """
+        Verify that verify_checksum=True catches a data file that was changed
+        or cut short behind the database's back
+        """
+        for path in [TEST_DB_PATH, TEST_BINARY_DB_PATH]:
+            Database(path).save_floot(self.floot)
+            with open(path, "rb") as f:
+                data = f.read()
+            for changed in [data.replace(b"Hello world!", b"Hello World!"),
+                            data[:len(data) // 2]]:
+                with open(path, "wb") as f:
+                    f.write(changed)
+                for lazy in [False, True]:
+                    with self.assertRaises(ValueError, msg=(path, lazy)) as caught:
+                        Database(path, lazy=lazy, verify_checksum=True)
+                    self.assertIn("checksum", str(caught.exception))
+            # Without verification, the changed file is loaded as is
+            with open(path, "wb") as f:
+                f.write(data.replace(b"Hello world!", b"Hello World!"))
+            self.assertEqual(Database(path).get_floot_by_id(self.floot.get_id()).get_message(),
+                             "Hello World!")
+
+
+class TestOrderIndex(unittest.TestCase):
+    db_path = TEST_DB_PATH
+
+    def setUp(self):
+        remove_test_files()
+        self.test_db = Database(self.db_path)
+        self.floots = [Floot(f"Floot {i}", "Test User 1") for i in range(5)]
+        for i, floot in enumerate(self.floots):
+            floot._timestamp -= (len(self.floots) - i) * MINUTE
+        # Save out of order, to make sure the database doesn't rely on
+        # insertion order
+        for floot in reversed(self.floots):
+            self.test_db.save_floot(floot)
+
+    def tearDown(self):
+        self.test_db.close()
+        remove_test_files()
+
+    def test_get_floots_newest_first(self):
+        """
+        Verify that get_floots returns the newest `count` floots, newest first
+        """
+        newest = [f.get_id() for f in reversed(self.floots)]
+        self.assertEqual([f.get_id() for f in self.test_db.get_floots()], newest)
+        self.assertEqual([f.get_id() for f in self.test_db.get_floots(2)], newest[:2])
+        self.assertEqual(self.test_db.get_floots(0), [])
+
+    def test_index_follows_deletes_and_reloads(self):
+        """
+        Verify that the ordering survives deleting floots and reloading
+        """
+        self.test_db.delete_floot(self.floots[-1])
+        self.test_db.save_floot(self.floots[0])
+        expected = [f.get_id() for f in reversed(self.floots[:-1])]
+        self.assertEqual([f.get_id() for f in self.test_db.get_floots()], expected)
+        self.assertEqual([f.get_id() for f in Database(self.db_path).get_floots()], expected)
+
+
+class TestOrderIndexSQLite(TestOrderIndex):
+    db_path = TEST_SQLITE_DB_PATH
+
+
+class TestOrderIndexBinary(TestOrderIndex):
+    db_path = TEST_BINARY_DB_PATH
+
+
+class TestBulk(unittest.TestCase):
+    db_path = TEST_DB_PATH
+
+    def setUp(self):
+        remove_test_files()
+        # Whole minutes apart, since NDJSON keeps timestamps to the second
+        self.floots = [Floot(f"Floot {i}", f"Test User {i % 2}", [f"Test User {(i + 1) % 2}"],
+                             timestamp=datetime(2020, 1, 1, 12, i),
+                             comments=[FlootComment(f"Comment {i}", "Test User 2")])
+                       for i in range(6)]
+
+    def tearDown(self):
+        remove_test_files()
+
+    def export(self, db, keep=None):
+        out = io.StringIO()
+        bulk.export_floots(db, out, keep)
+        return out.getvalue().splitlines()
+
+    def test_round_trip(self):
+        """
+        Verify that exported floots import into a new database unchanged, and
+        that save_floots writes them to disk
+        """
+        db = Database(self.db_path)
+        db.save_floots(reversed(self.floots))
+        lines = self.export(db)
+        db.close()
+        self.assertEqual(lines, [json.dumps(f.to_dictionary()) for f in self.floots])
+
+        remove_test_files()
+        db = Database(self.db_path)
+        self.assertEqual(bulk.import_floots(db, lines), len(self.floots))
+        db.close()
+        expected = [f.to_dictionary() for f in reversed(self.floots)]
+        self.assertEqual([f.to_dictionary() for f in Database(self.db_path).get_floots()], expected)
+
+    def test_filters(self):
+        """
+        Verify that floots can be picked by time range and user
+        """
+        db = Database(self.db_path)
+        db.save_floots(self.floots)
+        keep = bulk.floot_filter(since=self.floots[1].get_timestamp_micros(),
+                                 until=self.floots[5].get_timestamp_micros(),
+                                 users=["Test User 1"])
+        expected = [json.dumps(self.floots[i].to_dictionary()) for i in [1, 3]]
+        self.assertEqual(self.export(db, keep), expected)
+        db.close()
+
+        remove_test_files()
+        db = Database(self.db_path)
+        lines = [json.dumps(f.to_dictionary()) for f in self.floots]
+        self.assertEqual(bulk.import_floots(db, lines, keep), 2)
+        self.assertEqual(self.export(db), expected)
+        db.close()
+
+    def test_bad_line_saves_nothing(self):
+        """
+        Verify that an import with a malformed line saves none of the floots
+        """
+        db = Database(self.db_path)
+        lines = [json.dumps(self.floots[0].to_dictionary()), "", "{\"message\": \"oops\"}"]
+        with self.assertRaisesRegex(ValueError, "Line 3"):
+            bulk.import_floots(db, lines)
+        self.assertEqual(db.get_floots(), [])
+        db.close()
+
+    def test_replaces_existing_floots(self):
+        """
+        Verify that importing a floot that is already saved replaces it, even
+        if the old version is still in the journal
+        """
+        if self.db_path != TEST_DB_PATH:
+            self.skipTest("no journal")
+        db = Database(self.db_path, journal=True)
+        db.save_floot(self.floots[0])
+        changed = Floot.from_dictionary(self.floots[0].to_dictionary())
+        changed.set_liked("Test User 3", True)
+        db.save_floots([changed, self.floots[1]])
+        self.assertEqual(db.get_floot_by_id(changed.get_id()).get_liked_by(),
+                         ["Test User 1", "Test User 3"])
+        self.assertEqual(os.path.getsize(TEST_DB_PATH + ".log"), 0)
+        # Reload without closing, as if the server had crashed
+        reloaded = Database(self.db_path, journal=True)
+        self.assertEqual([f.to_dictionary() for f in reloaded.get_floots()],
+                         [self.floots[1].to_dictionary(), changed.to_dictionary()])
+        reloaded.close()
+        db.close()
+
+    def test_journal_left_behind(self):
+        """
+        Verify that export and import see the changes in a journal the server
+        left behind, and that an import folds them in rather than leaving the
+        journal to be replayed over the imported floots
+        """
+        if self.db_path != TEST_DB_PATH:
+            self.skipTest("no journal")
+        server = Database(self.db_path, journal=True)
+        for floot in self.floots[:2]:
+            server.save_floot(floot)
+        # Stop without compacting, as if the server had crashed
+        server._log_file.close()
+        server._log_file = None
+        self.assertEqual(self.export(Database(self.db_path)),
+                         [json.dumps(f.to_dictionary()) for f in self.floots[:2]])
+
+        changed = Floot.from_dictionary(self.floots[0].to_dictionary())
+        changed.set_liked("Test User 3", True)
+        bulk.import_floots(Database(self.db_path), [json.dumps(changed.to_dictionary())])
+        self.assertFalse(os.path.exists(self.db_path + ".log"))
+        server = Database(self.db_path, journal=True)
+        self.assertEqual([f.to_dictionary() for f in server.get_floots()],
+                         [self.floots[1].to_dictionary(), changed.to_dictionary()])
+        server.close()
+
+    def test_parse_time(self):
+        """
+        Verify that --since and --until take times with or without a time zone
+        """
+        self.assertEqual(bulk.parse_time("2020-01-31T12:00:00"),
+                         timestamps.from_datetime(datetime(2020, 1, 31, 12)))
+        utc = datetime(2020, 1, 31, 12, tzinfo=timezone.utc)
+        self.assertEqual(bulk.parse_time("2020-01-31T12:00:00+00:00"),
+                         timestamps.from_datetime(utc.astimezone().replace(tzinfo=None)))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            bulk.parse_time("yesterday")
+
+
+class TestBulkSQLite(TestBulk):
+    db_path = TEST_SQLITE_DB_PATH
+
+
+class TestBulkBinary(TestBulk):
+    db_path = TEST_BINARY_DB_PATH
+
+
+class TestSearch(unittest.TestCase):
+    db_path = TEST_DB_PATH
+
+    def setUp(self):
+        remove_test_files()
+        self.floots = [Floot(f"Floot number {i}", "Test User 1",
+                             timestamp=datetime(2020, 1, 1, 12, i)) for i in range(10)]
+        self.floots[3].create_comment(FlootComment("A rare comment", "Test User 2"))
+
+    def tearDown(self):
+        remove_test_files()
+
+    def found(self, db, query):
+        return [f.get_id() for f in db.search(query)]
+
+    def test_ranking(self):
+        """
+        Verify that rarer words count for more, then newer floots come first
+        """
+        index = SearchIndex.build((i, i, document_terms(message, []))
+                                  for i, message in enumerate(["common", "common rare", "common"]))
+        self.assertEqual(index.search("common"), [2, 1, 0])
+        self.assertEqual(index.search("common rar*"), [1])
+        self.assertEqual(index.search("common", 2), [2, 1])
+        index.add(3, 3, document_terms("rare rare", []))
+        self.assertEqual(index.search("rare"), [3, 1])
+        index.remove(3)
+        index.remove(1)
+        self.assertEqual(index.search("rare"), [])
+        self.assertEqual(index._terms, ["common"])
+
+    def test_prefixes(self):
+        """
+        Verify that a prefix matches exactly the words that start with it, and
+        that ties between ids of different types are broken without comparing
+        the ids
+        """
+        words = ["a", "ab", "abc", "abz", "ab\u00e9", "ac", "b"]
+        index = SearchIndex.build((word, 0, document_terms(word, [])) for word in words)
+        self.assertEqual(index._expand("ab", True), ["ab", "abc", "abz", "ab\u00e9"])
+        self.assertEqual(sorted(index.search("ab*")), sorted(["ab", "abc", "abz", "ab\u00e9"]))
+        self.assertEqual(index.search("abd*"), [])
+
+        index = SearchIndex.build([(1, 5, document_terms("same", [])),
+                                   ("x", 5, document_terms("same", [])),
+                                   (2, 6, document_terms("same", []))])
+        self.assertEqual(index.search("same", 2), [2, 1])
+        self.assertEqual(index.search("sa*", 3), index.search("same"))
+
+    def test_saved_search_index(self):
+        """
+        Verify that the search index is saved with the data file and read back
+        without building the floots that don't match
+        """
+        db = Database(self.db_path)
+        db.save_floots(self.floots)
+        self.assertEqual(self.found(db, "rare"), [self.floots[3].get_id()])
+        db.save_floot(self.floots[0])
+        db.close()
+        self.assertTrue(os.path.exists(self.db_path + ".search"))
+
+        db = Database(self.db_path, lazy=True)
+        self.assertEqual(self.found(db, "rare"), [self.floots[3].get_id()])
+        self.assertEqual(len(db._data), 1)
+        self.assertEqual(self.found(db, "floot 5"), [self.floots[5].get_id()])
+
+    def test_changes_before_first_search(self):
+        """
+        Verify that changes made before the saved search index is read
+        (including ones replayed from the journal) show up in searches
+        """
+        db = Database(self.db_path, journal=True)
+        db.save_floots(self.floots)
+        db.search("floot")
+        db.close()
+
+        db = Database(self.db_path, journal=True)
+        db.delete_floot(self.floots[3])
+        db.save_floot(Floot("Another rare floot", "Test User 2"))
+        # Reload without closing, so that the changes come from the journal
+        reloaded = Database(self.db_path, journal=True, lazy=True)
+        self.assertEqual([f.get_message() for f in reloaded.search("rare")],
+                         ["Another rare floot"])
+        reloaded.close()
+        db.close()
+
+        # Writing the data file before anyone searches keeps the saved index
+        # up to date too.
+        db = Database(self.db_path)
+        db.save_floot(Floot("Yet another rare floot", "Test User 2"))
+        self.assertEqual(len(Database(self.db_path).search("rare")), 2)
+
+
+class TestSearchBinary(TestSearch):
+    db_path = TEST_BINARY_DB_PATH
+
+
+class TestTags(unittest.TestCase):
+    db_path = TEST_DB_PATH
+
+    def setUp(self):
+        remove_test_files()
+        self.floots = [Floot("#Flutterer says hi to @Jerry", "Test User 1"),
+                       Floot("More #flutterer, less #work", "Test User 2"),
+                       Floot("Nothing to see here", "Test User 1")]
+        self.floots[0]._timestamp -= 5 * MINUTE
+
+    def tearDown(self):
+        remove_test_files()
+
+    def test_extract_tags(self):
+        self.assertEqual(extract_tags("#A #b, #a! a#c x@y.z (@Jerry) @Jerry #é"),
+                         (["a", "b", "é"], ["Jerry"]))
+
+    def test_trending_counter(self):
+        """
+        Verify that counts fall out of the window as time passes, a bucket at
+        a time, and can be taken back
+        """
+        counter = TrendingCounter(10, 3)
+        for timestamp, key in [(0, "a"), (5, "b"), (12, "a"), (25, "b"), (29, "c")]:
+            counter.add(key, timestamp)
+        self.assertEqual(counter.top(10, 29), [("a", 2), ("b", 2), ("c", 1)])
+        self.assertEqual(counter.top(1, 30), [("a", 1)])
+        counter.add("c", 29, -1)
+        # Already out of the window
+        counter.add("a", 5)
+        self.assertEqual(counter.top(10, 35), [("a", 1), ("b", 1)])
+        self.assertEqual(counter.top(10, 40), [("b", 1)])
+        self.assertEqual(counter.top(10, 1000), [])
+
+    def test_tags_survive_reloads(self):
+        """
+        Verify that hashtags and mentions are found again however the data
+        file is loaded, and follow floots being replaced and deleted
+        """
+        def check(db, tagged, trending):
+            self.assertEqual([f.get_id() for f in db.get_floots_by_tag("#FLUTTERER")],
+                             [f.get_id() for f in tagged])
+            self.assertEqual([f.get_id() for f in db.get_floots_mentioning("Jerry")],
+                             [self.floots[0].get_id()])
+            self.assertEqual(db.get_trending_tags(), trending)
+
+        db = Database(self.db_path)
+        db.save_floots(self.floots)
+        trending = [("flutterer", 2), ("work", 1)]
+        check(db, self.floots[1::-1], trending)
+        for lazy in [False, True]:
+            check(Database(self.db_path, lazy=lazy), self.floots[1::-1], trending)
+        if os.path.exists(self.db_path + ".idx"):
+            # Without an index, a lazy load has to find them in the data file
+            os.unlink(self.db_path + ".idx")
+            check(Database(self.db_path, lazy=True), self.floots[1::-1], trending)
+
+        db.save_floot(Floot("No more #work", "Test User 2", floot_id=self.floots[1].get_id(),
+                            timestamp=self.floots[1].get_timestamp_micros()))
+        db.delete_floot(self.floots[2])
+        check(Database(self.db_path, lazy=True), self.floots[:1],
+              [("flutterer", 1), ("work", 1)])
+
+
+class TestTagsSQLite(TestTags):
+    db_path = TEST_SQLITE_DB_PATH
+
+
+class TestTagsBinary(TestTags):
+    db_path = TEST_BINARY_DB_PATH
+
+
+class TestSQLite(unittest.TestCase):
+    def setUp(self):
+        remove_test_files()
+
+    def tearDown(self):
+        remove_test_files()
+
+    def test_comment_ids_are_per_floot(self):
+        """
+        Verify that two floots may have comments with the same id, as in the
+        JSON file
+        """
+        floots = [Floot(f"Floot {i}", "Test User 1") for i in range(3)]
+        for floot in floots:
+            floot.create_comment(FlootComment(floot.get_message(), "Test User 2",
+                                              comment_id="7"))
+        db = Database(TEST_SQLITE_DB_PATH)
+        db.save_floot(floots[0])
+        db.save_floots(floots)
+        for floot in floots:
+            self.assertEqual(db.get_floot_by_id(floot.get_id()).to_dictionary(),
+                             floot.to_dictionary())
+        self.assertEqual(len(db.get_comments_by_user("Test User 2")), len(floots))
+        db.close()
+
+    def test_options_are_not_dropped(self):
+        """
+        Verify that options a SQLite database doesn't have are refused rather
+        than ignored
+        """
+        for options in [{"compact_interval": 60}, {"lazy": True, "verify_checksum": True},
+                        {"journal": True, "flush_interval": 1, "flush_threshold": 10}]:
+            with self.assertRaisesRegex(TypeError, "compact_interval|verify_checksum|flush_"):
+                Database(TEST_SQLITE_DB_PATH, **options)
+        with self.assertRaises(TypeError):
+            Database(TEST_SQLITE_DB_PATH, True, 60)
+        Database(TEST_SQLITE_DB_PATH, journal=True, lazy=True).close()
+
+    def test_without_fts5(self):
+        """
+        Verify that opening a database with a SQLite library that has no
+        full-text search says so
+        """
+        with mock.patch("sqlite_database.SQLiteDatabase._has_fts5", return_value=False):
+            with self.assertRaisesRegex(sqlite3.NotSupportedError, "FTS5"):
+                Database(TEST_SQLITE_DB_PATH)
+
+
+class TestBinaryFormat(unittest.TestCase):
+    def setUp(self):
+        remove_test_files()
+
+    def tearDown(self):
+        remove_test_files()
+
+    def test_round_trip(self):
+        """
+        Verify that floots survive being written to and read from the binary
+        format, including ids that aren't UUIDs
+        """
+        db = Database(TEST_BINARY_DB_PATH)
+        floots = [Floot("Hello world!", "Test User 1", ["Test User 2", "Test User 3"]),
+                  Floot("Héllo wörld 🌍", "Test User 2", floot_id="11")]
+        floots[0].create_comment(FlootComment("Comment", "Test User 3"))
+        floots[1].create_comment(FlootComment("Comment", "Test User 1", comment_id="7"))
+        floots[1]._timestamp += 123456 - floots[1]._timestamp % 1_000_000
+        for floot in floots:
+            db.save_floot(floot)
+
+        with open(TEST_BINARY_DB_PATH, "rb") as f:
+            self.assertTrue(f.read().startswith(b"FLOOTS"))
+        for lazy in [False, True]:
+            reloaded = Database(TEST_BINARY_DB_PATH, lazy=lazy)
+            for floot in floots:
+                reloaded_floot = reloaded.get_floot_by_id(floot.get_id())
+                self.assertEqual(reloaded_floot.to_dictionary(), floot.to_dictionary())
+                self.assertEqual(reloaded_floot.get_timestamp_raw(), floot.get_timestamp_raw())
+
+    def test_existing_file_keeps_its_format(self):
+        """
+        Verify that a binary data file is read (and written back) as binary,
+        whatever its name
+        """
+        db = Database(TEST_BINARY_DB_PATH)
+        db.save_floot(Floot("Hello world!", "Test User 1"))
+        os.rename(TEST_BINARY_DB_PATH, TEST_DB_PATH)
+
+        db = Database(TEST_DB_PATH)
+        db.save_floot(Floot("Hello again!", "Test User 1"))
+        with open(TEST_DB_PATH, "rb") as f:
+            self.assertTrue(f.read().startswith(b"FLOOTS"))
+        self.assertEqual(len(Database(TEST_DB_PATH).get_floots()), 2)
+
+    def test_ids_keep_their_exact_form(self):
+        """
+        Verify that ids that look like UUIDs but aren't written the usual way
+        come back exactly as they were, in both formats and lazily or not
+        """
+        floot = Floot("Hello world!", "Test User 1",
+                      floot_id="5E074ADD-628D-4CF1-AF37-D090F485DF67")
+        floot.create_comment(FlootComment("Comment", "Test User 2", comment_id="{7}"))
+        for path in [TEST_DB_PATH, TEST_BINARY_DB_PATH]:
+            Database(path).save_floot(floot)
+            for lazy in [False, True]:
+                reloaded = Database(path, lazy=lazy).get_floot_by_id(floot.get_id())
+                self.assertEqual(reloaded.to_dictionary(), floot.to_dictionary())
+        self.assertFalse(Database(TEST_DB_PATH).has_floot(floot.get_id().lower()))
+
+
+class TestTimestamps(unittest.TestCase):
+    def setUp(self):
+        remove_test_files()
+
+    def tearDown(self):
+        remove_test_files()
+
+    def test_legacy_timestamps(self):
+        """
+        Verify that timestamps in data.json's format are read correctly,
+        including ones laid out a little differently than strftime would
+        """
+        for text, expected in [("Tue Nov 19 01:50:50 2019", datetime(2019, 11, 19, 1, 50, 50)),
+                               ("Tue Nov 5 01:50:50 2019", datetime(2019, 11, 5, 1, 50, 50))]:
+            floot = Floot("Hello world!", "Test User 1", timestamp=text)
+            self.assertEqual(floot.get_timestamp_raw(), expected)
+            self.assertEqual(floot.get_timestamp(), expected.strftime(Floot.DATE_FORMAT))
+
+        # The data.json that ships with the server loads the same either way
+        data_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data.json")
+        with open(data_path) as f:
+            expected = {floot_id: floot_dict[Floot.TIMESTAMP]
+                        for floot_id, floot_dict in json.load(f).items()}
+        shutil.copyfile(data_path, TEST_DB_PATH)
+        for lazy in [False, True]:
+            floots = Database(TEST_DB_PATH, lazy=lazy).get_floots()
+            self.assertEqual({f.get_id(): f.get_timestamp() for f in floots}, expected)
+
+    def test_order_within_a_second(self):
+        """
+        Verify that floots posted within the same second are ordered by when
+        they were posted, not by id, including after the database is reopened
+        from its data file or its journal
+        """
+        start = 1_700_000_000 * 1_000_000
+        floots = [Floot(f"Floot {i}", "Test User 1", floot_id=str(9 - i), timestamp=start + i)
+                  for i in range(3)]
+        expected = [f.get_id() for f in reversed(floots)]
+        for path in [TEST_DB_PATH, TEST_BINARY_DB_PATH]:
+            db = Database(path, journal=True)
+            for floot in floots:
+                db.save_floot(floot)
+            self.assertEqual([f.get_id() for f in db.get_floots()], expected)
+            # Reopen with the floots only in the journal, and then with them
+            # only in the data file
+            db._log_file.close()
+            db._log_file = None
+            db = Database(path, journal=True)
+            self.assertEqual([f.get_id() for f in db.get_floots()], expected, path)
+            db.close()
+            for lazy in [False, True]:
+                reloaded = Database(path, lazy=lazy)
+                self.assertEqual([f.get_id() for f in reloaded.get_floots()], expected, path)
+                cursor = reloaded.get_cursor(reloaded.get_floots(1)[0])
+                self.assertEqual([f.get_id() for f in reloaded.get_floots(before=cursor)],
+                                 expected[1:])
+                self.assertEqual([f.get_timestamp_micros() for f in reloaded.get_floots()],
+                                 [f.get_timestamp_micros() for f in reversed(floots)])
+
+
+class TestConcurrency(unittest.TestCase):
+    THREADS = 4
+    ROUNDS = 200
+
+    def setUp(self):
+        remove_test_files()
+        db = Database(TEST_DB_PATH)
+        for i in range(50):
+            floot = Floot(f"Floot {i}", f"Test User {i % 5}")
+            floot._timestamp -= (50 - i) * MINUTE
+            db.save_floot(floot)
+        self.test_db = Database(TEST_DB_PATH, journal=True, lazy=True, flush_interval=0.01)
+        self.errors = []
+
+    def tearDown(self):
+        self.test_db.close()
+        remove_test_files()
+
+    def run_threads(self, target, count):
+        def run(number):
+            try:
+                target(number)
+            except Exception as e:
+                self.errors.append(e)
+        return [threading.Thread(target=run, args=(number,)) for number in range(count)]
+
+    def write(self, number):
+        rng = random.Random(number)
+        username = f"Writer {number}"
+        mine = []
+        for _ in range(self.ROUNDS):
+            action = rng.random()
+            if action < 0.4 or not mine:
+                floot = Floot("Stress test", username)
+                self.test_db.save_floot(floot)
+                mine.append(floot.get_id())
+            elif action < 0.6:
+                self.test_db.delete_floot_by_id(mine.pop(rng.randrange(len(mine))))
+            else:
+                # Only the floots from setUp are commented on and liked, since
+                # saving a floot that someone just deleted would bring it back.
+                floot = rng.choice(self.test_db.get_floots_by_user(f"Test User {rng.randrange(5)}"))
+                if action < 0.8:
+                    floot.create_comment(FlootComment("Stress comment", username))
+                else:
+                    floot.set_liked(username, action < 0.9)
+                self.test_db.save_floot(floot)
+        self.survivors[number] = mine
+
+    def read(self, number):
+        while not self.done.is_set():
+            page = self.test_db.get_floots(10)
+            while page:
+                keys = [(f.get_timestamp_micros(), f.get_id()) for f in page]
+                self.assertEqual(keys, sorted(keys, reverse=True))
+                for floot in page:
+                    floot.to_dictionary()
+                page = self.test_db.get_floots(10, before=self.test_db.get_cursor(page[-1]))
+            self.test_db.get_floots_by_user(f"Writer {number}")
+            self.test_db.get_floots_liked_by(f"Writer {number}")
+            for floot, comment in self.test_db.get_comments_by_user(f"Writer {number}"):
+                self.assertEqual(comment.get_author(), f"Writer {number}")
+
+    def test_concurrent_reads_and_writes(self):
+        """
+        Verify that the database stays consistent while many threads read and
+        write at once
+        """
+        self.survivors = {}
+        self.done = threading.Event()
+        readers = self.run_threads(self.read, self.THREADS)
+        writers = self.run_threads(self.write, self.THREADS)
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        self.done.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual(self.errors, [])
+
+        db = self.test_db
+        floot_ids = db._all_floot_ids()
+        self.assertEqual(len(floot_ids), len(set(floot_ids)))
+        self.assertEqual(db._order, sorted(db._stored_order_key(f) for f in floot_ids))
+        for number, mine in self.survivors.items():
+            self.assertEqual(sorted(f.get_id() for f in db.get_floots_by_user(f"Writer {number}")),
+                             sorted(mine))
+
+        # Everything made it to disk, and the per-user indexes match what
+        # indexing the data from scratch gives.
+        expected = {f.get_id(): f.to_dictionary() for f in db.get_floots()}
+        db.close()
+        for lazy in [False, True]:
+            reloaded = Database(TEST_DB_PATH, lazy=lazy)
+            self.assertEqual({f.get_id(): f.to_dictionary() for f in reloaded.get_floots()},
+                             expected)
+            # A lazy load only fills in the per-user indexes when first used
+            reloaded.get_floots_by_user("Writer 0")
+            self.assertEqual(reloaded._floots_by_user, db._floots_by_user)
+            self.assertEqual(reloaded._comments_by_user, db._comments_by_user)
+            self.assertEqual(reloaded._likes_by_user, db._likes_by_user)
+
+    def test_concurrent_saves_are_journaled_in_order(self):
+        """
+        Verify that when two threads like the same floot at once, the journal
+        ends up describing the floot as it is in memory, so that a restart
+        without compacting the journal first loses neither like
+        """
+        self.test_db.close()
+        for write_behind in [False, True]:
+            db = Database(TEST_DB_PATH, journal=True, flush_interval=60 if write_behind else None)
+            floot = db.get_floots()[0]
+
+            def like(username):
+                floot.set_liked(username, True)
+                db.save_floot(floot)
+            second_saved = threading.Event()
+            first = threading.Thread(target=like, args=("First",))
+            second = threading.Thread(target=lambda: (like("Second"), second_saved.set()))
+
+            def hold_up_first():
+                # Lets the second save go all the way through while the first
+                # is about to take the first lock on its way to the journal
+                if threading.current_thread() is first:
+                    second.start()
+                    second_saved.wait(5)
+            if write_behind:
+                real_writing = db._lock.writing
+                @contextlib.contextmanager
+                def writing():
+                    hold_up_first()
+                    with real_writing():
+                        yield
+                db._lock.writing = writing
+            else:
+                real_io_lock = db._io_lock
+                class HeldUpLock:
+                    def __enter__(self):
+                        hold_up_first()
+                        return real_io_lock.__enter__()
+                    def __exit__(self, *args):
+                        return real_io_lock.__exit__(*args)
+                db._io_lock = HeldUpLock()
+
+            first.start()
+            first.join()
+            second.join()
+            db.flush()
+            self.assertEqual(floot.get_liked_by(), ["First", "Second"])
+
+            # Reopen while the journal still holds both changes
+            reopened = Database(TEST_DB_PATH, journal=True)
+            self.assertEqual(reopened.get_floot_by_id(floot.get_id()).get_liked_by(),
+                             ["First", "Second"])
+            reopened._log_file.close()
+            reopened._log_file = None
+            db.close()
+        self.test_db = Database(TEST_DB_PATH)
+
+    def test_read_write_lock(self):
+        """
+        Verify that readers share the lock, and that a waiting writer keeps new
+        readers out, but not a thread that is already reading
+        """
+        lock = ReadWriteLock()
+        events = []
+        def read():
+            with lock.reading():
+                events.append("read")
+        def write():
+            with lock.writing():
+                events.append("write")
+
+        with lock.reading():
+            reader = threading.Thread(target=read)
+            reader.start()
+            reader.join(1)
+            self.assertEqual(events, ["read"])
+
+            writer = threading.Thread(target=write)
+            writer.start()
+            time.sleep(0.05)
+            late_reader = threading.Thread(target=read)
+            late_reader.start()
+            time.sleep(0.05)
+            self.assertEqual(events, ["read"])
+            with lock.reading():
+                pass
+        writer.join(1)
+        late_reader.join(1)
+        self.assertEqual(events, ["read", "write", "read"])
+
+
+if __name__ == "__main__":
+    unittest.main()
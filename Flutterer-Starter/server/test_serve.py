@@ -0,0 +1,522 @@
+"""
+This file contains test cases for the server side of Flutterer: serve.py, the
+routes in router.py, the static files in static.py, and the asyncio server in
+async_serve.py. You don't need to understand or change any of the code here.
+"""
+import gzip
+import http.client
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import api
+import async_serve
+from database import Database
+from floot import Floot
+from error import HTTPError
+from router import Router
+from static import StaticFiles
+import serve
+
+TEST_DB_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                            "test_serve.json")
+
+def remove_test_files():
+    for suffix in ["", ".log", ".idx", ".search", ".users"]:
+        if os.path.exists(TEST_DB_PATH + suffix):
+            os.unlink(TEST_DB_PATH + suffix)
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Sets up a database with two floots for the server to serve.
+    """
+    def setUp(self):
+        remove_test_files()
+        self.test_db = Database(TEST_DB_PATH)
+        self.floots = [Floot("Hello world!", "Test User 1"),
+                       Floot("Hello world again!", "Test User 2")]
+        self.floots[0]._timestamp -= 5 * 60 * 1_000_000
+        self.test_db.save_floots(self.floots)
+        api.db = self.test_db
+
+    def tearDown(self):
+        self.test_db.close()
+        remove_test_files()
+
+
+class TestServe(ServerTestCase):
+    def test_service_request(self):
+        """
+        Verify that serve.py leaves the query string out of matching routes
+        and passes it on as parameters
+        """
+        output = serve.service_request("GET", "/api/search?q=hello&limit=1&unknown=2")
+        self.assertEqual(len(json.loads(output.get_body())), 1)
+        output = serve.service_request("GET", "/api/floots/" + self.floots[0].get_id())
+        self.assertEqual(json.loads(output.get_body())["id"], self.floots[0].get_id())
+        for method, target, status in [("GET", "/api/floots/missing", 404),
+                                       ("POST", "/api/nothing", 404),
+                                       ("PUT", "/api/floots", 501)]:
+            with self.assertRaises(HTTPError) as caught:
+                serve.service_request(method, target)
+            self.assertEqual(caught.exception.status, status)
+
+    def test_keep_alive(self):
+        """
+        Verify that serve.py answers several requests over one connection,
+        including errors, and closes it after max_requests of them
+        """
+        class Handler(serve.FluttererHandler):
+            max_requests = 5
+        server = serve.PooledHTTPServer(("127.0.0.1", 0), Handler, workers=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        try:
+            with mock.patch.object(serve, "flutterer_print"):
+                requests = [("GET", "/api/floots", None, {}, 200),
+                            ("GET", "/api/floots/missing", None, {}, 404),
+                            ("POST", "/api/floots", "{}", {"Content-Type": "text/plain"}, 400),
+                            ("GET", "/api/floots", None, {}, 200),
+                            ("GET", "/api/floots", None, {}, 200)]
+                sock = None
+                for i, (method, target, body, headers, status) in enumerate(requests):
+                    conn.request(method, target, body, headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                    self.assertEqual(response.status, status)
+                    self.assertEqual(int(response.getheader("Content-Length")), len(data))
+                    if i < len(requests) - 1:
+                        self.assertIsNone(response.getheader("Connection"))
+                        self.assertTrue(sock is None or conn.sock is sock)
+                        sock = conn.sock
+                    else:
+                        self.assertEqual(response.getheader("Connection"), "close")
+                        self.assertIsNone(conn.sock)
+        finally:
+            conn.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_keep_alive_leaves_workers_free(self):
+        """
+        Verify that connections kept open by one client don't hold every
+        worker, so that another client is answered right away
+        """
+        server = serve.PooledHTTPServer(("127.0.0.1", 0), serve.FluttererHandler, workers=4)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        port = server.server_address[1]
+        idle = [http.client.HTTPConnection("127.0.0.1", port, timeout=5) for _ in range(4)]
+        other = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            with mock.patch.object(serve, "flutterer_print"):
+                kept_open = 0
+                for conn in idle:
+                    conn.request("GET", "/api/floots")
+                    response = conn.getresponse()
+                    response.read()
+                    self.assertEqual(response.status, 200)
+                    kept_open += response.getheader("Connection") is None
+                self.assertEqual(kept_open, 2)
+
+                start = time.monotonic()
+                other.request("GET", "/api/floots")
+                response = other.getresponse()
+                response.read()
+                self.assertEqual(response.status, 200)
+                self.assertLess(time.monotonic() - start, serve.KEEP_ALIVE_TIMEOUT / 2)
+        finally:
+            for conn in idle + [other]:
+                conn.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+class TestPooledHTTPServer(unittest.TestCase):
+    def setUp(self):
+        # Requests wait at self.gate once a worker has them, so that the tests
+        # can fill up the workers and the queue.
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+
+        class Handler(serve.FluttererHandler):
+            def do_GET(handler):
+                self.started.release()
+                self.gate.wait(5)
+                handler._send(200, "text/plain", handler.path.encode())
+
+        self.server = serve.PooledHTTPServer(("127.0.0.1", 0), Handler, workers=1,
+                                             queue_size=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.connections = []
+        patcher = mock.patch.object(serve, "flutterer_print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.gate.set()
+        for conn in self.connections:
+            conn.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def request(self, path):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1],
+                                          timeout=5)
+        self.connections.append(conn)
+        conn.request("GET", path)
+        return conn
+
+    def fill(self):
+        """
+        Sends one request that the worker takes, and one that waits in the
+        queue behind it.
+        """
+        running = self.request("/running")
+        self.assertTrue(self.started.acquire(timeout=5))
+        queued = self.request("/queued")
+        # Until the server has accepted it, the queued connection only waits
+        # in the listen backlog.
+        deadline = time.monotonic() + 5
+        while not self.server.has_waiting_connections() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertTrue(self.server.has_waiting_connections())
+        return running, queued
+
+    def check_response(self, conn, path):
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), path.encode())
+
+    def test_full_queue_gets_503(self):
+        """
+        Verify that a connection that finds every worker busy and the queue
+        full gets a 503 with Retry-After straight away, and that the queued
+        request is still answered
+        """
+        running, queued = self.fill()
+        start = time.monotonic()
+        response = self.request("/rejected").getresponse()
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.getheader("Retry-After"), str(serve.RETRY_AFTER))
+        self.assertEqual(response.getheader("Connection"), "close")
+        self.assertIn(b"too busy", response.read())
+        self.assertLess(time.monotonic() - start, 1)
+
+        self.gate.set()
+        self.check_response(running, "/running")
+        self.check_response(queued, "/queued")
+
+    def test_server_close_finishes_queued_requests(self):
+        """
+        Verify that server_close lets the workers answer every connection
+        that was already accepted, and then returns without waiting for
+        timeouts
+        """
+        running, queued = self.fill()
+        self.server.shutdown()
+        closer = threading.Thread(target=self.server.server_close)
+        closer.start()
+        self.gate.set()
+        self.check_response(running, "/running")
+        self.check_response(queued, "/queued")
+        closer.join(2)
+        self.assertFalse(closer.is_alive())
+        self.assertFalse(any(worker.is_alive() for worker in self.server._workers))
+
+
+def read_response(reader):
+    """
+    Reads one response from a file made with socket.makefile("rb"), and
+    returns (status, headers with lowercase names, body), or None if the
+    server closed the connection instead.
+    """
+    status_line = reader.readline()
+    if not status_line:
+        return None
+    headers = {}
+    for line in iter(reader.readline, b"\r\n"):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = reader.read(int(headers.get("content-length", 0)))
+    return int(status_line.split()[1]), headers, body
+
+
+class TestAsyncServer(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(serve, "flutterer_print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The server runs on an event loop in another thread, as it would in
+        # its own process.
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever)
+        self.loop_thread.start()
+        self.server = async_serve.AsyncFluttererServer(threads=2)
+        self.port = self.run_on_loop(self.server.start("127.0.0.1", 0))
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.run_on_loop(self.server.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        super().tearDown()
+
+    def run_on_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def connect(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.sockets.append(sock)
+        return sock, sock.makefile("rb")
+
+    @staticmethod
+    def get(path, headers=""):
+        return f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n".encode()
+
+    def test_pipelining_and_reuse(self):
+        """
+        Verify that requests sent together on one connection, including one
+        that fails, are answered in order, that the connection stays open
+        afterwards, and that Connection: close closes it
+        """
+        sock, reader = self.connect()
+        ids = [floot.get_id() for floot in self.floots]
+        sock.sendall(self.get("/api/floots/" + ids[0]) + self.get("/api/floots/missing")
+                     + self.get("/api/floots/" + ids[1]))
+        responses = [read_response(reader) for _ in range(3)]
+        self.assertEqual([status for status, _, _ in responses], [200, 404, 200])
+        self.assertEqual(json.loads(responses[0][2])["id"], ids[0])
+        self.assertEqual(json.loads(responses[2][2])["id"], ids[1])
+        for _, headers, _ in responses:
+            self.assertEqual(headers["connection"], "keep-alive")
+
+        sock.sendall(self.get("/api/floots"))
+        status, headers, body = read_response(reader)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)), 2)
+
+        sock.sendall(self.get("/api/floots", "Connection: close\r\n"))
+        status, headers, _ = read_response(reader)
+        self.assertEqual((status, headers["connection"]), (200, "close"))
+        self.assertIsNone(read_response(reader))
+
+    def test_handler_exception(self):
+        """
+        Verify that a route handler raising an exception gets a 500, and
+        leaves the connection usable
+        """
+        real_service_request = async_serve.service_request
+        def service_request(method, target, *args, **kwargs):
+            if target == "/boom":
+                raise RuntimeError("boom")
+            return real_service_request(method, target, *args, **kwargs)
+
+        sock, reader = self.connect()
+        with mock.patch.object(async_serve, "service_request", service_request), \
+                mock.patch.object(async_serve.traceback, "print_exc"):
+            sock.sendall(self.get("/boom") + self.get("/api/floots"))
+            status, headers, body = read_response(reader)
+            self.assertEqual(status, 500)
+            self.assertEqual(body, serve.INTERNAL_ERROR_BODY)
+            self.assertEqual(headers["connection"], "keep-alive")
+            self.assertEqual(read_response(reader)[0], 200)
+
+    def test_idle_timeout(self):
+        """
+        Verify that a connection that sends nothing for KEEP_ALIVE_TIMEOUT
+        seconds is closed, and that closing the server closes idle
+        connections without waiting for that
+        """
+        with mock.patch.object(async_serve, "KEEP_ALIVE_TIMEOUT", 0.2):
+            sock, reader = self.connect()
+            sock.sendall(self.get("/api/floots"))
+            self.assertEqual(read_response(reader)[0], 200)
+            start = time.monotonic()
+            self.assertIsNone(read_response(reader))
+            self.assertLess(time.monotonic() - start, 2)
+
+        sock, reader = self.connect()
+        sock.sendall(self.get("/api/floots"))
+        self.assertEqual(read_response(reader)[0], 200)
+        start = time.monotonic()
+        self.run_on_loop(self.server.close())
+        self.assertIsNone(read_response(reader))
+        self.assertLess(time.monotonic() - start, 2)
+
+
+class TestRoutes(unittest.TestCase):
+    def test_api_routes(self):
+        """
+        Verify that request paths find the right handler and arguments in the
+        compiled route tables
+        """
+        get, post = serve.ROUTERS["GET"], serve.ROUTERS["POST"]
+        for router, path, handler, args in [
+                (get, "/api/floots", api.get_floots, {}),
+                (get, "/api/floots/abc", api.get_floot, {"floot_id": "abc"}),
+                (get, "/api/floots/abc/comments", api.get_comments, {"floot_id": "abc"}),
+                (get, "/api/tags/trending", api.get_trending_tags, {}),
+                (get, "/api/tags/%23fun", api.get_tag_floots, {"tag": "%23fun"}),
+                (get, "/api/users/Jerry%20Cain/likes", api.get_user_likes,
+                 {"username": "Jerry%20Cain"}),
+                (get, "/", api.serve_file, {"path": "/"}),
+                (get, "/js/flutterer.js", api.serve_file, {"path": "/js/flutterer.js"}),
+                (get, "/api/nothing", api.serve_file, {"path": "/api/nothing"}),
+                (post, "/api/floots", api.create_floot, {}),
+                (post, "/api/floots/abc/like", api.like_floot, {"floot_id": "abc"}),
+                (post, "/api/floots/abc/delete", api.delete_floot, {"floot_id": "abc"}),
+                (post, "/api/floots/abc/comments/def/delete", api.delete_comment,
+                 {"floot_id": "abc", "comment_id": "def"})]:
+            self.assertEqual(router.find(path), (handler, args), path)
+        self.assertIsNone(post.find("/api/floots/abc/comments/def"))
+
+    def test_route_order(self):
+        """
+        Verify that the first matching route wins, whether it was compiled into
+        the tree or kept as a regular expression
+        """
+        def handler(name):
+            return lambda: name
+        router = Router([
+            (("/a/(.*?)/b", "x"), handler("middle")),
+            (("/a/(x|y)", "x"), handler("regex")),
+            ("/a/fixed", handler("fixed")),
+            (("/a/(.*)", "x"), handler("rest")),
+            (("(/.*)", "path"), handler("anything")),
+        ])
+        for path, name, args in [("/a/1/b", "middle", {"x": "1"}),
+                                 ("/a/x", "regex", {"x": "x"}),
+                                 ("/a/fixed", "fixed", {}),
+                                 ("/a/1/2", "rest", {"x": "1/2"}),
+                                 ("/a", "anything", {"path": "/a"})]:
+            found, found_args = router.find(path)
+            self.assertEqual((found(), found_args), (name, args), path)
+
+
+class TestStaticFiles(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, "client")
+        os.mkdir(self.root)
+        self.script = b"console.log('Hello world!');\n" * 100
+        self.image = bytes(range(256)) * 4
+        self.write_file("app.js", self.script)
+        self.write_file("avatar.png", self.image)
+        with open(os.path.join(self.temp_dir.name, "secret.txt"), "w") as f:
+            f.write("secret")
+        self.files = StaticFiles(self.root)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_file(self, name, data, mtime_ns=None):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_serve(self):
+        """
+        Verify that files are served with an ETag, and compressed when the
+        client accepts gzip and the file is worth compressing
+        """
+        response = self.files.serve("app.js", {})
+        self.assertEqual(response.get_status(), 200)
+        self.assertEqual(response.get_body_bytes(), self.script)
+        self.assertIn("javascript", response.get_content_type())
+        headers = response.get_headers()
+        self.assertEqual(headers["Cache-Control"], "no-cache")
+        self.assertEqual(headers["Vary"], "Accept-Encoding")
+        self.assertNotIn("Content-Encoding", headers)
+
+        compressed = self.files.serve("app.js", {"accept-encoding": "deflate, gzip, br"})
+        self.assertEqual(compressed.get_headers()["Content-Encoding"], "gzip")
+        self.assertLess(len(compressed.get_body_bytes()), len(self.script))
+        self.assertEqual(gzip.decompress(compressed.get_body_bytes()), self.script)
+        self.assertNotEqual(compressed.get_headers()["ETag"], headers["ETag"])
+        refused = self.files.serve("app.js", {"accept-encoding": "gzip;q=0"})
+        self.assertNotIn("Content-Encoding", refused.get_headers())
+
+        image = self.files.serve("avatar.png", {"accept-encoding": "gzip"})
+        self.assertEqual(image.get_body_bytes(), self.image)
+        self.assertEqual(image.get_content_type(), "image/png")
+        self.assertNotIn("Content-Encoding", image.get_headers())
+        self.assertNotIn("Vary", image.get_headers())
+
+        for path in ["missing.js", "../secret.txt", ""]:
+            self.assertIsInstance(self.files.serve(path, {}), HTTPError, path)
+
+    def test_not_modified(self):
+        """
+        Verify that a request with the file's ETag gets 304 Not Modified
+        """
+        etag = self.files.serve("app.js", {}).get_headers()["ETag"]
+        gzip_etag = self.files.serve("app.js", {"accept-encoding": "gzip"}).get_headers()["ETag"]
+        for if_none_match in [etag, gzip_etag, "W/" + etag, f'"other", {etag}', "*"]:
+            response = self.files.serve("app.js", {"if-none-match": if_none_match})
+            self.assertEqual(response.get_status(), 304, if_none_match)
+            self.assertEqual(response.get_body_bytes(), b"")
+            self.assertEqual(response.get_headers()["ETag"], etag)
+        response = self.files.serve("app.js", {"if-none-match": '"other"'})
+        self.assertEqual(response.get_status(), 200)
+
+    def test_aliases_share_one_copy(self):
+        """
+        Verify that different paths to the same file don't each keep a copy
+        of it in memory
+        """
+        os.mkdir(os.path.join(self.root, "js"))
+        self.write_file(os.path.join("js", "app.js"), self.script)
+        paths = ["js/app.js", "js/./app.js", "./js/app.js", "js//app.js", "js/../js/app.js"]
+        for path in paths:
+            self.assertEqual(self.files.serve(path, {}).get_body_bytes(), self.script, path)
+        self.assertEqual(len(self.files._files), 1)
+        self.assertEqual(len({id(self.files.get(path)) for path in paths}), 1)
+
+    def test_file_changes(self):
+        """
+        Verify that a file is read again when it changes on disk, and no
+        longer served once it is deleted
+        """
+        first = self.files.serve("app.js", {})
+        self.write_file("app.js", b"changed", mtime_ns=os.stat(
+                os.path.join(self.root, "app.js")).st_mtime_ns + 1_000_000_000)
+        second = self.files.serve("app.js", {"if-none-match": first.get_headers()["ETag"]})
+        self.assertEqual(second.get_status(), 200)
+        self.assertEqual(second.get_body_bytes(), b"changed")
+        self.assertNotEqual(second.get_headers()["ETag"], first.get_headers()["ETag"])
+        os.unlink(os.path.join(self.root, "app.js"))
+        self.assertIsInstance(self.files.serve("app.js", {}), HTTPError)
+
+    def test_serve_file_route(self):
+        """
+        Verify that serve.py passes request headers on to api.serve_file
+        """
+        response = serve.service_request("GET", "/", headers={"accept-encoding": "gzip"})
+        self.assertEqual(response.get_content_type(), "text/html")
+        etag = response.get_headers()["ETag"]
+        response = serve.service_request("GET", "/index.html", headers={"if-none-match": etag})
+        self.assertEqual(response.get_status(), 304)
+        with self.assertRaises(HTTPError):
+            serve.service_request("GET", "/missing.html", headers={})
+
+
+if __name__ == "__main__":
+    unittest.main()